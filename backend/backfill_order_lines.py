@@ -0,0 +1,43 @@
+"""
+Copy customer_id, date and status from orders onto their order lines
+
+Usage:
+    python backfill_order_lines.py                       # all orders
+    python backfill_order_lines.py --after <order_id>    # resume after an interrupted run
+
+New orders get these fields when they are created; this fills in lines
+written before that. Orders are processed in id order, one bulk write per
+batch, and re-running is harmless. The last order id of each batch is
+printed so an interrupted run can be resumed with --after.
+"""
+
+import argparse
+import asyncio
+
+from server import client, db
+from utils import BACKFILL_BATCH_SIZE, backfill_order_lines
+
+
+async def run_backfill(batch_size: int, after: str):
+    total = await db.orders.count_documents({"id": {"$gt": after}} if after else {})
+    print(f"🧾 Backfilling order lines for {total} order(s){f' after {after}' if after else ''}")
+    print("=" * 60)
+
+    def progress(last_order_id: str, done: int):
+        print(f"   • {done}/{total} orders (last id {last_order_id})")
+
+    report = await backfill_order_lines(db, batch_size=batch_size, after=after, progress=progress)
+
+    print("=" * 60)
+    print(f"✅ {report['lines_updated']} line(s) updated across {report['orders']} order(s)")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy order customer/date/status onto order lines")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="Orders per bulk write")
+    parser.add_argument("--after", default=None, help="Resume after this order id")
+    args = parser.parse_args()
+
+    asyncio.run(run_backfill(args.batch_size, args.after))
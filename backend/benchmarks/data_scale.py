@@ -0,0 +1,174 @@
+"""
+Data-scale benchmark - how endpoint latency grows with the size of the database
+
+Runs every route scenario from benchmarks.endpoints against synthetic data sets
+of growing size (default 1k, 10k, 100k and 1M orders) and fits latency ~ n^k
+by least squares on log-log p50 latencies. Each route has a declared budget
+(O(1) unless listed in ROUTE_BUDGETS); a route is flagged when its fitted
+exponent exceeds the budget by more than --tolerance. Also records the number
+of MongoDB commands one request issues at each scale, so N+1 query loops
+show up as a growing command count.
+
+Needs a running MongoDB. The scratch database (BENCH_DB_NAME) is rebuilt for
+every scale and dropped at the end.
+
+Usage:
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m benchmarks.data_scale \
+        [--scales 1000,10000,100000,1000000] [--requests 20] [--route dashboard] [--output scale.json]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import CommandCounter  # noqa: E402
+
+# Listeners are fixed when a client is created, so register before the app's client exists
+command_counter = CommandCounter()
+monitoring.register(command_counter)
+
+from benchmarks.endpoints import build_scenarios, prepare_database, server  # noqa: E402
+
+COMPLEXITY_EXPONENTS = {
+    "O(1)": 0.0,
+    "O(log n)": 0.15,
+    "O(n)": 1.0,
+    "O(n log n)": 1.1,
+    "O(n^2)": 2.0,
+}
+
+# Routes that legitimately touch every document in range; everything else
+# returns a bounded page and should not grow with the database
+ROUTE_BUDGETS = {
+    "GET /api/system/stats": "O(n)",
+    "GET /api/stock/as-of": "O(n)",
+    "GET /api/stock/reconcile": "O(n)",
+    "GET /api/reports/daily": "O(n)",
+    "GET /api/reports/monthly": "O(n)",
+    "GET /api/reports/range": "O(n)",
+    "GET /api/export/orders.{fmt}": "O(n)",
+    "GET /api/export/order-lines.{fmt}": "O(n)",
+    "GET /api/export/stock-movements.{fmt}": "O(n)",
+}
+DEFAULT_BUDGET = "O(1)"
+
+
+def fit_exponent(sizes: list, latencies: list) -> tuple:
+    """(k, r2) for latency = c * n^k, least squares in log-log space"""
+    points = [(math.log(n), math.log(t)) for n, t in zip(sizes, latencies) if t > 0]
+    if len(points) < 2:
+        return None, None
+    xs, ys = zip(*points)
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    k = sxy / sxx
+    ss_res = sum((y - (mean_y + k * (x - mean_x))) ** 2 for x, y in zip(xs, ys))
+    ss_tot = sum((y - mean_y) ** 2 for y in ys)
+    return k, (1 - ss_res / ss_tot) if ss_tot else 1.0
+
+
+async def measure_route(client: httpx.AsyncClient, scenario: dict, fixtures: dict, requests: int) -> dict:
+    """Sequential requests: p50 latency and commands issued by one request"""
+    headers = {"Authorization": f"Bearer {fixtures['token']}"}
+
+    async def request(n: int):
+        body = scenario['body'](fixtures, n) if scenario.get('body') else None
+        return await client.request(
+            scenario['method'], scenario['path'], params=scenario.get('params'), json=body, headers=headers
+        )
+
+    with command_counter.measure() as commands:
+        response = await request(0)
+    latencies = []
+    for n in range(1, requests + 1):
+        started = time.perf_counter()
+        await request(n)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "commands": len(commands),
+        "status": response.status_code,
+    }
+
+
+async def main(args) -> int:
+    db = server.db
+    sizes = [int(s) for s in args.scales.split(",")]
+    results = {}     # route -> {size: measurement}
+
+    transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for size in sizes:
+            print(f"Preparing {size:,} orders in '{db.name}'")
+            started = time.perf_counter()
+            fixtures = await prepare_database(db, size, args.seed)
+            print(f"   Generated in {time.perf_counter() - started:.1f} s")
+            scenarios, _ = build_scenarios(server.app, fixtures, args.route)
+            for scenario in scenarios:
+                measurement = await measure_route(client, scenario, fixtures, args.requests)
+                results.setdefault(scenario['route'], {})[size] = measurement
+                print(
+                    f"   {scenario['route']:<42} p50 {measurement['p50_ms']:>9.1f} ms   "
+                    f"{measurement['commands']:>5} commands"
+                    + (f"   ❌ HTTP {measurement['status']}" if measurement['status'] >= 400 else "")
+                )
+
+    print("=" * 60)
+    header = "".join(f"{size:>11,}" for size in sizes)
+    print(f"   {'route':<42} {'budget':<7} {'fit':>10}{header}")
+    flagged = []
+    report = {}
+    for route, by_size in results.items():
+        budget = ROUTE_BUDGETS.get(route, DEFAULT_BUDGET)
+        measured = [s for s in sizes if s in by_size]
+        k, r2 = fit_exponent(measured, [by_size[s]['p50_ms'] for s in measured])
+        commands = [by_size[s]['commands'] for s in measured]
+        over_budget = k is not None and k > COMPLEXITY_EXPONENTS[budget] + args.tolerance
+        # More round trips for more data means a query per row somewhere
+        query_growth = len(set(commands)) > 1 and commands[-1] > commands[0] * 2
+        report[route] = {
+            "budget": budget, "exponent": k, "r2": r2, "by_size": by_size,
+            "over_budget": over_budget, "query_growth": query_growth,
+        }
+        fit = f"n^{k:.2f}" if k is not None else "-"
+        cells = "".join(f"{by_size[s]['p50_ms']:>9.1f}ms" for s in measured)
+        print(f"   {route:<42} {budget:<7} {fit:>10}{cells}")
+        if over_budget:
+            flagged.append(f"{route}: grows like n^{k:.2f} (r² {r2:.2f}), budget {budget}")
+        if query_growth:
+            flagged.append(f"{route}: commands per request grow with data ({' -> '.join(map(str, commands))})")
+
+    print("=" * 60)
+    for flag in flagged:
+        print(f"   ❌ {flag}")
+    if not flagged:
+        print(f"✅ All routes within their complexity budget (tolerance {args.tolerance})")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"sizes": sizes, "routes": report}, indent=2) + "\n")
+
+    await server.client.drop_database(db.name)
+    server.client.close()
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect endpoints whose latency grows with data size")
+    parser.add_argument("--scales", default="1000,10000,100000,1000000", help="Comma-separated order counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=20, help="Timed requests per route and scale")
+    parser.add_argument("--route", default=None, help="Only routes containing this text")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed exponent above the budget")
+    parser.add_argument("--output", default=None, help="Write the fitted curves as JSON")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
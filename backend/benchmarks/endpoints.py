@@ -0,0 +1,327 @@
+"""
+Endpoint load benchmark - throughput and p50/p95/p99 latency per /api route
+
+Starts the FastAPI app in-process (httpx ASGI transport, no network) against a
+local MongoDB, fills a scratch database with the synthetic data generator and
+drives every /api route with concurrent async clients. Read routes run first,
+then the write scenarios (create order/customer/task/expense, stock adjust,
+login). Routes that cannot be load-tested meaningfully (streams, uploads,
+destructive or external calls) are listed in EXCLUDED_ROUTES; any other route
+without a scenario is reported as uncovered.
+
+Results can be stored as a baseline and later runs compared against it: a
+route regresses when its p95 grows (or its throughput drops) by more than
+--max-regression. The exit code is 1 on regressions or failing requests, so
+it can gate CI.
+
+No baseline is committed: latencies only compare on the same machine, so
+record one where the check runs (--save-baseline on the main branch), then
+run branches against it. Without a baseline the comparison is skipped and
+the run says so; pass --require-baseline to make that an error instead.
+
+Needs a running MongoDB. The scratch database (BENCH_DB_NAME) is dropped at
+the start of the run.
+
+Usage:
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m benchmarks.endpoints \
+        [--orders 10000] [--requests 200] [--concurrency 10] [--route orders] \
+        [--baseline benchmarks/baselines/endpoints.json] [--save-baseline | --require-baseline] \
+        [--max-regression 0.25]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The app reads its settings at import time - point it at the scratch database first
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "crm_bench_endpoints")
+os.environ["EMAIL_ENABLED"] = "false"
+
+import server  # noqa: E402
+from fastapi.routing import APIRoute  # noqa: E402
+from utils import generate_synthetic_data  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "endpoints.json"
+BENCH_USER_EMAIL = "bench@zenvit.no"
+BENCH_USER_PASSWORD = "bench-password"
+DATA_END = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+# Routes deliberately left out, with the reason
+EXCLUDED_ROUTES = {
+    "GET /api/dashboard/stream": "server-sent events stream, never completes",
+    "POST /api/auth/register": "one-shot per email",
+    "POST /api/products": "bumps the catalog version and invalidates caches on every call",
+    "PUT /api/products/{product_id}": "bumps the catalog version and invalidates caches on every call",
+    "DELETE /api/products/{product_id}": "destructive",
+    "POST /api/upload-image": "multipart upload, covered by the image benchmarks",
+    "PUT /api/stock/{product_id}": "overwrites stock levels",
+    "POST /api/stock-movements": "raw ledger write, covered by POST /api/stock/adjust",
+    "POST /api/stock/snapshots/compact": "batch job",
+    "POST /api/stock/reconcile": "batch job",
+    "POST /api/suppliers": "low-volume admin write",
+    "PUT /api/suppliers/{supplier_id}": "low-volume admin write",
+    "DELETE /api/suppliers/{supplier_id}": "destructive",
+    "POST /api/purchases": "low-volume admin write",
+    "PUT /api/purchases/{purchase_id}/receive": "one-shot per purchase",
+    "PUT /api/customers/{customer_id}": "low-volume admin write",
+    "DELETE /api/customers/{customer_id}": "destructive",
+    "PUT /api/orders/{order_id}/status": "state machine, one-shot per order",
+    "PUT /api/tasks/{task_id}": "low-volume admin write",
+    "PUT /api/tasks/{task_id}/status": "low-volume admin write",
+    "DELETE /api/tasks/{task_id}": "destructive",
+    "DELETE /api/expenses/{expense_id}": "destructive",
+    "POST /api/import/customers": "multipart batch import",
+    "POST /api/import/products": "multipart batch import",
+    "POST /api/automation/check-low-stock": "batch job",
+    "POST /api/automation/update-customer-status": "batch job",
+    "POST /api/automation/test-email": "sends e-mail",
+    "POST /api/seed-data": "wipes the database",
+    "POST /api/ai/recommend-products": "external LLM call",
+}
+
+# Query parameters for routes that require them
+QUERY_PARAMS = {
+    "GET /api/stock/as-of": {"date": (DATA_END - timedelta(days=30)).date().isoformat()},
+    "GET /api/reports/daily": {"date": (DATA_END - timedelta(days=1)).date().isoformat()},
+    "GET /api/reports/monthly": {"month": 12, "year": DATA_END.year - 1},
+    "GET /api/reports/range": {
+        "from": (DATA_END - timedelta(days=365)).date().isoformat(),
+        "to": DATA_END.date().isoformat(),
+        "granularity": "month",
+    },
+    "GET /api/search": {"q": "Vitamin"},
+}
+
+# Path parameter -> fixture key
+PATH_FIXTURES = {
+    "customer_id": "customer_id",
+    "product_id": "product_id",
+    "order_id": "order_id",
+    "fmt": "export_format",
+}
+
+# Write scenarios: route -> body factory(fixtures, n)
+WRITE_SCENARIOS = {
+    "POST /api/auth/login": lambda f, n: {"email": BENCH_USER_EMAIL, "password": BENCH_USER_PASSWORD},
+    "POST /api/customers": lambda f, n: {
+        "name": f"Bench Kunde {n}", "email": f"bench{n}@example.no", "phone": f"4{n:07d}", "city": "Oslo"
+    },
+    "POST /api/orders": lambda f, n: {
+        "customer_id": f["customer_id"],
+        "items": [{"product_id": f["product_ids"][n % len(f["product_ids"])], "quantity": 1}],
+        "channel": "Direct",
+    },
+    "POST /api/tasks": lambda f, n: {"title": f"Bench task {n}", "type": "Admin", "priority": "Low"},
+    "POST /api/expenses": lambda f, n: {"category": "Operations", "amount": 100 + n % 50, "payment_status": "Paid"},
+    "POST /api/stock/adjust": lambda f, n: {
+        "product_id": f["product_ids"][n % len(f["product_ids"])], "change": 1, "reason": "benchmark"
+    },
+}
+
+
+def api_routes(app) -> list:
+    """[(method, path template)] for every /api route"""
+    routes = []
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path.startswith("/api"):
+            for method in sorted(route.methods - {"HEAD", "OPTIONS"}):
+                routes.append((method, route.path))
+    return routes
+
+
+def percentile(sorted_samples: list, p: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, min(len(sorted_samples) - 1, int(round(p / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+async def prepare_database(db, orders: int, seed: int) -> dict:
+    """Fresh synthetic data set plus a bench user; returns ids the scenarios need"""
+    report = await generate_synthetic_data(db, orders, seed=seed, end=DATA_END, drop=True)
+    await db.users.delete_many({"email": BENCH_USER_EMAIL})
+    user = server.User(email=BENCH_USER_EMAIL, full_name="Benchmark")
+    doc = user.model_dump()
+    doc['created_at'] = doc['created_at'].isoformat()
+    doc['hashed_password'] = server.hash_password(BENCH_USER_PASSWORD)
+    await db.users.insert_one(doc)
+
+    customer = await db.customers.find_one({}, {"_id": 0, "id": 1}, sort=[("order_count", -1)])
+    order = await db.orders.find_one({}, {"_id": 0, "id": 1}, sort=[("date", -1)])
+    products = await db.products.find({}, {"_id": 0, "id": 1}).limit(20).to_list(20)
+    return {
+        "token": server.create_access_token({"sub": user.id}),
+        "customer_id": customer['id'],
+        "order_id": order['id'],
+        "product_id": products[0]['id'],
+        "product_ids": [p['id'] for p in products],
+        "export_format": "ndjson",
+        "counts": report['counts'],
+    }
+
+
+def build_scenarios(app, fixtures: dict, route_filter: str = None) -> tuple:
+    """(scenarios, uncovered routes); reads first, then writes"""
+    reads, writes, uncovered = [], [], []
+    for method, template in api_routes(app):
+        key = f"{method} {template}"
+        if key in EXCLUDED_ROUTES or (route_filter and route_filter not in key):
+            continue
+        path = template
+        for param, fixture in PATH_FIXTURES.items():
+            path = path.replace("{" + param + "}", str(fixtures[fixture]))
+        if method == "GET":
+            reads.append({"route": key, "method": method, "path": path, "params": QUERY_PARAMS.get(key)})
+        elif key in WRITE_SCENARIOS:
+            writes.append({"route": key, "method": method, "path": path, "body": WRITE_SCENARIOS[key]})
+        else:
+            uncovered.append(key)
+    return reads + writes, uncovered
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: dict, fixtures: dict,
+                       total: int, concurrency: int, warmup: int = 5) -> dict:
+    headers = {"Authorization": f"Bearer {fixtures['token']}"}
+    latencies = []
+    errors = {}
+    counter = iter(range(warmup + total))
+
+    async def request(n: int):
+        body = scenario['body'](fixtures, n) if scenario.get('body') else None
+        return await client.request(
+            scenario['method'], scenario['path'], params=scenario.get('params'), json=body, headers=headers
+        )
+
+    for n in range(warmup):
+        next(counter)
+        await request(n)
+
+    async def worker():
+        for n in counter:
+            started = time.perf_counter()
+            response = await request(n)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "errors": errors,
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, max_regression: float, min_delta_ms: float) -> list:
+    """Routes whose p95 grew or throughput dropped by more than max_regression"""
+    regressions = []
+    for route, result in results.items():
+        base = baseline.get("routes", {}).get(route)
+        if not base:
+            continue
+        p95_delta = result['p95_ms'] - base['p95_ms']
+        if p95_delta > min_delta_ms and result['p95_ms'] > base['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{route}: p95 {base['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result['rps'] * (1 + max_regression) < base['rps']:
+            regressions.append(f"{route}: throughput {base['rps']:.0f} -> {result['rps']:.0f} req/s")
+    return regressions
+
+
+async def main(args) -> int:
+    db = server.db
+    print(f"Preparing {args.orders:,} orders in '{db.name}' (seed {args.seed})")
+    print("=" * 60)
+    fixtures = await prepare_database(db, args.orders, args.seed)
+
+    scenarios, uncovered = build_scenarios(server.app, fixtures, args.route)
+    results = {}
+    transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in scenarios:
+            result = await run_scenario(client, scenario, fixtures, args.requests, args.concurrency)
+            results[scenario['route']] = result
+            failed = f"   ❌ {sum(result['errors'].values())} failed {result['errors']}" if result['errors'] else ""
+            print(
+                f"   {scenario['route']:<42} {result['rps']:>8.1f} req/s   p50 {result['p50_ms']:>8.1f}   "
+                f"p95 {result['p95_ms']:>8.1f}   p99 {result['p99_ms']:>8.1f} ms{failed}"
+            )
+
+    print("=" * 60)
+    for route in uncovered:
+        print(f"   ⚠️  No scenario for {route}")
+
+    run = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "orders": args.orders,
+        "seed": args.seed,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "routes": results,
+    }
+    exit_code = 1 if any(r['errors'] for r in results.values()) else 0
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(run, indent=2) + "\n")
+        print(f"✅ Baseline written to {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        settings = ("orders", "seed", "requests", "concurrency")
+        if any(baseline.get(key) != run[key] for key in settings):
+            print(f"   ⚠️  Baseline was recorded with different settings: " +
+                  ", ".join(f"{key}={baseline.get(key)}" for key in settings))
+        regressions = compare_to_baseline(results, baseline, args.max_regression, args.min_delta_ms)
+        for regression in regressions:
+            print(f"   ❌ {regression}")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"✅ No route regressed more than {args.max_regression:.0%} against {baseline_path}")
+    else:
+        print(f"⚠️  Regression check SKIPPED: no baseline at {baseline_path} - "
+              "record one with --save-baseline")
+        if args.require_baseline:
+            exit_code = 1
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(run, indent=2) + "\n")
+
+    await server.client.drop_database(db.name)
+    server.client.close()
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-benchmark every /api route")
+    parser.add_argument("--orders", type=int, default=10000, help="Size of the synthetic data set")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients per route")
+    parser.add_argument("--route", default=None, help="Only routes containing this text")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--require-baseline", action="store_true", help="Fail when there is no baseline to compare")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative p95/throughput change")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore p95 changes smaller than this")
+    parser.add_argument("--output", default=None, help="Also write this run's results as JSON")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,114 @@
+"""
+Middleware overhead benchmark - BaseHTTPMiddleware vs pure ASGI static wrapper
+
+Compares throughput of a trivial API endpoint when:
+  before: the old StaticFilesCORSMiddleware (BaseHTTPMiddleware) wraps every request
+  after:  the pure ASGI StaticFilesCORSMiddleware wraps only the /uploads mount
+
+Runs in-process over httpx's ASGI transport, so it measures framework overhead only.
+
+Usage:
+    cd backend && python -m benchmarks.middleware_overhead [--requests 20000] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.base import BaseHTTPMiddleware
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from server import StaticFilesCORSMiddleware  # noqa: E402
+
+
+class LegacyStaticFilesCORSMiddleware(BaseHTTPMiddleware):
+    """Previous implementation, kept here as the 'before' reference"""
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        if request.url.path.startswith("/uploads"):
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            response.headers["Access-Control-Allow-Methods"] = "GET, HEAD, OPTIONS"
+            response.headers["Access-Control-Allow-Headers"] = "*"
+            if request.url.path.endswith(".png"):
+                response.headers["Content-Type"] = "image/png"
+        return response
+
+
+def build_app(upload_dir: str, legacy: bool) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+    
+    if legacy:
+        app.add_middleware(LegacyStaticFilesCORSMiddleware)
+        app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
+    else:
+        app.mount("/uploads", StaticFilesCORSMiddleware(StaticFiles(directory=upload_dir)), name="uploads")
+    return app
+
+
+async def run_load(app: FastAPI, total: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up
+        for _ in range(200):
+            await client.get("/api/ping")
+        
+        queue = iter(range(total))
+        
+        async def worker():
+            for _ in queue:
+                start = time.perf_counter()
+                response = await client.get("/api/ping")
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+        
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main(total: int, concurrency: int, rounds: int):
+    with tempfile.TemporaryDirectory() as upload_dir:
+        results = {"before": [], "after": []}
+        # Interleave rounds so machine noise affects both variants equally
+        for _ in range(rounds):
+            results["before"].append(await run_load(build_app(upload_dir, legacy=True), total, concurrency))
+            results["after"].append(await run_load(build_app(upload_dir, legacy=False), total, concurrency))
+    
+    print(f"GET /api/ping - {total} requests x {rounds} rounds, concurrency {concurrency}")
+    print("=" * 60)
+    best = {}
+    for label, runs in results.items():
+        best[label] = max(runs, key=lambda r: r["rps"])
+        r = best[label]
+        print(f"   {label:<7} {r['rps']:>9.0f} req/s   p50 {r['p50_ms']:.2f} ms   p99 {r['p99_ms']:.2f} ms")
+    print("=" * 60)
+    print(f"   Throughput change: {(best['after']['rps'] / best['before']['rps'] - 1) * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark static CORS middleware overhead on API requests")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.rounds))
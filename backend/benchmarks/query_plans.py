@@ -0,0 +1,126 @@
+"""
+Query plan advisor - explains every query each /api route issues
+
+Runs every route scenario from benchmarks.endpoints once against a synthetic
+data set while a command listener captures the find / aggregate / count /
+distinct commands it sends. Each distinct query shape is re-run as
+explain("executionStats") and reported with its plan: collection scans,
+in-memory sorts and docs examined per doc returned. For problem queries a
+compound (equality -> sort -> range) or partial index is suggested, unless an
+index with that prefix already exists, printed as an IndexModel line ready
+for utils/db_indexes.py.
+
+Needs a running MongoDB. The scratch database (BENCH_DB_NAME) is rebuilt at
+the start and dropped at the end.
+
+Usage:
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m benchmarks.query_plans \
+        [--orders 20000] [--route orders] [--output plans.json] [--strict]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+from pymongo import monitoring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.query_plans import (  # noqa: E402
+    QueryCapture, explain_query, format_index_model, index_covers, plan_problems, query_shape,
+    suggest_index, summarize_plan
+)
+
+# Listeners are fixed when a client is created, so register before the app's client exists
+query_capture = QueryCapture()
+monitoring.register(query_capture)
+
+from benchmarks.endpoints import build_scenarios, prepare_database, server  # noqa: E402
+
+
+async def existing_index_keys(db, collection: str) -> list:
+    info = await db[collection].index_information()
+    return [list(index["key"]) for index in info.values()]
+
+
+async def main(args) -> int:
+    db = server.db
+    print(f"Preparing {args.orders:,} orders in '{db.name}'")
+    fixtures = await prepare_database(db, args.orders, args.seed)
+    scenarios, _ = build_scenarios(server.app, fixtures, args.route)
+    headers = {"Authorization": f"Bearer {fixtures['token']}"}
+
+    # query shape -> {"command", "routes"}; the first command seen is the one explained
+    queries = {}
+    transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in scenarios:
+            body = scenario['body'](fixtures, 0) if scenario.get('body') else None
+            with query_capture.capture() as commands:
+                await client.request(
+                    scenario['method'], scenario['path'], params=scenario.get('params'), json=body, headers=headers
+                )
+            for command in commands:
+                entry = queries.setdefault(query_shape(command), {"command": command, "routes": []})
+                if scenario['route'] not in entry['routes']:
+                    entry['routes'].append(scenario['route'])
+
+    print(f"Explaining {len(queries)} distinct queries from {len(scenarios)} routes")
+    print("=" * 60)
+    report, suggestions = [], {}
+    for entry in queries.values():
+        command = entry['command']
+        try:
+            summary = summarize_plan(await explain_query(db, command))
+        except Exception as e:
+            print(f"   ⚠️  Could not explain {json.dumps(command, default=str)[:120]}: {e}")
+            continue
+        problems = plan_problems(summary)
+        suggestion = suggest_index(command) if problems else None
+        if suggestion:
+            existing = await existing_index_keys(db, suggestion['collection'])
+            if any(index_covers(keys, suggestion['keys']) for keys in existing):
+                suggestion = None
+        if suggestion:
+            suggestions.setdefault(format_index_model(suggestion), []).extend(entry['routes'])
+        report.append({**entry, "plan": summary, "problems": problems,
+                       "suggestion": format_index_model(suggestion) if suggestion else None})
+
+        if problems or args.verbose:
+            name = next(iter(command))
+            print(f"{'❌' if problems else '✅'} {name} {command[name]}  "
+                  f"[{' > '.join(summary['stages']) or '-'}]  "
+                  f"examined {summary['docs_examined']:,} / returned {summary['returned']:,}  "
+                  f"{summary['millis']} ms")
+            print(f"   routes: {', '.join(entry['routes'])}")
+            for problem in problems:
+                print(f"   - {problem}")
+
+    print("=" * 60)
+    if suggestions:
+        print("Suggested indexes (utils/db_indexes.py):")
+        for model, routes in suggestions.items():
+            print(f"   {model}    # {len(set(routes))} route(s)")
+    problem_count = sum(1 for item in report if item['problems'])
+    print(f"{'⚠️ ' if problem_count else '✅'} {problem_count} of {len(report)} queries with plan problems")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, default=str) + "\n")
+
+    await server.client.drop_database(db.name)
+    server.client.close()
+    return 1 if args.strict and problem_count else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explain every query the API issues and suggest indexes")
+    parser.add_argument("--orders", type=int, default=20000, help="Synthetic data set size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--route", default=None, help="Only routes containing this text")
+    parser.add_argument("--verbose", action="store_true", help="Also print queries without problems")
+    parser.add_argument("--output", default=None, help="Write every explained query as JSON")
+    parser.add_argument("--strict", action="store_true", help="Exit 1 when any query has plan problems")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
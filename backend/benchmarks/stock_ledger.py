@@ -0,0 +1,151 @@
+"""
+Stock ledger benchmark - full movement replay vs snapshot + tail replay
+
+Seeds a scratch database with synthetic stock movements spread over a year,
+compacts them into daily snapshots and times point-in-time stock queries:
+  replay:   sum every movement up to the requested instant
+  snapshot: nearest snapshot + movements after it (what /api/stock/as-of does)
+Both must return identical quantities, and the final levels (as-of and the
+reconciler's expected_stock_levels) must match the on-hand quantities the
+generator tracked itself - orders log a hold when created and the sale on
+completion, and only the sale may count.
+
+Needs a running MongoDB. The scratch database is dropped at the start of the run.
+
+Usage:
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m benchmarks.stock_ledger \
+        [--movements 2000000] [--products 500] [--days 365] [--queries 20]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import (  # noqa: E402
+    compact_stock_ledger, create_indexes, expected_stock_levels, stock_as_of, sum_movements
+)
+
+INSERT_BATCH = 10000
+MOVEMENT_TYPES = ["IN", "OUT", "ORDER", "ORDER", "ADJUST"]
+# Share of orders that are completed; the rest stay open or are cancelled
+COMPLETED_ORDER_SHARE = 0.7
+
+
+def movement_batches(total: int, products: int, start: datetime, days: int, seed: int, on_hand: dict):
+    """Random movements in batches; `on_hand` is filled with the true final quantity per product"""
+    rng = random.Random(seed)
+    product_ids = [f"bench-product-{i}" for i in range(products)]
+    span = days * 86400
+    batch = []
+
+    def movement(product_id, movement_type, change, at, source="benchmark", source_id=None):
+        return {
+            "id": str(uuid.uuid4()),
+            "product_id": product_id,
+            "type": movement_type,
+            "change": change,
+            "timestamp": at.isoformat(),
+            "source": source,
+            "source_id": source_id,
+        }
+
+    while total > 0:
+        movement_type = rng.choice(MOVEMENT_TYPES)
+        product_id = rng.choice(product_ids)
+        change = rng.randint(1, 20)
+        at = start + timedelta(seconds=rng.randrange(span))
+        on_hand.setdefault(product_id, 0)
+        if movement_type == "ORDER":
+            # Hold logged on creation (positive OUT), sale logged on completion (negative OUT)
+            order_id = str(uuid.uuid4())
+            batch.append(movement(product_id, "OUT", change, at, "ORDER", order_id))
+            total -= 1
+            completed_at = at + timedelta(seconds=rng.randrange(3 * 86400))
+            if total > 0 and rng.random() < COMPLETED_ORDER_SHARE and completed_at < start + timedelta(days=days):
+                batch.append(movement(product_id, "OUT", -change, completed_at, "ORDER", order_id))
+                on_hand[product_id] = on_hand.get(product_id, 0) - change
+                total -= 1
+        else:
+            if movement_type == "ADJUST" and rng.random() < 0.5:
+                change = -change
+            batch.append(movement(product_id, movement_type, change, at))
+            on_hand[product_id] = on_hand.get(product_id, 0) + (-change if movement_type == "OUT" else change)
+            total -= 1
+        if len(batch) >= INSERT_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) * 1000
+
+
+async def main(total: int, products: int, days: int, queries: int, seed: int):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.environ.get("BENCH_DB_NAME", "crm_bench_stock_ledger")]
+    await client.drop_database(db.name)
+    await create_indexes(db)
+    
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=days)
+    
+    print(f"Seeding {total:,} movements for {products} products over {days} days")
+    print("=" * 60)
+    started = time.perf_counter()
+    on_hand = {}
+    for batch in movement_batches(total, products, start, days, seed, on_hand):
+        await db.stock_movements.insert_many(batch, ordered=False)
+    print(f"   Seeded in {time.perf_counter() - started:.1f} s")
+    
+    runs, compact_ms = await timed(compact_stock_ledger(db, until=end, period="day"))
+    print(f"   Compacted into {len(runs)} daily snapshots in {compact_ms / 1000:.1f} s")
+    
+    rng = random.Random(seed + 1)
+    instants = [(start + timedelta(seconds=rng.randrange(days * 86400))).isoformat() for _ in range(queries)]
+    
+    replay_ms, snapshot_ms = [], []
+    for as_of in instants:
+        full, ms = await timed(sum_movements(db, end=as_of))
+        replay_ms.append(ms)
+        ledger, ms = await timed(stock_as_of(db, as_of))
+        snapshot_ms.append(ms)
+        expected = {pid: row["change"] for pid, row in full.items()}
+        assert ledger["quantities"] == expected, f"Mismatch at {as_of}"
+    
+    final = await stock_as_of(db, end.isoformat())
+    assert final["quantities"] == on_hand, "as-of != true stock"
+    assert await expected_stock_levels(db) == on_hand, "reconciler ledger != true stock"
+    
+    print("=" * 60)
+    for label, samples in (("replay", replay_ms), ("snapshot", snapshot_ms)):
+        print(f"   {label:<9} p50 {statistics.median(samples):>9.1f} ms   max {max(samples):>9.1f} ms")
+    print("=" * 60)
+    print(f"   Speedup (p50): {statistics.median(replay_ms) / statistics.median(snapshot_ms):.1f}x")
+    
+    await client.drop_database(db.name)
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark point-in-time stock queries")
+    parser.add_argument("--movements", type=int, default=2_000_000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(main(args.movements, args.products, args.days, args.queries, args.seed))
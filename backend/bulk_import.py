@@ -0,0 +1,55 @@
+"""
+Bulk import customers or products from CSV / NDJSON
+
+Usage:
+    python bulk_import.py customers customers.csv
+    python bulk_import.py products products.ndjson --dry-run
+
+Rows are validated against CustomerCreate / ProductCreate, deduplicated on
+normalized email/phone (customers) or EAN (products) and written in batches.
+Invalid rows are reported and skipped - they never abort the import.
+"""
+
+import argparse
+import asyncio
+import json
+
+from server import bulk_import_customers, bulk_import_products, client
+from utils import detect_import_format, iter_records
+
+
+async def run_import(kind: str, path: str, fmt: str, dry_run: bool):
+    importer = bulk_import_customers if kind == "customers" else bulk_import_products
+    
+    print(f"📥 Importing {kind} from {path}{' (dry run)' if dry_run else ''}")
+    print("=" * 60)
+    
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        report = await importer(iter_records(f, fmt or detect_import_format(path)), dry_run)
+    
+    print(f"   • Rows read:  {report['total_rows']}")
+    print(f"   • Created:    {report['created']}")
+    print(f"   • Duplicates: {report['duplicates']}")
+    print(f"   • Errors:     {report['error_count']}")
+    for error in report['errors'][:20]:
+        print(f"     ❌ Row {error['row']}: {error['error']}")
+    if report['error_count'] > 20:
+        print(f"     ... and {report['error_count'] - 20} more")
+    print("=" * 60)
+    
+    client.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import customers or products")
+    parser.add_argument("kind", choices=["customers", "products"])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None, help="Defaults to file extension")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and dedupe without writing")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+    
+    result = asyncio.run(run_import(args.kind, args.path, args.format, args.dry_run))
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
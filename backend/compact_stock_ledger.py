@@ -0,0 +1,61 @@
+"""
+Fold stock_movements into stock snapshots (run nightly, e.g. from cron)
+
+Usage:
+    python compact_stock_ledger.py
+    python compact_stock_ledger.py --period month --until 2025-01-01
+
+Creates one snapshot per day (or month) boundary since the last snapshot,
+then prunes daily snapshots older than --keep-daily-days (month starts are kept).
+Point-in-time stock (/api/stock/as-of) then only replays movements after the
+nearest snapshot instead of the full history.
+"""
+
+import argparse
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from utils import compact_stock_ledger, prune_snapshots
+
+load_dotenv()
+
+
+async def run_compaction(period: str, until: str, keep_daily_days: int):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    
+    until_dt = None
+    if until:
+        until_dt = datetime.fromisoformat(until)
+        if until_dt.tzinfo is None:
+            until_dt = until_dt.replace(tzinfo=timezone.utc)
+    
+    print(f"📦 Compacting stock ledger ({period} snapshots)")
+    print("=" * 60)
+    
+    runs = await compact_stock_ledger(db, until=until_dt, period=period)
+    for run in runs:
+        print(f"   ✓ {run['as_of']}: {run['products']} products, {run['movements_folded']} movements folded")
+    if not runs:
+        print("   ✓ Already up to date")
+    
+    pruned = await prune_snapshots(db, keep_daily_days)
+    
+    print("=" * 60)
+    print(f"✅ Created {len(runs)} snapshot(s), pruned {pruned} old daily snapshot(s)")
+    
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold stock movements into snapshots")
+    parser.add_argument("--period", choices=["day", "month"], default="day")
+    parser.add_argument("--until", help="Snapshot up to this date (default: start of today, UTC)")
+    parser.add_argument("--keep-daily-days", type=int, default=90)
+    args = parser.parse_args()
+    
+    asyncio.run(run_compaction(args.period, args.until, args.keep_daily_days))
@@ -0,0 +1,54 @@
+"""
+Export orders, order lines, expenses and stock movements to Parquet, one
+partition per month, for offline analysis (pandas, DuckDB, Polars...)
+
+Usage:
+    python export_parquet.py exports/parquet                          # all tables
+    python export_parquet.py exports/parquet --tables order_lines expenses
+    python export_parquet.py exports/parquet --full                   # rewrite every month
+
+Runs are incremental: only months whose data changed since the last run are
+rewritten, and months that no longer have any data are removed. Needs pyarrow.
+"""
+
+import argparse
+import asyncio
+
+from server import client, db
+from utils import PARQUET_BATCH_SIZE, PARQUET_TABLES, export_parquet
+
+
+async def run_export(output: str, tables: list, full: bool, batch_size: int):
+    print(f"📦 Parquet export to {output}{' (full)' if full else ''}")
+    print("=" * 60)
+
+    def progress(written_tables: list, month: str, rows: dict):
+        counts = ", ".join(f"{table} {rows[table]}" for table in written_tables)
+        print(f"   • {month}: {counts}")
+
+    try:
+        report = await export_parquet(db, output, tables=tables, full=full, batch_size=batch_size,
+                                      progress=progress)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        client.close()
+        return
+
+    print("=" * 60)
+    for table, result in report.items():
+        removed = f", {len(result['removed'])} removed" if result['removed'] else ""
+        print(f"✅ {table}: {len(result['written'])} month(s) written ({result['rows']} rows), "
+              f"{result['unchanged']} unchanged{removed}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export analytics tables to monthly Parquet partitions")
+    parser.add_argument("output", help="Output directory")
+    parser.add_argument("--tables", nargs="+", choices=PARQUET_TABLES, default=None, help="Tables to export")
+    parser.add_argument("--full", action="store_true", help="Rewrite every month, not just changed ones")
+    parser.add_argument("--batch-size", type=int, default=PARQUET_BATCH_SIZE, help="Documents per row group")
+    args = parser.parse_args()
+
+    asyncio.run(run_export(args.output, args.tables, args.full, args.batch_size))
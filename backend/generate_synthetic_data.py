@@ -0,0 +1,84 @@
+"""
+Generate a synthetic data set for load testing (replaces /api/seed-data at scale)
+
+Usage:
+    python generate_synthetic_data.py --orders 100000 --db zenvit_load --drop
+    python generate_synthetic_data.py --orders 10000000 --days 730 --seed 7 --end 2025-01-01 --concurrency 8
+
+Products, suppliers, customers, orders with lines, purchases, stock movements,
+tasks and expenses are generated consistently (stock equals the movement
+ledger, customer stats match their orders) and spread over --days ending at
+--end. The same --seed, --orders, --days and --end always give the same data.
+Lines follow LINES_LAYOUT (or --lines-layout), like the server writes them.
+Writes go through parallel insert_many batches.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from utils import LINES_LAYOUTS, SYNTHETIC_BATCH_SIZE, SYNTHETIC_CONCURRENCY, generate_synthetic_data, scale_counts
+
+load_dotenv()
+
+
+async def run_generate(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[args.db or os.environ['DB_NAME']]
+
+    if not args.drop and await db.orders.estimated_document_count() > 0:
+        print(f"❌ Database '{db.name}' already has orders - use --drop to replace them, or --db for another database")
+        client.close()
+        return None
+
+    end = None
+    if args.end:
+        end = datetime.fromisoformat(args.end)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+
+    print(f"🧪 Generating synthetic data in '{db.name}' (seed {args.seed}, {args.lines_layout} lines)")
+    print("=" * 60)
+    for name, count in scale_counts(args.orders).items():
+        print(f"   • {name}: {count:,}")
+
+    started = time.perf_counter()
+    report = await generate_synthetic_data(
+        db, args.orders, seed=args.seed, days=args.days, end=end,
+        batch_size=args.batch_size, concurrency=args.concurrency, drop=args.drop,
+        embedded_lines=args.lines_layout == 'embedded'
+    )
+    elapsed = time.perf_counter() - started
+
+    print("=" * 60)
+    for name, count in sorted(report['counts'].items()):
+        print(f"   ✓ {name}: {count:,}")
+    for transition, count in sorted(report['customer_status'].items()):
+        print(f"   • Customers {transition}: {count:,}")
+    total = sum(report['counts'].values())
+    print(f"✅ Inserted {total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)")
+
+    client.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic CRM data for load testing")
+    parser.add_argument("--orders", type=int, default=10000, help="Number of orders (1k - 10M); other collections scale with it")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="Time spread of the data")
+    parser.add_argument("--end", default=None, help="Last day of the period (ISO date, default: today)")
+    parser.add_argument("--db", default=None, help="Target database (default: DB_NAME)")
+    parser.add_argument("--drop", action="store_true", help="Drop the generated collections first")
+    parser.add_argument("--batch-size", type=int, default=SYNTHETIC_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=SYNTHETIC_CONCURRENCY, help="insert_many batches in flight")
+    parser.add_argument("--lines-layout", choices=LINES_LAYOUTS, default=os.environ.get('LINES_LAYOUT', 'collection'),
+                        help="Where order/purchase lines go (default: LINES_LAYOUT)")
+    args = parser.parse_args()
+
+    asyncio.run(run_generate(args))
@@ -0,0 +1,91 @@
+"""
+Migrate order and purchase lines into their parent documents (embedded layout)
+
+Usage:
+    python migrate_embedded_lines.py                              # orders and purchases
+    python migrate_embedded_lines.py orders --after <order_id>    # resume an interrupted run
+    python migrate_embedded_lines.py --reverse                    # back to the line collections
+
+Copies order_lines / purchase_lines into a `lines` array on each order /
+purchase, in id order, one bulk write per batch. Parents that already have
+embedded lines are skipped, so the script can be re-run at any time. The
+line collections are not modified. Once every parent is migrated, set
+LINES_LAYOUT=embedded (see utils/embedded_lines.py for the rollout).
+
+--reverse undoes the switch: with LINES_LAYOUT=collection set again, it
+writes every embedded line back to its collection and removes `lines` from
+the parents.
+"""
+
+import argparse
+import asyncio
+
+from server import client, db
+from utils import LINE_COLLECTIONS, MIGRATION_BATCH_SIZE, migrate_collection_lines, migrate_embedded_lines
+
+
+async def run_migration(collections: list, batch_size: int, after: str):
+    print("📦 Embedding lines into their parents")
+    print("=" * 60)
+
+    for name in collections:
+        remaining = await db[name].count_documents({"lines": {"$exists": False}})
+        print(f"{name}: {remaining} to migrate")
+
+        def progress(last_id: str, done: int):
+            print(f"   • {done}/{remaining} {name} (last id {last_id})")
+
+        report = await migrate_embedded_lines(db, name, batch_size=batch_size, after=after, progress=progress)
+        print(f"   ✅ {report['parents']} {name}, {report['lines']} line(s) embedded")
+
+    print("=" * 60)
+    left = {name: await db[name].count_documents({"lines": {"$exists": False}}) for name in collections}
+    if any(left.values()):
+        print(f"⚠️  Not migrated yet: {left} - re-run without --after before switching the layout")
+    else:
+        print("✅ All lines embedded - LINES_LAYOUT=embedded can be enabled")
+
+    client.close()
+
+
+async def run_reverse_migration(collections: list, batch_size: int):
+    print("📦 Moving embedded lines back to their collections")
+    print("=" * 60)
+
+    for name in collections:
+        remaining = await db[name].count_documents({"lines": {"$exists": True}})
+        print(f"{name}: {remaining} to migrate")
+
+        def progress(last_id: str, done: int):
+            print(f"   • {done}/{remaining} {name} (last id {last_id})")
+
+        report = await migrate_collection_lines(db, name, batch_size=batch_size, progress=progress)
+        print(f"   ✅ {report['parents']} {name}, {report['lines']} line(s) written to {LINE_COLLECTIONS[name][0]}")
+
+    print("=" * 60)
+    left = {name: await db[name].count_documents({"lines": {"$exists": True}}) for name in collections}
+    if any(left.values()):
+        print(f"⚠️  Still embedded: {left} - is LINES_LAYOUT still set to embedded? Re-run once it is not")
+    else:
+        print("✅ All lines are back in their collections")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed order/purchase lines into their parent documents")
+    parser.add_argument("collection", nargs="?", choices=sorted(LINE_COLLECTIONS), help="Only this collection")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE, help="Parents per bulk write")
+    parser.add_argument("--after", default=None, help="Resume after this id (needs a collection)")
+    parser.add_argument("--reverse", action="store_true", help="Move embedded lines back to the line collections")
+    args = parser.parse_args()
+    if args.after and not args.collection:
+        parser.error("--after needs a collection")
+    if args.after and args.reverse:
+        parser.error("--reverse resumes by itself and takes no --after")
+
+    collections = [args.collection] if args.collection else sorted(LINE_COLLECTIONS)
+    if args.reverse:
+        asyncio.run(run_reverse_migration(collections, args.batch_size))
+    else:
+        asyncio.run(run_migration(collections, args.batch_size, args.after))
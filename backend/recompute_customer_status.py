@@ -0,0 +1,40 @@
+"""
+Recompute customer lifecycle status (New / Active / VIP / Inactive)
+
+Usage:
+    python recompute_customer_status.py             # update all customers
+    python recompute_customer_status.py --dry-run   # report transitions only
+
+Meant to run nightly (e.g. cron: 15 2 * * * cd /app/backend && python recompute_customer_status.py).
+Order stats come from one $group on orders per batch of customers; only customers that
+actually change are written, in bulk, and each status change is added to the
+customer timeline. Lead and Lost are set by hand and left alone.
+"""
+
+import argparse
+import asyncio
+
+from server import client, db
+from utils import recompute_customer_lifecycle
+
+
+async def run_recompute(dry_run: bool):
+    print(f"👥 Recomputing customer status{' (dry run)' if dry_run else ''}")
+    print("=" * 60)
+
+    report = await recompute_customer_lifecycle(db, dry_run=dry_run)
+
+    for transition, count in sorted(report['transitions'].items()):
+        print(f"   • {transition}: {count}")
+    print("=" * 60)
+    print(f"✅ {report['customers_updated']} customer(s) {'would be ' if dry_run else ''}updated")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute customer lifecycle status")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without writing them")
+    args = parser.parse_args()
+
+    asyncio.run(run_recompute(args.dry_run))
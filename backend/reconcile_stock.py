@@ -0,0 +1,53 @@
+"""
+Reconcile stored stock with the stock movement ledger
+
+Usage:
+    python reconcile_stock.py            # report drift only
+    python reconcile_stock.py --repair   # fix db.stock and products.stock_quantity
+
+The expected quantity per product is rebuilt from stock_movements in a single
+aggregation and both stores are repaired with bulk writes, so it is cheap
+enough to run nightly. Replaces the per-record sync_stock_to_products.py.
+Products without movements, or whose history has legacy absolute
+"Manual adjustment" entries, are listed for review and never overwritten.
+"""
+
+import argparse
+import asyncio
+
+from server import client, reconcile_stock
+
+FLAG_NOTES = {
+    "no_movements": "no stock movements",
+    "absolute_entries": "ledger has legacy absolute adjustments",
+}
+
+
+async def run_reconcile(repair: bool):
+    print(f"🔍 Reconciling stock with movement ledger{' (repair)' if repair else ''}")
+    print("=" * 60)
+    
+    report = await reconcile_stock(repair=repair)
+    
+    for item in report['drift']:
+        flag = f" - {FLAG_NOTES[item['flag']]}, not repaired" if item['flag'] else ""
+        print(
+            f"   ⚠️  {item['product_name']}: ledger {item['ledger_quantity']}, "
+            f"stock {item['stock_quantity']}, product {item['product_stock_quantity']}{flag}"
+        )
+    print("=" * 60)
+    print(f"   • Products checked: {report['checked_products']}")
+    print(f"   • Drifting:         {report['drifting_products']}")
+    print(f"   • Needs review:     {report['flagged_products']}")
+    if repair:
+        print(f"✅ Updated {report['products_updated']} product(s) and {report['stock_updated']} stock record(s)")
+    
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile stock quantities with stock movements")
+    parser.add_argument("--repair", action="store_true", help="Write ledger quantities to both stores")
+    args = parser.parse_args()
+    
+    asyncio.run(run_reconcile(args.repair))
@@ -1,25 +1,57 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Response, Query, Header
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
+import re
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
-import jwt
-import aiosmtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from functools import lru_cache
 import shutil
 import aiofiles
+import io
 import json
+import asyncio
+from utils import SALES_ORDER_STATUSES, STOCK_COMMIT_STATUSES
+from utils import EXPORT_BATCH_SIZE, EXPORT_FIELDS, EXPORT_MEDIA_TYPES, build_date_filter, stream_export
+from utils import (
+    BULK_IMPORT_BATCH_SIZE, MAX_REPORTED_ERRORS, detect_import_format, iter_records, read_records,
+    normalize_email, normalize_phone, normalize_ean, split_list_field
+)
+from utils import IMAGE_EXTENSIONS, InvalidUploadError, UploadTooLargeError, receive_multipart_upload
+from utils import (
+    IMAGE_VARIANTS, IMMUTABLE_CACHE_CONTROL, ensure_variant, is_safe_image_filename,
+    parse_range_header, pregenerate_variants, shutdown_image_pool
+)
+from utils import compact_stock_ledger, ledger_summary, prune_snapshots, signed_change, stock_as_of
+from utils import DashboardHub
+from utils import RecommendationIndex, recommend_products
+from utils import AsyncTTLCache, context_key
+from utils import TaskDeadlineScheduler
+from utils import (
+    INACTIVE_AFTER_DAYS, MANUAL_STATUSES, lifecycle_status, order_stats_pipeline,
+    recompute_customer_lifecycle
+)
+from utils import IdempotencyError, run_idempotent
+from utils import order_line_fields
+from utils import (
+    LINES_LAYOUTS, attach_lines, embedded_line, lookup_order_lines, order_lines_pipeline, parent_lines
+)
+from utils import (
+    InsufficientStockError, ReservationSweeper, available_to_promise, commit_reservations,
+    release_reservations, reserve_stock
+)
 
 
 ROOT_DIR = Path(__file__).parent
@@ -30,8 +62,12 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing - passlib/bcrypt, jwt, the email stack and the AI client are imported
+# on first use so workers start serving sooner (tests/test_import_time.py keeps it that way)
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # JWT settings
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production-2024')
@@ -49,6 +85,32 @@ SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
 EMAIL_FROM = os.environ.get('EMAIL_FROM', 'noreply@zenvit.no')
 EMAIL_ENABLED = os.environ.get('EMAIL_ENABLED', 'false').lower() == 'true'
 
+# Upload settings
+UPLOAD_ROOT = Path("/app/backend/uploads")
+PRODUCT_UPLOAD_DIR = UPLOAD_ROOT / "products"
+IMAGE_VARIANT_DIR = UPLOAD_ROOT / "variants"
+MAX_IMAGE_UPLOAD_BYTES = int(os.environ.get('MAX_IMAGE_UPLOAD_MB', 5)) * 1024 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # Headers/boundaries around the file part
+
+# AI recommendation response cache
+AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', 256))
+AI_CACHE_TTL_SECONDS = int(os.environ.get('AI_CACHE_TTL_SECONDS', 24 * 3600))
+
+# Task deadline reminders are sent this long before the due date
+TASK_REMINDER_HOURS = float(os.environ.get('TASK_REMINDER_HOURS', 24))
+
+# Where order/purchase lines are written: "collection" (order_lines / purchase_lines) or
+# "embedded" (a `lines` array in the order/purchase). Reads handle both; switch to embedded
+# only after migrate_embedded_lines.py has run, and back only with its --reverse
+# (see utils/embedded_lines.py)
+LINES_LAYOUT = os.environ.get('LINES_LAYOUT', 'collection')
+if LINES_LAYOUT not in LINES_LAYOUTS:
+    raise RuntimeError(f"LINES_LAYOUT must be one of {', '.join(LINES_LAYOUTS)}, got '{LINES_LAYOUT}'")
+EMBEDDED_LINES = LINES_LAYOUT == 'embedded'
+
+# Stock held for an order is released if it is neither completed nor cancelled within this time
+STOCK_RESERVATION_TTL_HOURS = float(os.environ.get('STOCK_RESERVATION_TTL_HOURS', 7 * 24))
+
 # Create the main app
 app = FastAPI(
     title="ZenVit Complete CRM API",
@@ -57,27 +119,58 @@ app = FastAPI(
 )
 api_router = APIRouter(prefix="/api")
 
+# Keep references to fire-and-forget tasks so they are not garbage collected
+background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Live dashboard KPIs, shared by every connected browser in this process
+dashboard_hub = DashboardHub(db)
 
-# Custom middleware to add CORS headers to static files
-class StaticFilesCORSMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
+
+# Pure ASGI wrapper for the /uploads static app - adds CORS and content-type headers.
+# It wraps only the mounted static app, so API requests never pass through it.
+STATIC_CONTENT_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
+CONTENT_ADDRESSED_NAME = re.compile(r"/[0-9a-f]{64}(-[a-z]+)?\.[a-z]+$")
+
+class StaticFilesCORSMiddleware:
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Add CORS headers for /uploads paths
-        if request.url.path.startswith("/uploads"):
-            response.headers["Access-Control-Allow-Origin"] = "*"
-            response.headers["Access-Control-Allow-Methods"] = "GET, HEAD, OPTIONS"
-            response.headers["Access-Control-Allow-Headers"] = "*"
-            
-            # Ensure correct Content-Type for images
-            if request.url.path.endswith(".png"):
-                response.headers["Content-Type"] = "image/png"
-            elif request.url.path.endswith((".jpg", ".jpeg")):
-                response.headers["Content-Type"] = "image/jpeg"
-            elif request.url.path.endswith(".webp"):
-                response.headers["Content-Type"] = "image/webp"
+        path = scope["path"]
+        content_type = STATIC_CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+        immutable = bool(CONTENT_ADDRESSED_NAME.search(path))
+        
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["Access-Control-Allow-Origin"] = "*"
+                headers["Access-Control-Allow-Methods"] = "GET, HEAD, OPTIONS"
+                headers["Access-Control-Allow-Headers"] = "*"
+                
+                # Ensure correct Content-Type for images
+                if content_type and message["status"] < 400:
+                    headers["Content-Type"] = content_type
+                # <sha256>.<ext> uploads never change content
+                if immutable and message["status"] in (200, 304):
+                    headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_headers)
 
 
 # ============================================================================
@@ -352,6 +445,10 @@ class OrderLine(BaseModel):
     discount: float = 0
     line_total: float = 0  # AUTO
     line_profit: float = 0  # AUTO
+    # Copied from the order so per-customer/per-product analytics need no join
+    customer_id: Optional[str] = None
+    date: Optional[str] = None
+    status: Optional[str] = None
 
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -437,12 +534,13 @@ class ExpenseCreate(BaseModel):
 # ============================================================================
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def create_access_token(data: dict) -> str:
+    import jwt
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
@@ -450,8 +548,11 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    return await get_user_from_token(credentials.credentials)
+
+async def get_user_from_token(token: str) -> User:
+    import jwt
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
@@ -484,42 +585,76 @@ def calculate_stock_status(quantity: int, min_stock: int) -> str:
     else:
         return "OK"
 
+SKU_CATEGORY_CODES = {
+    'vitamin': 'VIT',
+    'mineral': 'MIN',
+    'supplement': 'SUP',
+    'omega': 'OME',
+    'probiotic': 'PRO',
+    'herbal': 'HRB',
+    'protein': 'PRT',
+    'other': 'OTH'
+}
+
+def get_sku_category_code(category: str) -> str:
+    return SKU_CATEGORY_CODES.get(category.lower(), 'PRD')
+
+async def get_max_sku_number(cat_code: str) -> int:
+    """Highest existing SKU number for a category code (0 if none)"""
+    existing_products = await db.products.find(
+        {"sku": {"$regex": f"^ZV-{cat_code}-"}},
+        {"_id": 0, "sku": 1}
+    ).to_list(None)
+    
+    numbers = []
+    for prod in existing_products:
+        try:
+            numbers.append(int(prod['sku'].split('-')[-1]))
+        except (ValueError, IndexError):
+            continue
+    return max(numbers) if numbers else 0
+
 async def generate_sku(category: str) -> str:
     """Generate automatic SKU in format: ZV-<CAT>-<number>"""
-    # Category code mapping
-    category_codes = {
-        'vitamin': 'VIT',
-        'mineral': 'MIN',
-        'supplement': 'SUP',
-        'omega': 'OME',
-        'probiotic': 'PRO',
-        'herbal': 'HRB',
-        'protein': 'PRT',
-        'other': 'OTH'
-    }
+    cat_code = get_sku_category_code(category)
+    next_number = await get_max_sku_number(cat_code) + 1
+    return f"ZV-{cat_code}-{next_number:03d}"
+
+def validate_product_create(product_create: ProductCreate):
+    """Shared validation for product create/update/import"""
+    if len(product_create.name) < 2:
+        raise HTTPException(status_code=400, detail="Product name must be at least 2 characters")
     
-    cat_code = category_codes.get(category.lower(), 'PRD')
+    if product_create.price < 0:
+        raise HTTPException(status_code=400, detail="Price cannot be negative")
     
-    # Find highest existing number for this category
-    existing_products = await db.products.find(
-        {"sku": {"$regex": f"^ZV-{cat_code}-"}},
-        {"_id": 0, "sku": 1}
-    ).to_list(1000)
+    if product_create.cost < 0:
+        raise HTTPException(status_code=400, detail="Cost cannot be negative")
     
-    if not existing_products:
-        next_number = 1
-    else:
-        # Extract numbers from SKUs
-        numbers = []
-        for prod in existing_products:
-            try:
-                num = int(prod['sku'].split('-')[-1])
-                numbers.append(num)
-            except (ValueError, IndexError):
-                continue
-        next_number = max(numbers) + 1 if numbers else 1
+    if product_create.min_stock < 0:
+        raise HTTPException(status_code=400, detail="Minimum stock must be positive")
     
-    return f"ZV-{cat_code}-{next_number:03d}"
+    # Validate EAN if provided
+    if product_create.ean and not product_create.ean.isdigit():
+        raise HTTPException(status_code=400, detail="EAN must contain only digits")
+
+async def link_image_to_product(image_url: Optional[str], product_id: str):
+    """Record which products use a content-addressed upload (image_assets index)"""
+    if not image_url or not image_url.startswith("/uploads/products/"):
+        return
+    image_hash = image_url.rsplit("/", 1)[-1].split(".", 1)[0]
+    await db.image_assets.update_one({"hash": image_hash}, {"$addToSet": {"product_ids": product_id}})
+
+async def get_catalog_version() -> int:
+    """Version of the product catalog, bumped on every product change"""
+    doc = await db.app_state.find_one({"id": "catalog_version"}, {"_id": 0, "version": 1})
+    return doc['version'] if doc else 0
+
+async def bump_catalog_version():
+    """Mark catalog-derived data (e.g. the recommendation index) as stale in every worker"""
+    await db.app_state.update_one({"id": "catalog_version"}, {"$inc": {"version": 1}}, upsert=True)
+    # Other workers miss their stale entries because the version is part of the key
+    ai_recommendation_cache.clear()
 
 async def update_stock_status(product_id: str):
     """Update stock status based on current quantity"""
@@ -531,6 +666,16 @@ async def update_stock_status(product_id: str):
             {"$set": {"status": status, "last_updated": datetime.now(timezone.utc).isoformat()}}
         )
 
+async def apply_stock_change(product_id: str, change: int):
+    """Move on-hand stock in both stores (Product.stock_quantity and its db.stock mirror)"""
+    now = datetime.now(timezone.utc).isoformat()
+    await db.products.update_one(
+        {"id": product_id},
+        {"$inc": {"stock_quantity": change}, "$set": {"updated_at": now}}
+    )
+    await db.stock.update_one({"product_id": product_id}, {"$inc": {"quantity": change}})
+    await update_stock_status(product_id)
+
 async def create_stock_movement(product_id: str, type: str, quantity: int, 
                                 order_id: str = None, purchase_id: str = None, note: str = None):
     """Create a stock movement record"""
@@ -552,66 +697,71 @@ async def create_stock_movement(product_id: str, type: str, quantity: int,
     if doc.get('date'):
         doc['date'] = doc['date'].isoformat()
     await db.stock_movements.insert_one(doc)
+    return doc
+
+async def products_by_id(product_ids, projection: Dict[str, int] = None) -> Dict[str, Dict[str, Any]]:
+    """Products for a set of ids in one query"""
+    projection = {"_id": 0, **(projection or {})}
+    cursor = db.products.find({"id": {"$in": list(set(product_ids))}}, projection)
+    return {p['id']: p async for p in cursor}
+
+async def idempotent_write(idempotency_key: Optional[str], scope: str, payload: Dict[str, Any], handler):
+    """
+    Run a create endpoint once per Idempotency-Key header. Retries with the same key
+    get the stored response (201, Idempotent-Replayed: true) without writing again.
+    """
+    async def run():
+        return jsonable_encoder(await handler())
+    
+    if not idempotency_key:
+        return await handler()
+    try:
+        response, replayed = await run_idempotent(db, idempotency_key, scope, payload, run)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if replayed:
+        return JSONResponse(status_code=201, content=response, headers={"Idempotent-Replayed": "true"})
+    return response
 
 async def update_customer_stats(customer_id: str):
     """Update customer auto-calculated fields"""
-    # Get all completed orders for this customer
-    orders = await db.orders.find({
-        "customer_id": customer_id,
-        "status": {"$in": ["Delivered", "Shipped", "Processing", "Packed"]}
-    }, {"_id": 0}).to_list(1000)
-    
-    total_value = sum(order.get('order_total', 0) for order in orders)
-    order_count = len(orders)
-    
-    # Find last order date
-    last_order_date = None
-    if orders:
-        latest_order = max(orders, key=lambda x: x.get('date', ''))
-        last_order_date = latest_order.get('date')
-    
-    # Find favorite product (most ordered)
-    product_counts = {}
-    for order in orders:
-        order_id = order['id']
-        lines = await db.order_lines.find({"order_id": order_id}, {"_id": 0}).to_list(1000)
-        for line in lines:
-            pid = line['product_id']
-            product_counts[pid] = product_counts.get(pid, 0) + line['quantity']
+    # Same sales order stats as the lifecycle job (utils/customer_lifecycle.py)
+    rows = await db.orders.aggregate(order_stats_pipeline([customer_id])).to_list(1)
+    stats = rows[0] if rows else {"count": 0, "total": 0, "last": None}
+    
+    # Find favorite product (most ordered) - one pipeline on the customer's lines
+    collection, pipeline = order_lines_pipeline(
+        EMBEDDED_LINES,
+        {"customer_id": customer_id, "status": {"$in": SALES_ORDER_STATUSES}},
+        [
+            {"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}}},
+            {"$sort": {"quantity": -1, "_id": 1}},
+            {"$limit": 1}
+        ]
+    )
+    favorite = await db[collection].aggregate(pipeline).to_list(1)
     
     favorite_product = None
-    if product_counts:
-        fav_id = max(product_counts, key=product_counts.get)
-        fav_prod = await db.products.find_one({"id": fav_id}, {"_id": 0})
+    if favorite:
+        fav_prod = await db.products.find_one({"id": favorite[0]['_id']}, {"_id": 0, "name": 1})
         if fav_prod:
             favorite_product = fav_prod['name']
     
-    # Determine status based on activity
-    status = "Active" if order_count > 0 else "New"
-    last_order_date_str = None
-    if order_count >= 10:
-        status = "VIP"
-    elif last_order_date:
-        if isinstance(last_order_date, str):
-            last_order_date_str = last_order_date
-            last_order_date = datetime.fromisoformat(last_order_date)
-        else:
-            last_order_date_str = last_order_date.isoformat()
-        
-        days_since = (datetime.now(timezone.utc) - last_order_date).days
-        if days_since > 90:
-            status = "Inactive"
-    
+    inactive_before = (datetime.now(timezone.utc) - timedelta(days=INACTIVE_AFTER_DAYS)).isoformat()
     await db.customers.update_one(
         {"id": customer_id},
         {"$set": {
-            "total_value": total_value,
-            "order_count": order_count,
+            "total_value": stats['total'],
+            "order_count": stats['count'],
             "favorite_product": favorite_product,
-            "last_order_date": last_order_date_str,
-            "status": status
+            "last_order_date": stats['last']
         }}
     )
+    # Lead/Lost are set by hand and kept, as the lifecycle job does
+    await db.customers.update_one(
+        {"id": customer_id, "status": {"$nin": MANUAL_STATUSES}},
+        {"$set": {"status": lifecycle_status(stats, inactive_before)}}
+    )
 
 async def create_timeline_entry(customer_id: str, type: str, description: str):
     """Create a customer timeline entry"""
@@ -715,6 +865,10 @@ async def send_email(to_email: str, subject: str, body: str, html_body: str = No
         return False
     
     try:
+        import aiosmtplib
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        
         message = MIMEMultipart('alternative')
         message['From'] = EMAIL_FROM
         message['To'] = to_email
@@ -968,8 +1122,23 @@ ZenVit CRM System
 </html>
     """
     
-    await send_email(admin_email, subject, body, html_body)
+    return await send_email(admin_email, subject, body, html_body)
 
+async def notify_task_deadline(task: dict):
+    """Deadline reminder for a task (called once per deadline by task_scheduler)"""
+    due = task['due_date']
+    if isinstance(due, str):
+        due = datetime.fromisoformat(due)
+    sent = await send_task_deadline_notification(task['title'], due.strftime('%d.%m.%Y %H:%M'), task.get('priority', 'Medium'))
+    if not sent:
+        # The scheduler only marks the deadline notified when this returns
+        raise RuntimeError(f"Deadline reminder for task {task['id']} was not sent")
+
+# Fires notify_task_deadline TASK_REMINDER_HOURS before each open task's due date
+task_scheduler = TaskDeadlineScheduler(db, notify_task_deadline, lead_time=timedelta(hours=TASK_REMINDER_HOURS))
+
+# Releases stock reservations of orders that were never completed or cancelled
+reservation_sweeper = ReservationSweeper(db)
 
 # ============================================================================
 # HEALTH CHECK & SYSTEM STATUS
@@ -1085,21 +1254,7 @@ async def get_products(current_user: User = Depends(get_current_user)):
 @api_router.post("/products", response_model=Product, status_code=status.HTTP_201_CREATED)
 async def create_product(product_create: ProductCreate, current_user: User = Depends(get_current_user)):
     # Validate required fields
-    if len(product_create.name) < 2:
-        raise HTTPException(status_code=400, detail="Product name must be at least 2 characters")
-    
-    if product_create.price < 0:
-        raise HTTPException(status_code=400, detail="Price cannot be negative")
-    
-    if product_create.cost < 0:
-        raise HTTPException(status_code=400, detail="Cost cannot be negative")
-    
-    if product_create.min_stock < 0:
-        raise HTTPException(status_code=400, detail="Minimum stock must be positive")
-    
-    # Validate EAN if provided
-    if product_create.ean and not product_create.ean.isdigit():
-        raise HTTPException(status_code=400, detail="EAN must contain only digits")
+    validate_product_create(product_create)
     
     # Generate SKU automatically
     sku = await generate_sku(product_create.category)
@@ -1119,25 +1274,15 @@ async def create_product(product_create: ProductCreate, current_user: User = Dep
     stock_doc['last_updated'] = stock_doc['last_updated'].isoformat()
     await db.stock.insert_one(stock_doc)
     
+    await link_image_to_product(product.image_url, product.id)
+    await bump_catalog_version()
+    
     return product
 
 @api_router.put("/products/{product_id}", response_model=Product)
 async def update_product(product_id: str, product_update: ProductCreate, current_user: User = Depends(get_current_user)):
     # Validate fields
-    if len(product_update.name) < 2:
-        raise HTTPException(status_code=400, detail="Product name must be at least 2 characters")
-    
-    if product_update.price < 0:
-        raise HTTPException(status_code=400, detail="Price cannot be negative")
-    
-    if product_update.cost < 0:
-        raise HTTPException(status_code=400, detail="Cost cannot be negative")
-    
-    if product_update.min_stock < 0:
-        raise HTTPException(status_code=400, detail="Minimum stock must be positive")
-    
-    if product_update.ean and not product_update.ean.isdigit():
-        raise HTTPException(status_code=400, detail="EAN must contain only digits")
+    validate_product_create(product_update)
     
     # Get current product to preserve SKU
     current_product = await db.products.find_one({"id": product_id}, {"_id": 0})
@@ -1155,6 +1300,9 @@ async def update_product(product_id: str, product_update: ProductCreate, current
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    await link_image_to_product(product_update.image_url, product_id)
+    await bump_catalog_version()
+    
     updated = await db.products.find_one({"id": product_id}, {"_id": 0})
     if isinstance(updated.get('created_at'), str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
@@ -1168,41 +1316,122 @@ async def delete_product(product_id: str, current_user: User = Depends(get_curre
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await bump_catalog_version()
     return None
 
 
-@api_router.post("/upload-image")
-async def upload_image(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    """Upload a product image and return the URL"""
+# The handler parses the multipart body itself, so the schema is declared here
+IMAGE_UPLOAD_OPENAPI = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}}
+}}}}}
+
+@api_router.post("/upload-image", openapi_extra=IMAGE_UPLOAD_OPENAPI)
+async def upload_image(request: Request, product_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """
+    Upload a product image (multipart field `file`) and return the URL.
+    The body is parsed as it arrives and the file streamed to disk while
+    hashing, stored as <sha256>.<ext> - re-uploading the same image returns
+    the existing file, and oversized uploads are cut off at the limit.
+    """
+    # Reject declared oversized uploads before reading anything
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > MAX_IMAGE_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=str(UploadTooLargeError(MAX_IMAGE_UPLOAD_BYTES)))
+    
     try:
-        # Validate file type
-        allowed_types = ["image/jpeg", "image/png", "image/jpg", "image/webp"]
-        if file.content_type not in allowed_types:
-            raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG, PNG, and WebP are allowed.")
-        
-        # Create uploads directory if it doesn't exist
-        upload_dir = Path("/app/backend/uploads/products")
-        upload_dir.mkdir(parents=True, exist_ok=True)
+        stored = await receive_multipart_upload(
+            request.stream(), request.headers.get("content-type"), "file", PRODUCT_UPLOAD_DIR,
+            IMAGE_EXTENSIONS, MAX_IMAGE_UPLOAD_BYTES, MAX_IMAGE_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+        )
+        image_url = f"/uploads/products/{stored['filename']}"
         
-        # Generate unique filename
-        file_ext = file.filename.split(".")[-1]
-        unique_filename = f"{uuid.uuid4()}.{file_ext}"
-        file_path = upload_dir / unique_filename
+        update = {
+            "$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "url": image_url,
+                "filename": stored['filename'],
+                "content_type": stored['content_type'],
+                "size": stored['size'],
+                "uploaded_by": current_user.email,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            },
+            "$set": {"last_uploaded_at": datetime.now(timezone.utc).isoformat()}
+        }
+        if product_id:
+            update["$addToSet"] = {"product_ids": product_id}
+        await db.image_assets.update_one({"hash": stored['sha256']}, update, upsert=True)
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
+        # Render thumbnail/card/detail variants in the image process pool
+        if stored['created']:
+            run_in_background(pregenerate_variants(PRODUCT_UPLOAD_DIR / stored['filename'], IMAGE_VARIANT_DIR))
         
         # Return the relative URL
-        image_url = f"/uploads/products/{unique_filename}"
-        return {"image_url": image_url, "message": "Image uploaded successfully"}
+        return {
+            "image_url": image_url,
+            "variants": {variant: f"/images/{variant}/{stored['filename']}" for variant in IMAGE_VARIANTS},
+            "hash": stored['sha256'],
+            "size": stored['size'],
+            "deduplicated": not stored['created'],
+            "message": "Image uploaded successfully"
+        }
     
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logging.error(f"Error uploading image: {e}")
         raise HTTPException(status_code=500, detail=f"Error uploading image: {str(e)}")
 
 
+async def cached_file_response(request: Request, path: Path, media_type: str) -> Response:
+    """Serve an immutable file with ETag/304 and single-range (206) support"""
+    stat_result = path.stat()
+    etag = f'"{stat_result.st_size:x}-{int(stat_result.st_mtime):x}"'
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag, "Accept-Ranges": "bytes"}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        byte_range = parse_range_header(request.headers.get("range"), stat_result.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat_result.st_size}"})
+    
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    
+    start, end = byte_range
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        content = await f.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+    return Response(content=content, status_code=206, media_type=media_type, headers=headers)
+
+@app.get("/images/{variant}/{filename}")
+async def get_image_variant(variant: str, filename: str, request: Request):
+    """
+    Resized WebP variant (thumbnail/card/detail) of an uploaded product image.
+    Rendered on first request if the upload-time render has not run yet.
+    """
+    if variant not in IMAGE_VARIANTS or not is_safe_image_filename(filename):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    source = PRODUCT_UPLOAD_DIR / filename
+    if not source.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    try:
+        path = await ensure_variant(source, IMAGE_VARIANT_DIR, variant)
+    except Exception as e:
+        logging.error(f"Error rendering {variant} variant of {filename}: {e}")
+        raise HTTPException(status_code=500, detail="Could not render image")
+    
+    return await cached_file_response(request, path, "image/webp")
+
+
 # Continuing in next part due to size...
 # The file continues with STOCK, SUPPLIERS, PURCHASES, CUSTOMERS, ORDERS, TASKS, EXPENSES, DASHBOARD, and REPORTS routes
 
@@ -1233,6 +1462,8 @@ async def get_stock(current_user: User = Depends(get_current_user)):
             "product_cost": product.get('cost_price') or product.get('cost', 0),
             "product_color": product.get('color_hex') or product.get('color'),
             "quantity": product.get('stock_quantity', 0),
+            "reserved": product.get('reserved_quantity', 0),
+            "available": product.get('stock_quantity', 0) - product.get('reserved_quantity', 0),
             "min_stock": product.get('minimum_stock') or product.get('min_stock', 50),
             "status": "OK" if product.get('stock_quantity', 0) > product.get('minimum_stock', 50) else "Low" if product.get('stock_quantity', 0) > 0 else "Out",
             "last_updated": product.get('updated_at', datetime.now(timezone.utc).isoformat())
@@ -1245,8 +1476,23 @@ async def get_stock(current_user: User = Depends(get_current_user)):
     
     return stock_items
 
+@api_router.get("/stock/available", response_model=Dict[str, Dict[str, int]])
+async def get_available_to_promise(
+    product_id: Optional[List[str]] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Available-to-promise per product: on hand minus what open orders have reserved.
+    Repeat product_id to limit the answer to those products.
+    """
+    return await available_to_promise(db, product_id)
+
 @api_router.put("/stock/{product_id}", response_model=Dict[str, Any])
 async def update_stock(product_id: str, stock_update: StockUpdate, current_user: User = Depends(get_current_user)):
+    current = await db.stock.find_one({"product_id": product_id}, {"_id": 0, "quantity": 1})
+    if not current:
+        raise HTTPException(status_code=404, detail="Stock not found")
+    
     update_data = {"quantity": stock_update.quantity, "last_updated": datetime.now(timezone.utc).isoformat()}
     if stock_update.min_stock is not None:
         update_data["min_stock"] = stock_update.min_stock
@@ -1262,8 +1508,13 @@ async def update_stock(product_id: str, stock_update: StockUpdate, current_user:
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Stock not found")
     
-    # Create stock movement
-    await create_stock_movement(product_id, "IN", stock_update.quantity, note="Manual adjustment")
+    # Log the difference (not the new total) so the ledger stays replayable
+    change = stock_update.quantity - current.get('quantity', 0)
+    await create_stock_movement(product_id, "ADJUST", change, note="Manual adjustment")
+    await db.products.update_one(
+        {"id": product_id},
+        {"$inc": {"stock_quantity": change}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
     
     updated = await db.stock.find_one({"product_id": product_id}, {"_id": 0})
     if isinstance(updated.get('last_updated'), str):
@@ -1285,12 +1536,13 @@ async def update_stock(product_id: str, stock_update: StockUpdate, current_user:
 async def get_stock_movements(product_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
     query = {"product_id": product_id} if product_id else {}
     movements = await db.stock_movements.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
+    products = await products_by_id((m['product_id'] for m in movements), {"id": 1, "name": 1})
     
     for mov in movements:
         if isinstance(mov.get('date'), str):
             mov['date'] = datetime.fromisoformat(mov['date'])
         
-        product = await db.products.find_one({"id": mov['product_id']}, {"_id": 0})
+        product = products.get(mov['product_id'])
         if product:
             mov['product_name'] = product['name']
     
@@ -1303,7 +1555,7 @@ async def get_stock_movements_alt(product_id: Optional[str] = None, current_user
 
 @api_router.post("/stock-movements", response_model=StockMovement, status_code=status.HTTP_201_CREATED)
 async def create_movement(movement_create: StockMovementCreate, current_user: User = Depends(get_current_user)):
-    await create_stock_movement(
+    movement = await create_stock_movement(
         movement_create.product_id,
         movement_create.type,
         movement_create.quantity,
@@ -1312,15 +1564,10 @@ async def create_movement(movement_create: StockMovementCreate, current_user: Us
         movement_create.note
     )
     
-    # Update stock
-    multiplier = 1 if movement_create.type == "IN" else -1
-    await db.stock.update_one(
-        {"product_id": movement_create.product_id},
-        {"$inc": {"quantity": multiplier * movement_create.quantity}}
-    )
-    await update_stock_status(movement_create.product_id)
+    # Update stock by the same signed change the ledger reads back
+    await apply_stock_change(movement_create.product_id, signed_change(movement))
     
-    return StockMovement(**movement_create.model_dump())
+    return StockMovement(**movement)
 
 
 # ============================================================================
@@ -1328,7 +1575,17 @@ async def create_movement(movement_create: StockMovementCreate, current_user: Us
 # ============================================================================
 
 @api_router.post("/stock/adjust", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED)
-async def adjust_stock(adjustment: StockAdjustmentCreate, current_user: User = Depends(get_current_user)):
+async def adjust_stock(
+    adjustment: StockAdjustmentCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await idempotent_write(
+        idempotency_key, f"stock-adjust:{current_user.id}", adjustment.model_dump(),
+        lambda: apply_stock_adjustment(adjustment, current_user)
+    )
+
+async def apply_stock_adjustment(adjustment: StockAdjustmentCreate, current_user: User):
     """
     Manually adjust stock quantity (positive or negative).
     Used for corrections, damages, losses, etc.
@@ -1361,14 +1618,7 @@ async def adjust_stock(adjustment: StockAdjustmentCreate, current_user: User = D
     }
     await db.stock_adjustments.insert_one(adjustment_record)
     
-    # Update Product.stock_quantity directly
-    await db.products.update_one(
-        {"id": adjustment.product_id},
-        {
-            "$inc": {"stock_quantity": adjustment.change},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-        }
-    )
+    await apply_stock_change(adjustment.product_id, adjustment.change)
     
     # Create StockMovement
     movement = {
@@ -1406,13 +1656,14 @@ async def get_stock_adjustments(
     """Get stock adjustment history"""
     query = {"product_id": product_id} if product_id else {}
     adjustments = await db.stock_adjustments.find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+    products = await products_by_id((a['product_id'] for a in adjustments), {"id": 1, "name": 1, "sku": 1})
     
     for adj in adjustments:
         if isinstance(adj.get('created_at'), str):
             adj['created_at'] = datetime.fromisoformat(adj['created_at'])
         
         # Add product info
-        product = await db.products.find_one({"id": adj['product_id']}, {"_id": 0})
+        product = products.get(adj['product_id'])
         if product:
             adj['product_name'] = product['name']
             adj['product_sku'] = product['sku']
@@ -1458,6 +1709,173 @@ async def get_low_stock_products(current_user: User = Depends(get_current_user))
     return low_stock
 
 
+# ============================================================================
+# STOCK LEDGER ROUTES
+# ============================================================================
+
+STOCK_SNAPSHOT_PERIODS = ["day", "month"]
+
+@api_router.get("/stock/as-of", response_model=Dict[str, Any])
+async def get_stock_as_of(
+    date: str,
+    product_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stock per product at a point in time, rebuilt from stock_movements.
+    A plain date (YYYY-MM-DD) means end of that day (UTC).
+    Starts from the nearest snapshot so only newer movements are replayed.
+    """
+    try:
+        as_of = parse_report_date(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date. Use ISO format (YYYY-MM-DD)")
+    if len(date) == 10:
+        as_of += timedelta(days=1)
+    
+    ledger = await stock_as_of(db, as_of.isoformat(), product_id)
+    
+    product_ids = list(ledger['quantities'].keys())
+    products = await db.products.find(
+        {"id": {"$in": product_ids}},
+        {"_id": 0, "id": 1, "name": 1, "sku": 1}
+    ).to_list(len(product_ids))
+    products_by_id = {p['id']: p for p in products}
+    
+    items = []
+    for pid, quantity in ledger['quantities'].items():
+        product = products_by_id.get(pid, {})
+        items.append({
+            "product_id": pid,
+            "product_name": product.get('name', 'Unknown'),
+            "product_sku": product.get('sku'),
+            "quantity": quantity
+        })
+    items.sort(key=lambda x: x['product_name'])
+    
+    return {
+        "as_of": ledger['as_of'],
+        "snapshot_as_of": ledger['snapshot_as_of'],
+        "replayed_movements": ledger['replayed_movements'],
+        "items": items
+    }
+
+@api_router.post("/stock/snapshots/compact", response_model=Dict[str, Any])
+async def compact_stock_snapshots(
+    period: str = "day",
+    keep_daily_days: int = Query(90, ge=1),
+    current_user: User = Depends(get_current_user)
+):
+    """Fold stock movements into snapshots up to the start of today (UTC)"""
+    if period not in STOCK_SNAPSHOT_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {STOCK_SNAPSHOT_PERIODS}")
+    
+    runs = await compact_stock_ledger(db, period=period)
+    pruned = await prune_snapshots(db, keep_daily_days)
+    
+    return {
+        "snapshots_created": len(runs),
+        "movements_folded": sum(run['movements_folded'] for run in runs),
+        "latest_snapshot": runs[-1]['as_of'] if runs else None,
+        "snapshots_pruned": pruned
+    }
+
+
+async def reconcile_stock(repair: bool = False) -> Dict[str, Any]:
+    """
+    Compare db.stock.quantity and products.stock_quantity with the quantity
+    rebuilt from stock_movements. With repair=True both stores are set to
+    the ledger value in bulk.
+    
+    Products the ledger cannot vouch for are flagged instead of repaired:
+    stock without any movements ("no_movements") and ledgers containing
+    legacy absolute "Manual adjustment" entries ("absolute_entries").
+    """
+    ledger = await ledger_summary(db)
+    
+    products = await db.products.find(
+        {}, {"_id": 0, "id": 1, "name": 1, "sku": 1, "stock_quantity": 1}
+    ).to_list(None)
+    stock_by_product = {
+        s['product_id']: s
+        for s in await db.stock.find({}, {"_id": 0, "product_id": 1, "quantity": 1, "min_stock": 1}).to_list(None)
+    }
+    
+    drift = []
+    product_ops = []
+    stock_ops = []
+    now = datetime.now(timezone.utc).isoformat()
+    for product in products:
+        pid = product['id']
+        summary = ledger.get(pid)
+        ledger_quantity = summary['quantity'] if summary else 0
+        stock = stock_by_product.get(pid)
+        stock_quantity = stock.get('quantity', 0) if stock else None
+        product_quantity = product.get('stock_quantity', 0)
+        
+        if product_quantity == ledger_quantity and stock_quantity in (None, ledger_quantity):
+            continue
+        
+        flag = None
+        if summary is None:
+            flag = "no_movements"
+        elif summary['absolute_entries']:
+            flag = "absolute_entries"
+        drift.append({
+            "product_id": pid,
+            "product_name": product.get('name'),
+            "product_sku": product.get('sku'),
+            "ledger_quantity": ledger_quantity,
+            "stock_quantity": stock_quantity,
+            "product_stock_quantity": product_quantity,
+            "stock_drift": None if stock_quantity is None else stock_quantity - ledger_quantity,
+            "product_drift": product_quantity - ledger_quantity,
+            "flag": flag
+        })
+        if flag:
+            continue
+        if product_quantity != ledger_quantity:
+            product_ops.append(UpdateOne(
+                {"id": pid},
+                {"$set": {"stock_quantity": ledger_quantity, "updated_at": now}}
+            ))
+        if stock is not None and stock_quantity != ledger_quantity:
+            stock_ops.append(UpdateOne(
+                {"product_id": pid},
+                {"$set": {
+                    "quantity": ledger_quantity,
+                    "status": calculate_stock_status(ledger_quantity, stock.get('min_stock', 80)),
+                    "last_updated": now
+                }}
+            ))
+    
+    if repair:
+        if product_ops:
+            await db.products.bulk_write(product_ops, ordered=False)
+        if stock_ops:
+            await db.stock.bulk_write(stock_ops, ordered=False)
+    
+    return {
+        "checked_products": len(products),
+        "drifting_products": len(drift),
+        "flagged_products": sum(1 for item in drift if item['flag']),
+        "repaired": repair,
+        "products_updated": len(product_ops) if repair else 0,
+        "stock_updated": len(stock_ops) if repair else 0,
+        "drift": drift
+    }
+
+@api_router.get("/stock/reconcile", response_model=Dict[str, Any])
+async def get_stock_drift(current_user: User = Depends(get_current_user)):
+    """Report products whose stored stock differs from the movement ledger"""
+    return await reconcile_stock(repair=False)
+
+@api_router.post("/stock/reconcile", response_model=Dict[str, Any])
+async def repair_stock_drift(current_user: User = Depends(get_current_user)):
+    """Set db.stock and products.stock_quantity to the movement ledger quantities"""
+    return await reconcile_stock(repair=True)
+
+
 # ============================================================================
 # SUPPLIER ROUTES
 # ============================================================================
@@ -1507,19 +1925,27 @@ async def delete_supplier(supplier_id: str, current_user: User = Depends(get_cur
 @api_router.get("/purchases", response_model=List[Dict[str, Any]])
 async def get_purchases(current_user: User = Depends(get_current_user)):
     purchases = await db.purchases.find({}, {"_id": 0}).sort("date", -1).to_list(1000)
+    # Embedded lines as stored, the rest from purchase_lines in one query
+    await attach_lines(db, "purchases", purchases)
     
     for p in purchases:
         if isinstance(p.get('date'), str):
             p['date'] = datetime.fromisoformat(p['date'])
-        
-        # Get purchase lines
-        lines = await db.purchase_lines.find({"purchase_id": p['id']}, {"_id": 0}).to_list(1000)
-        p['lines'] = lines
     
     return purchases
 
 @api_router.post("/purchases", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED)
-async def create_purchase(purchase_create: PurchaseCreate, current_user: User = Depends(get_current_user)):
+async def create_purchase(
+    purchase_create: PurchaseCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await idempotent_write(
+        idempotency_key, f"purchases:{current_user.id}", purchase_create.model_dump(),
+        lambda: record_purchase(purchase_create)
+    )
+
+async def record_purchase(purchase_create: PurchaseCreate):
     supplier = await db.suppliers.find_one({"id": purchase_create.supplier_id}, {"_id": 0})
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
@@ -1557,11 +1983,14 @@ async def create_purchase(purchase_create: PurchaseCreate, current_user: User =
     # Save purchase
     purchase_doc = purchase.model_dump()
     purchase_doc['date'] = purchase_doc['date'].isoformat()
+    if EMBEDDED_LINES:
+        purchase_doc['lines'] = [embedded_line(line) for line in lines]
     await db.purchases.insert_one(purchase_doc)
     
-    # Save lines (make a copy to avoid modifying the original)
-    lines_to_save = [line.copy() for line in lines]
-    await db.purchase_lines.insert_many(lines_to_save)
+    if not EMBEDDED_LINES:
+        # Save lines (make a copy to avoid modifying the original)
+        lines_to_save = [line.copy() for line in lines]
+        await db.purchase_lines.insert_many(lines_to_save)
     
     # Remove MongoDB's _id field if it exists to prevent BSON serialization error
     purchase_doc.pop('_id', None)
@@ -1581,22 +2010,15 @@ async def receive_purchase(purchase_id: str, current_user: User = Depends(get_cu
             detail="Stock has already been applied for this purchase. Cannot receive twice."
         )
     
-    # Get purchase lines
-    lines = await db.purchase_lines.find({"purchase_id": purchase_id}, {"_id": 0}).to_list(1000)
+    # Get purchase lines (embedded or from purchase_lines)
+    lines = await parent_lines(db, "purchases", purchase)
     
     if not lines:
         raise HTTPException(status_code=400, detail="No items in purchase")
     
     # Apply stock changes atomically for all items
     for line in lines:
-        # Update Product.stock_quantity directly
-        await db.products.update_one(
-            {"id": line['product_id']},
-            {
-                "$inc": {"stock_quantity": line['quantity']},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-            }
-        )
+        await apply_stock_change(line['product_id'], line['quantity'])
         
         # Create StockMovement with new structure
         movement = {
@@ -1696,6 +2118,28 @@ async def get_customer_timeline(customer_id: str, current_user: User = Depends(g
             t['date'] = datetime.fromisoformat(t['date'])
     return timeline
 
+@api_router.get("/customers/{customer_id}/products", response_model=List[Dict[str, Any]])
+async def get_customer_products(customer_id: str, current_user: User = Depends(get_current_user)):
+    """Products the customer has bought - quantity, revenue, order count and last purchase"""
+    collection, pipeline = order_lines_pipeline(EMBEDDED_LINES, {
+        "customer_id": customer_id, "status": {"$in": SALES_ORDER_STATUSES}
+    }, [
+        {"$group": {
+            "_id": "$product_id",
+            "product_name": {"$first": "$product_name"},
+            "quantity": {"$sum": "$quantity"},
+            "revenue": {"$sum": "$line_total"},
+            "orders": {"$addToSet": "$order_id"},
+            "last_purchased": {"$max": "$date"}
+        }},
+        {"$project": {
+            "_id": 0, "product_id": "$_id", "product_name": 1, "quantity": 1, "revenue": 1,
+            "orders": {"$size": "$orders"}, "last_purchased": 1
+        }},
+        {"$sort": {"quantity": -1, "product_id": 1}}
+    ])
+    return await db[collection].aggregate(pipeline).to_list(1000)
+
 
 # ============================================================================
 # ORDER ROUTES
@@ -1704,21 +2148,29 @@ async def get_customer_timeline(customer_id: str, current_user: User = Depends(g
 @api_router.get("/orders", response_model=List[Dict[str, Any]])
 async def get_orders(current_user: User = Depends(get_current_user)):
     orders = await db.orders.find({}, {"_id": 0}).sort("date", -1).to_list(1000)
+    # Embedded lines as stored, the rest from order_lines in one query
+    await attach_lines(db, "orders", orders)
     
     for o in orders:
         if isinstance(o.get('date'), str):
             o['date'] = datetime.fromisoformat(o['date'])
         if o.get('payment_date') and isinstance(o['payment_date'], str):
             o['payment_date'] = datetime.fromisoformat(o['payment_date'])
-        
-        # Get order lines
-        lines = await db.order_lines.find({"order_id": o['id']}, {"_id": 0}).to_list(1000)
-        o['lines'] = lines
     
     return orders
 
 @api_router.post("/orders", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED)
-async def create_order(order_create: OrderCreate, current_user: User = Depends(get_current_user)):
+async def create_order(
+    order_create: OrderCreate,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await idempotent_write(
+        idempotency_key, f"orders:{current_user.id}", order_create.model_dump(),
+        lambda: place_order(order_create)
+    )
+
+async def place_order(order_create: OrderCreate):
     customer = await db.customers.find_one({"id": order_create.customer_id}, {"_id": 0})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
@@ -1769,18 +2221,36 @@ async def create_order(order_create: OrderCreate, current_user: User = Depends(g
         
         order_total += line_total
         cost_total += cost_price * quantity
-        
-        # Update stock
-        await db.stock.update_one(
-            {"product_id": product['id']},
-            {"$inc": {"quantity": -quantity}}
-        )
-        await update_stock_status(product['id'])
-        await create_stock_movement(product['id'], "OUT", quantity, order_id=order.id, note="Order created")
-        
-        # AUTOMATION: Check if stock is low and create task
-        await check_and_create_low_stock_task(product['id'])
     
+    # Hold the stock until the order is completed or cancelled (all lines or none).
+    # On-hand stock and the ledger only change when the order ships.
+    try:
+        await reserve_stock(db, order.id, lines, ttl=timedelta(hours=STOCK_RESERVATION_TTL_HOURS))
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        order_doc = await save_order(order, customer, lines, order_total, cost_total)
+    except BaseException:
+        # Don't leave the hold to the sweeper when the order was never saved
+        await db.orders.delete_one({"id": order.id})
+        await release_reservations(db, order.id)
+        raise
+    
+    # Update customer stats
+    await update_customer_stats(customer['id'])
+    
+    # Create timeline entry
+    await create_timeline_entry(customer['id'], "Order", f"New order created: {order.id[:8]} - {order_doc['order_total']:.2f} kr")
+    
+    # Send email notification for new order
+    await send_new_order_notification(order.id, customer['name'], order_doc['order_total'])
+    
+    return {**order_doc, "lines": lines}
+
+async def save_order(order: Order, customer: Dict[str, Any], lines: List[Dict[str, Any]],
+                     order_total: float, cost_total: float) -> Dict[str, Any]:
+    """Insert the order and its lines in the configured layout"""
     # Calculate profit
     order_total += order.shipping_paid_by_customer
     cost_total += order.shipping_cost
@@ -1798,25 +2268,22 @@ async def create_order(order_create: OrderCreate, current_user: User = Depends(g
     order_doc['date'] = order_doc['date'].isoformat()
     if order_doc.get('payment_date'):
         order_doc['payment_date'] = order_doc['payment_date'].isoformat()
+    if EMBEDDED_LINES:
+        order_doc['lines'] = [embedded_line(line) for line in lines]
     await db.orders.insert_one(order_doc)
     
-    # Save lines (make a copy to avoid modifying the original)
-    lines_to_save = [line.copy() for line in lines]
-    await db.order_lines.insert_many(lines_to_save)
-    
-    # Update customer stats
-    await update_customer_stats(customer['id'])
-    
-    # Create timeline entry
-    await create_timeline_entry(customer['id'], "Order", f"New order created: {order.id[:8]} - {order_total:.2f} kr")
-    
-    # Send email notification for new order
-    await send_new_order_notification(order.id, customer['name'], order_total)
+    if not EMBEDDED_LINES:
+        for line in lines:
+            line.update(order_line_fields(order_doc))
+        
+        # Save lines (make a copy to avoid modifying the original)
+        lines_to_save = [line.copy() for line in lines]
+        await db.order_lines.insert_many(lines_to_save)
     
     # Remove MongoDB's _id field if it exists to prevent BSON serialization error
     order_doc.pop('_id', None)
     
-    return {**order_doc, "lines": lines}
+    return order_doc
 
 @api_router.put("/orders/{order_id}/status")
 async def update_order_status(order_id: str, status: str, current_user: User = Depends(get_current_user)):
@@ -1824,53 +2291,26 @@ async def update_order_status(order_id: str, status: str, current_user: User = D
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    # CRITICAL: Handle COMPLETED status with stock reduction
-    if status == "COMPLETED" and not order.get('stock_applied', False):
-        # Get order lines
-        lines = await db.order_lines.find({"order_id": order_id}, {"_id": 0}).to_list(1000)
+    # CRITICAL: stock leaves when the order first ships (or is completed), once
+    stock_reduced = status in STOCK_COMMIT_STATUSES and not order.get('stock_applied', False)
+    if stock_reduced:
+        # Get order lines (embedded or from order_lines)
+        lines = await parent_lines(db, "orders", order)
         
         if not lines:
             raise HTTPException(status_code=400, detail="No items in order")
         
-        # Validate stock availability before reducing
-        for line in lines:
-            product = await db.products.find_one({"id": line['product_id']}, {"_id": 0})
-            if not product:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Product not found: {line['product_name']}"
-                )
-            current_stock = product.get('stock_quantity', 0)
-            if current_stock < line['quantity']:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Insufficient stock for {line['product_name']}. Available: {current_stock}, Required: {line['quantity']}"
-                )
+        # Move the reserved units out of stock; lines whose reservation expired
+        # are taken from available stock, all or nothing
+        try:
+            await commit_reservations(db, order_id, lines)
+        except InsufficientStockError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Apply stock changes atomically
         for line in lines:
-            # Reduce Product.stock_quantity directly
-            new_quantity_result = await db.products.find_one_and_update(
-                {"id": line['product_id']},
-                {
-                    "$inc": {"stock_quantity": -line['quantity']},
-                    "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-                },
-                return_document=True,
-                projection={"_id": 0}
-            )
-            
-            # Double-check quantity didn't go negative (safety check)
-            if new_quantity_result and new_quantity_result.get('stock_quantity', 0) < 0:
-                # Rollback this change
-                await db.products.update_one(
-                    {"id": line['product_id']},
-                    {"$inc": {"stock_quantity": line['quantity']}}
-                )
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Stock went negative for {line['product_name']}. Transaction aborted."
-                )
+            await update_stock_status(line['product_id'])
+            # AUTOMATION: Check if stock is low and create task
+            await check_and_create_low_stock_task(line['product_id'])
             
             # Create StockMovement with new structure
             movement = {
@@ -1902,22 +2342,28 @@ async def update_order_status(order_id: str, status: str, current_user: User = D
             )
         
         # Update order with stock_applied flag
-        await db.orders.update_one(
-            {"id": order_id},
-            {
-                "$set": {
-                    "status": status,
-                    "stock_applied": True,
-                    "completed_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
-        )
+        update_data = {
+            "status": status,
+            "stock_applied": True,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        if status == "COMPLETED":
+            update_data["completed_at"] = update_data["updated_at"]
+        await db.orders.update_one({"id": order_id}, {"$set": update_data})
     else:
-        # Normal status update (not COMPLETED or already applied)
+        # Normal status update (not shipped yet, or stock already applied)
         await db.orders.update_one(
             {"id": order_id},
-            {"$set": {"status": status}}
+            {"$set": {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
+        if status in ("Cancelled", "Refund"):
+            # Stock held for the order becomes available again. Nothing left
+            # stock before shipping; returned goods are booked with /stock/adjust.
+            await release_reservations(db, order_id)
+    
+    if not EMBEDDED_LINES:
+        # Lines in order_lines carry the order status for line-level analytics
+        await db.order_lines.update_many({"order_id": order_id}, {"$set": {"status": status}})
     
     # If order is delivered, create follow-up task
     if status == "Delivered" or status == "COMPLETED":
@@ -1939,7 +2385,7 @@ async def update_order_status(order_id: str, status: str, current_user: User = D
                 task_doc['due_date'] = task_doc['due_date'].isoformat()
             await db.tasks.insert_one(task_doc)
     
-    return {"message": "Order status updated", "stock_reduced": status == "COMPLETED"}
+    return {"message": "Order status updated", "stock_reduced": stock_reduced}
 
 
 # ============================================================================
@@ -1967,18 +2413,24 @@ async def create_task(task_create: TaskCreate, current_user: User = Depends(get_
     if doc.get('due_date'):
         doc['due_date'] = doc['due_date'].isoformat()
     await db.tasks.insert_one(doc)
+    task_scheduler.schedule(doc)
     return task
 
 @api_router.put("/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: str, task_update: TaskCreate, current_user: User = Depends(get_current_user)):
+    update_data = task_update.model_dump()
+    if update_data.get('due_date'):
+        update_data['due_date'] = update_data['due_date'].isoformat()
+    
     result = await db.tasks.update_one(
         {"id": task_id},
-        {"$set": task_update.model_dump()}
+        {"$set": update_data}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Task not found")
     
     updated = await db.tasks.find_one({"id": task_id}, {"_id": 0})
+    task_scheduler.schedule(updated)
     if isinstance(updated.get('created_at'), str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     if updated.get('due_date') and isinstance(updated['due_date'], str):
@@ -1994,6 +2446,9 @@ async def update_task_status(task_id: str, status: str, current_user: User = Dep
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Task not found")
+    
+    task = await db.tasks.find_one({"id": task_id}, {"_id": 0})
+    task_scheduler.schedule(task)
     return {"message": "Task status updated"}
 
 @api_router.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -2001,6 +2456,7 @@ async def delete_task(task_id: str, current_user: User = Depends(get_current_use
     result = await db.tasks.delete_one({"id": task_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Task not found")
+    task_scheduler.remove(task_id)
     return None
 
 
@@ -2077,36 +2533,44 @@ async def get_dashboard(current_user: User = Depends(get_current_user)):
         "status": {"$in": ["Processing", "Packed", "Shipped", "Delivered"]}
     }, {"_id": 0}).to_list(1000)
     
-    product_sales = {}
-    product_profit = {}
+    # Per-product totals straight from the lines (they carry the order date and status)
+    collection, pipeline = order_lines_pipeline(
+        EMBEDDED_LINES,
+        {"date": {"$gte": month_ago}, "status": {"$in": SALES_ORDER_STATUSES}},
+        [{"$group": {
+            "_id": "$product_id",
+            "name": {"$first": "$product_name"},
+            "quantity": {"$sum": "$quantity"},
+            "revenue": {"$sum": "$line_total"},
+            "profit": {"$sum": "$line_profit"}
+        }}]
+    )
+    product_totals = await db[collection].aggregate(pipeline).to_list(None)
     
-    for order in recent_orders:
-        lines = await db.order_lines.find({"order_id": order['id']}, {"_id": 0}).to_list(1000)
-        for line in lines:
-            pid = line['product_id']
-            if pid not in product_sales:
-                product_sales[pid] = {"name": line['product_name'], "quantity": 0, "revenue": 0}
-                product_profit[pid] = {"name": line['product_name'], "profit": 0}
-            product_sales[pid]['quantity'] += line['quantity']
-            product_sales[pid]['revenue'] += line['line_total']
-            product_profit[pid]['profit'] += line['line_profit']
-    
-    best_sellers = sorted(product_sales.values(), key=lambda x: x['quantity'], reverse=True)[:5]
-    most_profitable = sorted(product_profit.values(), key=lambda x: x['profit'], reverse=True)[:5]
-    
-    # Customer segments
-    customers = await db.customers.find({}, {"_id": 0}).to_list(1000)
-    vip_customers = [c for c in customers if c.get('status') == 'VIP'][:5]
-    new_customers = sorted([c for c in customers if c.get('status') == 'New'], 
-                          key=lambda x: x.get('created_at', ''), reverse=True)[:5]
+    best_sellers = [
+        {"name": p['name'], "quantity": p['quantity'], "revenue": p['revenue']}
+        for p in sorted(product_totals, key=lambda x: x['quantity'], reverse=True)[:5]
+    ]
+    most_profitable = [
+        {"name": p['name'], "profit": p['profit']}
+        for p in sorted(product_totals, key=lambda x: x['profit'], reverse=True)[:5]
+    ]
+    
+    # Customer segments (status is kept current by the lifecycle batch job,
+    # so each segment is a small indexed query instead of a full scan)
+    vip_customers = await db.customers.find({"status": "VIP"}, {"_id": 0}).to_list(5)
+    new_customers = await db.customers.find(
+        {"status": "New"}, {"_id": 0}
+    ).sort("created_at", -1).to_list(5)
     
     # Customers needing follow-up
     inactive_threshold = (datetime.now(timezone.utc) - timedelta(days=60)).isoformat()
-    need_followup = [c for c in customers 
-                     if c.get('last_order_date') and c['last_order_date'] < inactive_threshold 
-                     and c.get('status') == 'Active'][:5]
+    need_followup = await db.customers.find({
+        "status": "Active",
+        "last_order_date": {"$ne": None, "$lt": inactive_threshold}
+    }, {"_id": 0}).to_list(5)
     
-    lost_customers = [c for c in customers if c.get('status') == 'Lost'][:5]
+    lost_customers = await db.customers.find({"status": "Lost"}, {"_id": 0}).to_list(5)
     
     # Monthly sales graph (last 6 months)
     monthly_sales = []
@@ -2335,6 +2799,32 @@ async def get_dashboard_kpis(current_user: User = Depends(get_current_user)):
     }
 
 
+@api_router.get("/dashboard/stream")
+async def dashboard_stream(request: Request, token: str):
+    """
+    Server-Sent Events with live KPI values for the dashboard.
+    Sends a full `snapshot` event first, then `delta` events with only the
+    changed values. The token is a query parameter because EventSource
+    cannot set an Authorization header.
+    """
+    await get_user_from_token(token)
+    
+    async def events():
+        async for message in dashboard_hub.subscribe():
+            if await request.is_disconnected():
+                break
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ============================================================================
 # REPORTS ROUTES
 # ============================================================================
@@ -2369,6 +2859,108 @@ async def get_daily_report(date: Optional[str] = None, current_user: User = Depe
         "low_stock_count": len(low_stock)
     }
 
+# Period key of an order per granularity. Dates are stored as UTC ISO
+# strings, so day and month are string prefixes; ISO weeks need the date
+# parsed (a malformed date becomes null instead of failing the report).
+REPORT_PERIOD_KEYS = {
+    "day": {"$substr": ["$date", 0, 10]},
+    "week": {"$dateToString": {
+        "format": "%G-W%V",  # ISO week, e.g. 2024-W07
+        "date": {"$dateFromString": {"dateString": "$date", "onError": None, "onNull": None}}
+    }},
+    "month": {"$substr": ["$date", 0, 7]},
+}
+ISO_DATE_PREFIX = r"^\d{4}-\d{2}-\d{2}"
+
+def parse_report_date(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+async def build_sales_report(start: datetime, end: datetime, granularity: Optional[str] = "day") -> Dict[str, Any]:
+    """
+    Sales/profit totals, time series and top products/customers for [start, end)
+    computed in a single aggregation inside MongoDB.
+    granularity=None leaves out the time series.
+    """
+    series = []
+    if granularity:
+        series = [
+            # Orders whose date is not an ISO date cannot be bucketed; they still count in the totals
+            {"$match": {"date": {"$regex": ISO_DATE_PREFIX}}},
+            {"$group": {
+                "_id": REPORT_PERIOD_KEYS[granularity],
+                "sales": {"$sum": "$order_total"},
+                "profit": {"$sum": "$profit"},
+                "orders": {"$sum": 1}
+            }},
+            {"$match": {"_id": {"$ne": None}}},
+            {"$sort": {"_id": 1}}
+        ]
+    
+    pipeline = [
+        {"$match": {
+            "date": {"$gte": start.isoformat(), "$lt": end.isoformat()},
+            "status": {"$in": SALES_ORDER_STATUSES}
+        }},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "sales": {"$sum": "$order_total"},
+                    "profit": {"$sum": "$profit"},
+                    "orders": {"$sum": 1}
+                }}
+            ],
+            "top_customers": [
+                {"$group": {
+                    "_id": "$customer_id",
+                    "name": {"$first": "$customer_name"},
+                    "orders": {"$sum": 1},
+                    "revenue": {"$sum": "$order_total"}
+                }},
+                {"$sort": {"revenue": -1}},
+                {"$limit": 10}
+            ],
+            "top_products": [
+                *lookup_order_lines(EMBEDDED_LINES),
+                {"$unwind": "$lines"},
+                {"$group": {
+                    "_id": "$lines.product_id",
+                    "name": {"$first": "$lines.product_name"},
+                    "quantity": {"$sum": "$lines.quantity"},
+                    "revenue": {"$sum": "$lines.line_total"}
+                }},
+                {"$sort": {"revenue": -1}},
+                {"$limit": 10}
+            ],
+            **({"series": series} if series else {})
+        }}
+    ]
+    
+    result = await db.orders.aggregate(pipeline, allowDiskUse=True).to_list(1)
+    facets = result[0] if result else {}
+    totals = facets.get('totals') or [{"sales": 0, "profit": 0, "orders": 0}]
+    
+    return {
+        "sales": round(totals[0]['sales'], 2),
+        "profit": round(totals[0]['profit'], 2),
+        "orders_count": totals[0]['orders'],
+        "series": [
+            {"period": p['_id'], "sales": round(p['sales'], 2), "profit": round(p['profit'], 2), "orders": p['orders']}
+            for p in facets.get('series', [])
+        ],
+        "top_products": [
+            {"name": p['name'], "quantity": p['quantity'], "revenue": p['revenue']}
+            for p in facets.get('top_products', [])
+        ],
+        "top_customers": [
+            {"name": c['name'], "orders": c['orders'], "revenue": c['revenue']}
+            for c in facets.get('top_customers', [])
+        ]
+    }
+
 @api_router.get("/reports/monthly")
 async def get_monthly_report(month: Optional[int] = None, year: Optional[int] = None, current_user: User = Depends(get_current_user)):
     now = datetime.now(timezone.utc)
@@ -2381,48 +2973,319 @@ async def get_monthly_report(month: Optional[int] = None, year: Optional[int] =
     else:
         month_end = datetime(target_year, target_month + 1, 1, tzinfo=timezone.utc)
     
-    orders = await db.orders.find({
-        "date": {"$gte": month_start.isoformat(), "$lt": month_end.isoformat()},
-        "status": {"$in": ["Processing", "Packed", "Shipped", "Delivered"]}
-    }, {"_id": 0}).to_list(1000)
-    
-    monthly_sales = sum(o.get('order_total', 0) for o in orders)
-    monthly_profit = sum(o.get('profit', 0) for o in orders)
-    
-    # Top products
-    product_stats = {}
-    for order in orders:
-        lines = await db.order_lines.find({"order_id": order['id']}, {"_id": 0}).to_list(1000)
-        for line in lines:
-            pid = line['product_id']
-            if pid not in product_stats:
-                product_stats[pid] = {"name": line['product_name'], "quantity": 0, "revenue": 0}
-            product_stats[pid]['quantity'] += line['quantity']
-            product_stats[pid]['revenue'] += line['line_total']
-    
-    top_products = sorted(product_stats.values(), key=lambda x: x['revenue'], reverse=True)[:10]
-    
-    # Top customers
-    customer_stats = {}
-    for order in orders:
-        cid = order['customer_id']
-        if cid not in customer_stats:
-            customer_stats[cid] = {"name": order['customer_name'], "orders": 0, "revenue": 0}
-        customer_stats[cid]['orders'] += 1
-        customer_stats[cid]['revenue'] += order.get('order_total', 0)
-    
-    top_customers = sorted(customer_stats.values(), key=lambda x: x['revenue'], reverse=True)[:10]
+    report = await build_sales_report(month_start, month_end, granularity=None)
     
     return {
         "month": target_month,
         "year": target_year,
-        "monthly_sales": round(monthly_sales, 2),
-        "monthly_profit": round(monthly_profit, 2),
-        "orders_count": len(orders),
-        "top_products": top_products,
-        "top_customers": top_customers
+        "monthly_sales": report['sales'],
+        "monthly_profit": report['profit'],
+        "orders_count": report['orders_count'],
+        "top_products": report['top_products'],
+        "top_customers": report['top_customers']
     }
 
+@api_router.get("/reports/range")
+async def get_range_report(
+    date_from: str = Query(..., alias="from"),
+    date_to: str = Query(..., alias="to"),
+    granularity: str = "month",
+    current_user: User = Depends(get_current_user)
+):
+    """Sales report for any [from, to) range, bucketed by day, week or month"""
+    if granularity not in REPORT_PERIOD_KEYS:
+        raise HTTPException(status_code=400, detail="Granularity must be day, week or month")
+    try:
+        start = parse_report_date(date_from)
+        end = parse_report_date(date_to)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date. Use ISO format (YYYY-MM-DD)")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    
+    report = await build_sales_report(start, end, granularity)
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "granularity": granularity,
+        **report
+    }
+
+
+# ============================================================================
+# EXPORT ROUTES
+# ============================================================================
+
+def export_response(cursor, name: str, fmt: str, fields: List[str], gzip: bool) -> StreamingResponse:
+    """Wrap a cursor in a streaming CSV/NDJSON download"""
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid export format. Use csv or ndjson.")
+    
+    filename = f"{name}.{fmt}"
+    media_type = EXPORT_MEDIA_TYPES[fmt]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        stream_export(cursor, fmt, fields, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.get("/export/orders.{fmt}")
+async def export_orders(
+    fmt: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream all orders in the date range as CSV or NDJSON"""
+    query = build_date_filter("date", date_from, date_to)
+    cursor = db.orders.find(query, {"_id": 0}).sort("date", 1).batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, "orders", fmt, EXPORT_FIELDS['orders'], gzip)
+
+@api_router.get("/export/order-lines.{fmt}")
+async def export_order_lines(
+    fmt: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream order lines (with order date/customer/status) as CSV or NDJSON"""
+    pipeline = [
+        {"$match": build_date_filter("date", date_from, date_to)},
+        {"$sort": {"date": 1}},
+        *lookup_order_lines(EMBEDDED_LINES),
+        {"$unwind": "$lines"},
+        {"$project": {
+            "_id": 0,
+            "order_date": "$date",
+            "customer_id": 1,
+            "order_status": "$status",
+            **{f: f"$lines.{f}" for f in EXPORT_FIELDS['order_lines'] if f not in ("order_date", "customer_id", "order_status")}
+        }}
+    ]
+    cursor = db.orders.aggregate(pipeline, allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE)
+    return export_response(cursor, "order-lines", fmt, EXPORT_FIELDS['order_lines'], gzip)
+
+@api_router.get("/export/stock-movements.{fmt}")
+async def export_stock_movements(
+    fmt: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream stock movements as CSV or NDJSON"""
+    # Newer movements use `timestamp`, legacy ones only have `date`
+    query = {}
+    if date_from or date_to:
+        query = {"$or": [
+            build_date_filter("timestamp", date_from, date_to),
+            build_date_filter("date", date_from, date_to)
+        ]}
+    cursor = db.stock_movements.find(query, {"_id": 0}, allow_disk_use=True).sort("timestamp", 1).batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, "stock-movements", fmt, EXPORT_FIELDS['stock_movements'], gzip)
+
+
+# ============================================================================
+# BULK IMPORT
+# ============================================================================
+
+def new_import_report() -> Dict[str, Any]:
+    return {"total_rows": 0, "created": 0, "duplicates": 0, "error_count": 0, "errors": []}
+
+def add_import_error(report: Dict[str, Any], row: int, error: str):
+    report['error_count'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({"row": row, "error": error})
+
+def format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+
+async def insert_import_batch(collection, docs: List[Dict[str, Any]], rows: List[int], report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """insert_many that keeps going past bad rows; returns the docs that were written"""
+    if not docs:
+        return []
+    
+    failed = set()
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get('writeErrors', []):
+            failed.add(err['index'])
+            add_import_error(report, rows[err['index']], err.get('errmsg', 'Write failed'))
+    
+    report['created'] += len(docs) - len(failed)
+    return [doc for i, doc in enumerate(docs) if i not in failed]
+
+async def flush_customer_batch(docs, rows, report, dry_run: bool):
+    if dry_run:
+        report['created'] += len(docs)
+        return
+    
+    inserted = await insert_import_batch(db.customers, docs, rows, report)
+    timeline_docs = []
+    for doc in inserted:
+        timeline = CustomerTimeline(customer_id=doc['id'], type="Note", description=f"Customer created: {doc['name']}")
+        timeline_doc = timeline.model_dump()
+        timeline_doc['date'] = timeline_doc['date'].isoformat()
+        timeline_docs.append(timeline_doc)
+    if timeline_docs:
+        await db.customer_timeline.insert_many(timeline_docs, ordered=False)
+
+async def bulk_import_customers(records, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Validate and insert customers in batches.
+    Rows whose normalized email or phone already exists (in DB or earlier in the file) are skipped.
+    """
+    report = new_import_report()
+    
+    seen_emails, seen_phones = set(), set()
+    async for existing in db.customers.find({}, {"_id": 0, "email": 1, "phone": 1}):
+        if normalize_email(existing.get('email')):
+            seen_emails.add(normalize_email(existing['email']))
+        if normalize_phone(existing.get('phone')):
+            seen_phones.add(normalize_phone(existing['phone']))
+    
+    docs, rows = [], []
+    async for row_number, record in read_records(records):
+        report['total_rows'] += 1
+        if isinstance(record, Exception):
+            add_import_error(report, row_number, str(record))
+            continue
+        
+        try:
+            customer_create = CustomerCreate(**record)
+        except ValidationError as e:
+            add_import_error(report, row_number, format_validation_error(e))
+            continue
+        
+        email = normalize_email(customer_create.email)
+        phone = normalize_phone(customer_create.phone)
+        if (email and email in seen_emails) or (phone and phone in seen_phones):
+            report['duplicates'] += 1
+            continue
+        if email:
+            seen_emails.add(email)
+        if phone:
+            seen_phones.add(phone)
+        
+        customer = Customer(**customer_create.model_dump())
+        doc = customer.model_dump()
+        doc['created_at'] = doc['created_at'].isoformat()
+        docs.append(doc)
+        rows.append(row_number)
+        
+        if len(docs) >= BULK_IMPORT_BATCH_SIZE:
+            await flush_customer_batch(docs, rows, report, dry_run)
+            docs, rows = [], []
+    
+    await flush_customer_batch(docs, rows, report, dry_run)
+    return report
+
+async def flush_product_batch(docs, rows, report, dry_run: bool):
+    if dry_run:
+        report['created'] += len(docs)
+        return
+    
+    inserted = await insert_import_batch(db.products, docs, rows, report)
+    stock_docs = []
+    for doc in inserted:
+        stock = Stock(product_id=doc['id'], quantity=0, min_stock=doc['min_stock'])
+        stock_doc = stock.model_dump()
+        stock_doc['last_updated'] = stock_doc['last_updated'].isoformat()
+        stock_docs.append(stock_doc)
+    if stock_docs:
+        await db.stock.insert_many(stock_docs, ordered=False)
+
+async def bulk_import_products(records, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Validate and insert products in batches.
+    Duplicate EANs are skipped; SKUs are allocated per category from one lookup per import.
+    """
+    report = new_import_report()
+    
+    seen_eans = set()
+    async for existing in db.products.find({"ean": {"$nin": [None, ""]}}, {"_id": 0, "ean": 1}):
+        seen_eans.add(normalize_ean(existing['ean']))
+    
+    sku_counters: Dict[str, int] = {}
+    docs, rows = [], []
+    async for row_number, record in read_records(records):
+        report['total_rows'] += 1
+        if isinstance(record, Exception):
+            add_import_error(report, row_number, str(record))
+            continue
+        
+        try:
+            record['health_areas'] = split_list_field(record.get('health_areas'))
+            record['ean'] = normalize_ean(record.get('ean'))
+            product_create = ProductCreate(**record)
+            validate_product_create(product_create)
+        except ValidationError as e:
+            add_import_error(report, row_number, format_validation_error(e))
+            continue
+        except ValueError as e:
+            add_import_error(report, row_number, f"health_areas: {e}")
+            continue
+        except HTTPException as e:
+            add_import_error(report, row_number, e.detail)
+            continue
+        
+        if product_create.ean:
+            if product_create.ean in seen_eans:
+                report['duplicates'] += 1
+                continue
+            seen_eans.add(product_create.ean)
+        
+        cat_code = get_sku_category_code(product_create.category)
+        if cat_code not in sku_counters:
+            sku_counters[cat_code] = await get_max_sku_number(cat_code)
+        sku_counters[cat_code] += 1
+        
+        product_data = product_create.model_dump()
+        product_data['sku'] = f"ZV-{cat_code}-{sku_counters[cat_code]:03d}"
+        product = Product(**product_data)
+        doc = product.model_dump()
+        doc['created_at'] = doc['created_at'].isoformat()
+        docs.append(doc)
+        rows.append(row_number)
+        
+        if len(docs) >= BULK_IMPORT_BATCH_SIZE:
+            await flush_product_batch(docs, rows, report, dry_run)
+            docs, rows = [], []
+    
+    await flush_product_batch(docs, rows, report, dry_run)
+    if report['created'] and not dry_run:
+        await bump_catalog_version()
+    return report
+
+def open_upload_text(file: UploadFile):
+    """Text view over the spooled upload so rows can be parsed incrementally"""
+    return io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+
+@api_router.post("/import/customers")
+async def import_customers(file: UploadFile = File(...), dry_run: bool = False, current_user: User = Depends(get_current_user)):
+    """Bulk import customers from CSV or NDJSON (one JSON object per line)"""
+    records = iter_records(open_upload_text(file), detect_import_format(file.filename))
+    try:
+        return await bulk_import_customers(records, dry_run)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+
+@api_router.post("/import/products")
+async def import_products(file: UploadFile = File(...), dry_run: bool = False, current_user: User = Depends(get_current_user)):
+    """Bulk import products from CSV or NDJSON (one JSON object per line)"""
+    records = iter_records(open_upload_text(file), detect_import_format(file.filename))
+    try:
+        return await bulk_import_products(records, dry_run)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+
 
 # ============================================================================
 # SEARCH ROUTE
@@ -2483,6 +3346,12 @@ async def run_low_stock_automation(current_user: User = Depends(get_current_user
         "tasks_created": tasks_created
     }
 
+@api_router.post("/automation/update-customer-status")
+async def run_customer_status_automation(dry_run: bool = False, current_user: User = Depends(get_current_user)):
+    """Recompute New/Active/VIP/Inactive for all customers (normally run nightly by recompute_customer_status.py)"""
+    report = await recompute_customer_lifecycle(db, dry_run=dry_run)
+    return {"message": "Customer status update completed", **report}
+
 @api_router.get("/automation/status")
 async def get_automation_status(current_user: User = Depends(get_current_user)):
     """Get status of all automation rules"""
@@ -2514,6 +3383,11 @@ async def get_automation_status(current_user: User = Depends(get_current_user)):
                 "enabled": True,
                 "description": "Auto-updates customer stats on order creation"
             },
+            "customer_status_batch": {
+                "enabled": True,
+                "description": "Nightly recompute of customer status (New/Active/VIP/Inactive)",
+                "last_run": await db.app_state.find_one({"id": "customer_lifecycle_last_run"}, {"_id": 0})
+            },
             "task_completion": {
                 "enabled": True,
                 "description": "Auto-completes stock tasks when inventory is replenished"
@@ -2608,6 +3482,7 @@ async def seed_data():
     await db.purchase_lines.delete_many({})
     await db.orders.delete_many({})
     await db.order_lines.delete_many({})
+    await db.stock_reservations.delete_many({})
     await db.tasks.delete_many({})
     await db.expenses.delete_many({})
     
@@ -2642,6 +3517,7 @@ async def seed_data():
          "created_at": datetime.now(timezone.utc).isoformat()}
     ]
     await db.products.insert_many(products)
+    await bump_catalog_version()
     
     # Create stock
     stock_items = [
@@ -2699,40 +3575,21 @@ async def seed_data():
 # ============================================================================
 # REGISTER ROUTES - MUST BE AFTER ALL ROUTE DEFINITIONS
 # ============================================================================
-@api_router.post("/ai/recommend-products")
-async def ai_recommend_products(
-    request_data: dict,
-    current_user: User = Depends(get_current_user)
-):
-    """AI-powered product recommendations based on customer needs"""
-    try:
-        import openai
-        import re
-        
-        customer_context = request_data.get("customer_context", "")
-        
-        if not customer_context or len(customer_context.strip()) < 10:
-            raise HTTPException(status_code=400, detail="Vennligst gi en mer detaljert beskrivelse av kunden")
-        
-        # Get all active products from database
-        products = await db.products.find({"active": True}, {"_id": 0}).to_list(1000)
-        
-        # Prepare products data for AI
-        products_info = []
-        for p in products:
-            product_data = {
-                "name": p.get("name"),
-                "category": p.get("category"),
-                "subcategory": p.get("subcategory"),
-                "tags": p.get("health_areas", []),
-                "description": p.get("short_description") or p.get("description", ""),
-                "sku": p.get("sku"),
-                "price": p.get("price")
-            }
-            products_info.append(product_data)
-        
-        # Create AI prompt
-        system_prompt = """Du er "ZenVit AI-Veileder", en intern fagassistent for ZenVit CRM.
+# Local recommender index, rebuilt when the catalog version changes
+recommendation_index = None
+
+# LLM answers keyed by normalized customer context + catalog version
+ai_recommendation_cache = AsyncTTLCache(maxsize=AI_CACHE_SIZE, ttl=AI_CACHE_TTL_SECONDS)
+
+async def get_recommendation_index() -> RecommendationIndex:
+    global recommendation_index
+    version = await get_catalog_version()
+    if recommendation_index is None or recommendation_index.version != version:
+        products = await db.products.find({"active": True}, {"_id": 0}).to_list(None)
+        recommendation_index = RecommendationIndex(products, version)
+    return recommendation_index
+
+AI_RECOMMENDATION_PROMPT = """Du er "ZenVit AI-Veileder", en intern fagassistent for ZenVit CRM.
 
 VIKTIGE REGLER:
 - Du hjelper kun ansatte, ikke sluttkunden direkte
@@ -2760,61 +3617,90 @@ SVAR FORMAT (JSON):
 
 Svar ALLTID med gyldig JSON."""
 
-        user_prompt = f"""KUNDEBESKRIVELSE:
+async def ask_ai_for_recommendations(customer_context: str, api_key: str) -> Dict[str, Any]:
+    """Ask the LLM for recommendations and parse its JSON answer"""
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    
+    index = await get_recommendation_index()
+    products_info = [
+        {
+            "name": p.get("name"),
+            "category": p.get("category"),
+            "subcategory": p.get("subcategory"),
+            "tags": p.get("health_areas", []),
+            "description": p.get("short_description") or p.get("description", ""),
+            "sku": p.get("sku"),
+            "price": p.get("price")
+        }
+        for p in index.products
+    ]
+    
+    user_prompt = f"""KUNDEBESKRIVELSE:
 {customer_context}
 
 TILGJENGELIGE ZENVIT-PRODUKTER:
 {json.dumps(products_info, indent=2, ensure_ascii=False)}
 
 Gi anbefalinger basert på beskrivelsen."""
+    
+    chat = LlmChat(
+        api_key=api_key,
+        session_id=f"ai-recommendation-{datetime.now(timezone.utc).timestamp()}",
+        system_message=AI_RECOMMENDATION_PROMPT
+    ).with_model("openai", "gpt-4o-mini")
+    ai_response = await chat.send_message(UserMessage(text=user_prompt))
+    return parse_ai_recommendations(ai_response)
 
-        # AI Recommendation Logic
-        # For now, use rule-based recommendations until OpenAI key is configured
+class UnparsedAIResponse(Exception):
+    """The LLM did not answer with JSON; carries the raw answer as a fallback that must not be cached"""
+
+    def __init__(self, ai_response: str):
+        super().__init__("AI response is not valid JSON")
+        self.recommendations = {"products": [], "explanation": ai_response}
+
+def parse_ai_recommendations(ai_response: str) -> Dict[str, Any]:
+    # Try to extract JSON from response
+    try:
+        json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
+        return json.loads(json_match.group() if json_match else ai_response)
+    except json.JSONDecodeError:
+        raise UnparsedAIResponse(ai_response)
+
+@api_router.post("/ai/recommend-products")
+async def ai_recommend_products(
+    request_data: dict,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Product recommendations based on customer needs.
+    Uses the LLM when an OpenAI key is configured, otherwise (or if the call
+    fails) the local recommender.
+    """
+    customer_context = request_data.get("customer_context", "")
+    
+    if not customer_context or len(customer_context.strip()) < 10:
+        raise HTTPException(status_code=400, detail="Vennligst gi en mer detaljert beskrivelse av kunden")
+    
+    try:
         api_key = os.environ.get('OPENAI_API_KEY')
-        
         if api_key and api_key.startswith('sk-proj-'):
-            # Use real OpenAI if valid key is provided
             try:
-                from emergentintegrations.llm.chat import LlmChat, UserMessage
-                
-                chat = LlmChat(
-                    api_key=api_key,
-                    session_id=f"ai-recommendation-{datetime.now(timezone.utc).timestamp()}",
-                    system_message=system_prompt
-                ).with_model("openai", "gpt-4o-mini")
-                
-                user_message = UserMessage(text=user_prompt)
-                ai_response = await chat.send_message(user_message)
+                # Identical descriptions share one cached (or in-flight) LLM call
+                key = context_key(customer_context, await get_catalog_version())
+                recommendations = await ai_recommendation_cache.get_or_compute(
+                    key, lambda: ask_ai_for_recommendations(customer_context, api_key)
+                )
+                return {"success": True, "recommendations": recommendations}
+            except UnparsedAIResponse as e:
+                # Shown once, but not cached: the next identical request asks again
+                return {"success": True, "recommendations": e.recommendations}
             except Exception as e:
                 # Fallback to rule-based if AI fails
-                ai_response = generate_rule_based_recommendations(customer_context, products_context)
-        else:
-            # Use intelligent rule-based recommendations
-            ai_response = generate_rule_based_recommendations(customer_context, products_context)
+                logging.warning(f"AI recommendation failed, using local recommender: {e}")
         
-        # Parse JSON response
-        try:
-            # Try to extract JSON from response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                ai_data = json.loads(json_match.group())
-            else:
-                ai_data = json.loads(ai_response)
-                
-            return {
-                "success": True,
-                "recommendations": ai_data
-            }
-        except json.JSONDecodeError:
-            # If JSON parsing fails, return raw response
-            return {
-                "success": True,
-                "recommendations": {
-                    "products": [],
-                    "explanation": ai_response
-                }
-            }
-            
+        index = await get_recommendation_index()
+        return {"success": True, "recommendations": recommend_products(index, customer_context)}
+    
     except Exception as e:
         logging.error(f"AI recommendation error: {e}")
         raise HTTPException(status_code=500, detail=f"Kunne ikke generere anbefalinger: {str(e)}")
@@ -2825,9 +3711,6 @@ Gi anbefalinger basert på beskrivelsen."""
 # ============================================================================
 app.include_router(api_router)
 
-# Add custom static files CORS middleware first
-app.add_middleware(StaticFilesCORSMiddleware)
-
 # Add CORS middleware for API endpoints
 app.add_middleware(
     CORSMiddleware,
@@ -2837,8 +3720,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for uploads
-app.mount("/uploads", StaticFiles(directory="/app/backend/uploads"), name="uploads")
+# Mount static files for uploads (CORS headers are added only on this mount)
+app.mount("/uploads", StaticFilesCORSMiddleware(StaticFiles(directory=UPLOAD_ROOT)), name="uploads")
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -2848,11 +3731,21 @@ async def startup_db():
     """Initialize database indexes on startup"""
     try:
         from utils import create_indexes
-        await create_indexes(db)
-        logger.info("Database indexes created successfully")
+        result = await create_indexes(db)
+        if result["skipped"]:
+            logger.info(f"Database indexes up to date (schema {result['version']})")
+        else:
+            logger.info(f"Database indexes created on {result['collections']} collections (schema {result['version']})")
     except Exception as e:
         logger.warning(f"Could not create indexes: {e}")
+    
+    task_scheduler.start()
+    reservation_sweeper.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await dashboard_hub.stop()
+    await task_scheduler.stop()
+    await reservation_sweeper.stop()
     client.close()
+    shutdown_image_pool()
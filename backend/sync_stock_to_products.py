@@ -1,5 +1,6 @@
 """
 One-time migration: Sync Stock.quantity to Product.stock_quantity
+(Superseded by reconcile_stock.py, which rebuilds both from stock_movements)
 After this, Stock table will no longer be used as active inventory source.
 """
 
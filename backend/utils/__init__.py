@@ -1,3 +1,77 @@
-from .db_indexes import create_indexes
+from .db_indexes import INDEXES, create_indexes, index_schema_version
+from .order_status import SALES_ORDER_STATUSES, STOCK_COMMIT_STATUSES
+from .export import EXPORT_BATCH_SIZE, EXPORT_FIELDS, EXPORT_MEDIA_TYPES, build_date_filter, stream_export
+from .bulk_import import (
+    BULK_IMPORT_BATCH_SIZE, MAX_REPORTED_ERRORS, detect_import_format, iter_records, read_records,
+    normalize_email, normalize_phone, normalize_ean, split_list_field
+)
+from .uploads import (
+    IMAGE_EXTENSIONS, InvalidUploadError, UploadTooLargeError, receive_multipart_upload
+)
+from .images import (
+    IMAGE_VARIANTS, IMMUTABLE_CACHE_CONTROL, ensure_variant, is_safe_image_filename,
+    parse_range_header, pregenerate_variants, shutdown_image_pool
+)
+from .stock_ledger import (
+    MOVEMENT_TIME, SIGNED_CHANGE, compact_stock_ledger, create_snapshot, expected_stock_levels, ledger_summary,
+    movement_time_filter, prune_snapshots, signed_change, stock_as_of, sum_movements
+)
+from .live_dashboard import DashboardHub
+from .recommender import RecommendationIndex, recommend_products
+from .response_cache import AsyncTTLCache, context_key, normalize_context
+from .task_scheduler import TaskDeadlineScheduler
+from .customer_lifecycle import (
+    INACTIVE_AFTER_DAYS, MANUAL_STATUSES, VIP_MIN_ORDERS, lifecycle_status, order_stats_pipeline,
+    recompute_customer_lifecycle
+)
+from .synthetic_data import (
+    SYNTHETIC_BATCH_SIZE, SYNTHETIC_COLLECTIONS, SYNTHETIC_CONCURRENCY, SyntheticDataGenerator,
+    generate_synthetic_data, scale_counts
+)
+from .command_counter import CommandCounter
+from .idempotency import IDEMPOTENCY_TTL, IdempotencyError, run_idempotent
+from .stock_reservations import (
+    InsufficientStockError, ReservationSweeper, available_to_promise, commit_reservations,
+    release_expired_reservations, release_reservations, reserve_stock
+)
+from .order_lines import BACKFILL_BATCH_SIZE, DENORMALIZED_ORDER_FIELDS, backfill_order_lines, order_line_fields
+from .embedded_lines import (
+    LINE_COLLECTIONS, LINES_LAYOUTS, MIGRATION_BATCH_SIZE, attach_lines, embedded_line, lookup_order_lines,
+    migrate_collection_lines, migrate_embedded_lines, order_lines_pipeline, parent_lines
+)
+from .query_plans import (
+    QueryCapture, explain_query, format_index_model, plan_problems, query_shape, suggest_index, summarize_plan
+)
+from .parquet_export import PARQUET_BATCH_SIZE, PARQUET_COLUMNS, PARQUET_TABLES, export_parquet, month_signatures
 
-__all__ = ['create_indexes']
+__all__ = [
+    'INDEXES', 'create_indexes', 'index_schema_version',
+    'SALES_ORDER_STATUSES', 'STOCK_COMMIT_STATUSES',
+    'EXPORT_BATCH_SIZE', 'EXPORT_FIELDS', 'EXPORT_MEDIA_TYPES', 'build_date_filter', 'stream_export',
+    'BULK_IMPORT_BATCH_SIZE', 'MAX_REPORTED_ERRORS', 'detect_import_format', 'iter_records', 'read_records',
+    'normalize_email', 'normalize_phone', 'normalize_ean', 'split_list_field',
+    'IMAGE_EXTENSIONS', 'InvalidUploadError', 'UploadTooLargeError', 'receive_multipart_upload',
+    'IMAGE_VARIANTS', 'IMMUTABLE_CACHE_CONTROL', 'ensure_variant', 'is_safe_image_filename',
+    'parse_range_header', 'pregenerate_variants', 'shutdown_image_pool',
+    'MOVEMENT_TIME', 'SIGNED_CHANGE', 'compact_stock_ledger', 'create_snapshot', 'expected_stock_levels', 'ledger_summary',
+    'movement_time_filter',
+    'prune_snapshots', 'signed_change', 'stock_as_of', 'sum_movements',
+    'DashboardHub',
+    'RecommendationIndex', 'recommend_products',
+    'AsyncTTLCache', 'context_key', 'normalize_context',
+    'TaskDeadlineScheduler',
+    'INACTIVE_AFTER_DAYS', 'MANUAL_STATUSES', 'VIP_MIN_ORDERS', 'lifecycle_status', 'order_stats_pipeline',
+    'recompute_customer_lifecycle',
+    'SYNTHETIC_BATCH_SIZE', 'SYNTHETIC_COLLECTIONS', 'SYNTHETIC_CONCURRENCY', 'SyntheticDataGenerator',
+    'generate_synthetic_data', 'scale_counts',
+    'CommandCounter',
+    'IDEMPOTENCY_TTL', 'IdempotencyError', 'run_idempotent',
+    'InsufficientStockError', 'ReservationSweeper', 'available_to_promise', 'commit_reservations',
+    'release_expired_reservations', 'release_reservations', 'reserve_stock',
+    'BACKFILL_BATCH_SIZE', 'DENORMALIZED_ORDER_FIELDS', 'backfill_order_lines', 'order_line_fields',
+    'LINE_COLLECTIONS', 'LINES_LAYOUTS', 'MIGRATION_BATCH_SIZE', 'attach_lines', 'embedded_line', 'lookup_order_lines',
+    'migrate_collection_lines', 'migrate_embedded_lines', 'order_lines_pipeline', 'parent_lines',
+    'QueryCapture', 'explain_query', 'format_index_model', 'plan_problems', 'query_shape', 'suggest_index',
+    'summarize_plan',
+    'PARQUET_BATCH_SIZE', 'PARQUET_COLUMNS', 'PARQUET_TABLES', 'export_parquet', 'month_signatures',
+]
@@ -0,0 +1,100 @@
+"""
+Incremental CSV/NDJSON parsing and normalization for bulk imports
+"""
+import asyncio
+import csv
+import json
+import re
+from itertools import islice
+
+BULK_IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_import_format(filename: str) -> str:
+    """Guess import format from file extension"""
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def iter_records(text_stream, fmt: str):
+    """
+    Yield (row_number, record) from a text stream without reading it all into memory.
+    Parse errors are yielded as (row_number, Exception) so callers can report them per row.
+    """
+    if fmt == "ndjson":
+        for row_number, line in enumerate(text_stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("Row is not a JSON object")
+                yield row_number, record
+            except ValueError as e:
+                yield row_number, e
+        return
+
+    reader = csv.DictReader(text_stream)
+    # Row 1 is the header, so data rows start at 2 (matches what spreadsheets show)
+    for row_number, row in enumerate(reader, start=2):
+        # Empty cells are left out so model defaults apply
+        record = {}
+        for key, value in row.items():
+            if key is None or value is None:
+                continue
+            value = value.strip()
+            if value != "":
+                record[key.strip()] = value
+        yield row_number, record
+
+
+async def read_records(records, batch_size: int = BULK_IMPORT_BATCH_SIZE):
+    """
+    Async view over iter_records: each batch of rows is read and parsed in a
+    worker thread, so decoding a large upload does not block the event loop.
+    """
+    records = iter(records)
+    while True:
+        batch = await asyncio.to_thread(lambda: list(islice(records, batch_size)))
+        if not batch:
+            return
+        for item in batch:
+            yield item
+
+
+def split_list_field(value):
+    """CSV list cells like 'Immun;Søvn' -> ['Immun', 'Søvn']. Raises ValueError for non-list values."""
+    if value is None or isinstance(value, list):
+        return value or []
+    if not isinstance(value, str):
+        raise ValueError(f"Expected a list or a ';'-separated string, got {type(value).__name__}")
+    return [part.strip() for part in re.split(r"[;,|]", value) if part.strip()]
+
+
+def normalize_email(email):
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+
+def normalize_phone(phone):
+    """Digits only, without Norwegian country prefix (+47 / 0047)"""
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", str(phone))
+    if digits.startswith("0047"):
+        digits = digits[4:]
+    elif digits.startswith("47") and len(digits) == 10:
+        digits = digits[2:]
+    return digits or None
+
+
+def normalize_ean(ean):
+    if not ean:
+        return None
+    digits = re.sub(r"\s", "", str(ean))
+    return digits or None
@@ -0,0 +1,54 @@
+"""
+Count MongoDB round trips with a pymongo command listener.
+
+Register the counter before the client is created (listeners are fixed at
+client construction), then wrap the code under test in `measure()`:
+
+    counter = CommandCounter()
+    monitoring.register(counter)      # or AsyncIOMotorClient(..., event_listeners=[counter])
+    ...
+    with counter.measure() as commands:
+        await client.get("/api/orders")
+    assert len(commands) <= 3
+"""
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Connection handshake / auth / session bookkeeping, not issued by our code
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "saslStart", "saslContinue", "authenticate", "endSessions",
+    "ping", "buildInfo", "getnonce",
+}
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self._recording = None
+
+    def record(self, command: str, collection: str = None):
+        if self._recording is not None and command not in IGNORED_COMMANDS:
+            self._recording.append((command, collection))
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore carries the collection separately
+            target = event.command.get("collection")
+        self.record(event.command_name, target)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    @contextmanager
+    def measure(self):
+        """Collect (command, collection) pairs issued inside the block"""
+        commands = []
+        previous, self._recording = self._recording, commands
+        try:
+            yield commands
+        finally:
+            self._recording = previous
@@ -0,0 +1,129 @@
+"""
+Customer lifecycle status (New / Active / VIP / Inactive) for all customers.
+
+Customers are read in id order, a batch at a time; each batch's sales order
+stats come from one $group on orders (using the customer_id index), the
+status is derived from them and only customers whose stored values are out
+of date are fixed with bulk_write, with their status transitions added to
+the timeline with insert_many. Plain $match/$group stages keep the job
+working on any supported MongoDB version (and the in-memory test database).
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+from .order_status import SALES_ORDER_STATUSES
+
+VIP_MIN_ORDERS = 10
+INACTIVE_AFTER_DAYS = 90
+# Set by hand - never overwritten by the batch job
+MANUAL_STATUSES = ["Lead", "Lost"]
+
+LIFECYCLE_BATCH_SIZE = 1000
+
+NO_ORDERS = {"count": 0, "total": 0, "last": None}
+
+
+def order_stats_pipeline(customer_ids: list) -> list:
+    """{_id: customer_id, count, total, last} over the sales orders of these customers"""
+    return [
+        {"$match": {"customer_id": {"$in": customer_ids}, "status": {"$in": SALES_ORDER_STATUSES}}},
+        {"$group": {
+            "_id": "$customer_id",
+            "count": {"$sum": 1},
+            "total": {"$sum": "$order_total"},
+            "last": {"$max": "$date"},
+        }},
+    ]
+
+
+def lifecycle_status(stats: dict, inactive_before: str) -> str:
+    if stats['count'] == 0:
+        return "New"
+    if stats['count'] >= VIP_MIN_ORDERS:
+        return "VIP"
+    if stats['last'] is None or stats['last'] < inactive_before:
+        return "Inactive"
+    return "Active"
+
+
+async def outdated_customers(db, inactive_before: str, batch_size: int = LIFECYCLE_BATCH_SIZE):
+    """Async generator of (customer, stats, new_status) for customers whose stored values are out of date"""
+    projection = {"_id": 0, "id": 1, "status": 1, "order_count": 1, "total_value": 1, "last_order_date": 1}
+    last_id = None
+    while True:
+        query = {"status": {"$nin": MANUAL_STATUSES}}
+        if last_id is not None:
+            query["id"] = {"$gt": last_id}
+        customers = await db.customers.find(query, projection).sort("id", 1).limit(batch_size).to_list(batch_size)
+        if not customers:
+            return
+        last_id = customers[-1]['id']
+        ids = [customer['id'] for customer in customers]
+        stats_by_customer = {}
+        async for row in db.orders.aggregate(order_stats_pipeline(ids)):
+            stats_by_customer[row.pop('_id')] = row
+        for customer in customers:
+            stats = stats_by_customer.get(customer['id'], NO_ORDERS)
+            new_status = lifecycle_status(stats, inactive_before)
+            if (customer.get('status') != new_status
+                    or customer.get('order_count', 0) != stats['count']
+                    or customer.get('total_value', 0) != stats['total']
+                    or customer.get('last_order_date') != stats['last']):
+                yield customer, stats, new_status
+
+
+async def recompute_customer_lifecycle(db, now: datetime = None, dry_run: bool = False) -> dict:
+    """Bring status/order_count/total_value/last_order_date up to date for every customer"""
+    now = now or datetime.now(timezone.utc)
+    inactive_before = (now - timedelta(days=INACTIVE_AFTER_DAYS)).isoformat()
+
+    report = {"customers_updated": 0, "transitions": {}, "dry_run": dry_run}
+    ops, timeline_docs = [], []
+
+    async def flush():
+        if not dry_run:
+            if ops:
+                await db.customers.bulk_write(ops, ordered=False)
+            if timeline_docs:
+                await db.customer_timeline.insert_many(timeline_docs, ordered=False)
+        ops.clear()
+        timeline_docs.clear()
+
+    async for customer, stats, new_status in outdated_customers(db, inactive_before):
+        ops.append(UpdateOne({"id": customer['id']}, {"$set": {
+            "status": new_status,
+            "order_count": stats['count'],
+            "total_value": stats['total'],
+            "last_order_date": stats['last'],
+        }}))
+        report['customers_updated'] += 1
+
+        old_status = customer.get('status')
+        if old_status != new_status:
+            transition = f"{old_status} -> {new_status}"
+            report['transitions'][transition] = report['transitions'].get(transition, 0) + 1
+            timeline_docs.append({
+                "id": str(uuid.uuid4()),
+                "customer_id": customer['id'],
+                "date": now.isoformat(),
+                "type": "Status",
+                "description": f"Status changed: {old_status} → {new_status}",
+            })
+
+        if len(ops) >= LIFECYCLE_BATCH_SIZE:
+            await flush()
+
+    await flush()
+    if not dry_run:
+        await db.app_state.update_one(
+            {"id": "customer_lifecycle_last_run"},
+            {"$set": {
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "customers_updated": report['customers_updated'],
+                "transitions": report['transitions'],
+            }},
+            upsert=True
+        )
+    return report
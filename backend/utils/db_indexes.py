@@ -1,74 +1,168 @@
 """
 Database indexes for improved query performance
+
+Indexes are declared per collection below and applied with one
+`create_indexes` call per collection, all collections concurrently. The
+applied schema is fingerprinted and recorded in app_state, so a process
+start against an already indexed database costs a single read.
+Single-field indexes serve sorts in both directions, so no separate
+descending copies are declared.
 """
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+INDEXES = {
+    "users": [
+        IndexModel("email", unique=True),
+        IndexModel("id", unique=True),
+    ],
+    "products": [
+        IndexModel("id", unique=True),
+        IndexModel("sku", unique=True),
+        IndexModel("name"),
+        IndexModel("category"),
+    ],
+    "customers": [
+        IndexModel("id", unique=True),
+        IndexModel("email"),
+        IndexModel("phone"),
+        IndexModel("name"),
+        IndexModel("status"),
+        # Dashboard segments: newest "New" customers, "Active" customers due a follow-up
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("last_order_date", ASCENDING)]),
+    ],
+    "customer_timeline": [
+        IndexModel([("customer_id", ASCENDING), ("date", DESCENDING)]),
+        IndexModel("date"),
+    ],
+    "orders": [
+        IndexModel("id", unique=True),
+        IndexModel("customer_id"),
+        IndexModel("date"),
+        IndexModel("status"),
+        # Sales in a date range (reports, dashboard, KPIs)
+        IndexModel([("status", ASCENDING), ("date", ASCENDING)]),
+    ],
+    "order_lines": [
+        IndexModel("order_id"),
+        IndexModel("product_id"),
+        # Line analytics on the copied order fields (see utils/order_lines.py)
+        IndexModel([("customer_id", ASCENDING), ("date", DESCENDING)]),
+        IndexModel([("product_id", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("date", ASCENDING)]),
+    ],
+    "stock": [
+        IndexModel("product_id", unique=True),
+        IndexModel("status"),
+    ],
+    "stock_movements": [
+        IndexModel("product_id"),
+        IndexModel("date"),
+        IndexModel("timestamp"),
+        IndexModel("source_id"),
+        IndexModel([("product_id", ASCENDING), ("timestamp", ASCENDING)]),
+    ],
+    "stock_adjustments": [
+        IndexModel("id", unique=True),
+        IndexModel("created_at"),
+        IndexModel([("product_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    # Stock held for open orders; closed reservations are kept for 30 days
+    "stock_reservations": [
+        IndexModel("id", unique=True),
+        IndexModel("order_id"),
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)]),
+        IndexModel("closed_at", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    # Stock ledger snapshots
+    "stock_snapshots": [
+        IndexModel([("as_of", ASCENDING), ("product_id", ASCENDING)], unique=True),
+    ],
+    "stock_snapshot_runs": [
+        IndexModel("as_of", unique=True),
+    ],
+    "tasks": [
+        IndexModel("id", unique=True),
+        IndexModel("status"),
+        IndexModel("due_date"),
+        IndexModel("priority"),
+        IndexModel("product_id"),
+    ],
+    "purchases": [
+        IndexModel("id", unique=True),
+        IndexModel("supplier_id"),
+        IndexModel("date"),
+    ],
+    "purchase_lines": [
+        IndexModel("purchase_id"),
+        IndexModel("product_id"),
+    ],
+    "suppliers": [
+        IndexModel("id", unique=True),
+        IndexModel("name"),
+    ],
+    "expenses": [
+        IndexModel("id", unique=True),
+        IndexModel("category"),
+        IndexModel("date"),
+    ],
+    # Image assets (content-addressed uploads)
+    "image_assets": [
+        IndexModel("hash", unique=True),
+        IndexModel("product_ids"),
+    ],
+    # Idempotency-Key responses, removed by the TTL monitor once expires_at passes
+    "idempotency_keys": [
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    # App state (catalog version, index schema etc.)
+    "app_state": [
+        IndexModel("id", unique=True),
+    ],
+}
+
+INDEX_SCHEMA_STATE_ID = "index_schema"
+
+
+def index_schema_version(indexes: dict = INDEXES) -> str:
+    """Fingerprint of the declared indexes - changes whenever INDEXES does"""
+    spec = {
+        collection: [model.document for model in models]
+        for collection, models in sorted(indexes.items())
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+async def create_indexes(db, force: bool = False) -> dict:
+    """
+    Create all declared indexes, unless this schema version is already applied.
+    Returns {"version", "skipped", "collections"}.
+    """
+    version = index_schema_version()
+    if not force:
+        state = await db.app_state.find_one({"id": INDEX_SCHEMA_STATE_ID}, {"_id": 0})
+        if state and state.get("version") == version:
+            return {"version": version, "skipped": True, "collections": 0}
+
+    results = await asyncio.gather(
+        *(db[name].create_indexes(models) for name, models in INDEXES.items()),
+        return_exceptions=True
+    )
+    errors = [
+        f"{name}: {result}" for name, result in zip(INDEXES, results) if isinstance(result, Exception)
+    ]
+    if errors:
+        # Version is not recorded, so the next start retries
+        raise RuntimeError("Index creation failed - " + "; ".join(errors))
 
-async def create_indexes(db):
-    """Create database indexes for all collections"""
-    
-    # Users collection
-    await db.users.create_index("email", unique=True)
-    await db.users.create_index("id", unique=True)
-    
-    # Products collection
-    await db.products.create_index("id", unique=True)
-    await db.products.create_index("sku", unique=True)
-    await db.products.create_index("name")
-    await db.products.create_index("category")
-    
-    # Customers collection
-    await db.customers.create_index("id", unique=True)
-    await db.customers.create_index("email")
-    await db.customers.create_index("phone")
-    await db.customers.create_index("name")
-    await db.customers.create_index("status")
-    
-    # Orders collection
-    await db.orders.create_index("id", unique=True)
-    await db.orders.create_index("customer_id")
-    await db.orders.create_index("date")
-    await db.orders.create_index("status")
-    await db.orders.create_index([("date", -1)])  # Descending for recent first
-    
-    # Order lines collection
-    await db.order_lines.create_index("order_id")
-    await db.order_lines.create_index("product_id")
-    
-    # Stock collection
-    await db.stock.create_index("product_id", unique=True)
-    await db.stock.create_index("status")
-    
-    # Stock movements collection
-    await db.stock_movements.create_index("product_id")
-    await db.stock_movements.create_index("date")
-    await db.stock_movements.create_index([("date", -1)])
-    
-    # Tasks collection
-    await db.tasks.create_index("id", unique=True)
-    await db.tasks.create_index("status")
-    await db.tasks.create_index("due_date")
-    await db.tasks.create_index("priority")
-    await db.tasks.create_index("product_id")
-    await db.tasks.create_index([("due_date", 1)])  # Ascending for upcoming first
-    
-    # Purchases collection
-    await db.purchases.create_index("id", unique=True)
-    await db.purchases.create_index("supplier_id")
-    await db.purchases.create_index("date")
-    await db.purchases.create_index([("date", -1)])
-    
-    # Suppliers collection
-    await db.suppliers.create_index("id", unique=True)
-    await db.suppliers.create_index("name")
-    
-    # Expenses collection
-    await db.expenses.create_index("id", unique=True)
-    await db.expenses.create_index("category")
-    await db.expenses.create_index("date")
-    await db.expenses.create_index([("date", -1)])
-    
-    # Customer timeline collection
-    await db.customer_timeline.create_index("customer_id")
-    await db.customer_timeline.create_index("date")
-    await db.customer_timeline.create_index([("date", -1)])
-    
-    print("✅ Database indexes created successfully")
+    await db.app_state.update_one(
+        {"id": INDEX_SCHEMA_STATE_ID},
+        {"$set": {"version": version, "applied_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    return {"version": version, "skipped": False, "collections": len(INDEXES)}
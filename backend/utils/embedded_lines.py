@@ -0,0 +1,170 @@
+"""
+Embedded line layout - order and purchase lines stored inside their parent
+document (`lines` array) instead of the order_lines / purchase_lines
+collections.
+
+The layout is opt-in (LINES_LAYOUT=embedded). Reads work with both layouts
+during the rollout: a parent that has a `lines` field uses it, any other
+parent gets its lines from the separate collection. The rollout is:
+
+1. deploy (reads are layout-agnostic, writes still go to the collections)
+2. run `migrate_embedded_lines` for orders and purchases (batched, resumable)
+3. set LINES_LAYOUT=embedded - new parents are written with embedded lines
+   only and line analytics switch to the `$unwind` path
+
+From step 3 on the collections miss every parent created since, so going
+back takes a reverse migration, not just the setting: set
+LINES_LAYOUT=collection, then run `migrate_collection_lines`, which writes
+the embedded lines back (with fresh copies of the order fields) and removes
+`lines` from the parents. Drop the collections only once the embedded
+layout is there to stay.
+"""
+from pymongo import ReplaceOne, UpdateOne
+
+from .order_lines import DENORMALIZED_ORDER_FIELDS
+
+LINES_LAYOUTS = ("collection", "embedded")
+
+# parent collection -> (line collection, parent key on each line)
+LINE_COLLECTIONS = {
+    "orders": ("order_lines", "order_id"),
+    "purchases": ("purchase_lines", "purchase_id"),
+}
+
+MIGRATION_BATCH_SIZE = 500
+
+
+def embedded_line(line: dict) -> dict:
+    """A line as stored inside its order - without the copies of order fields"""
+    return {k: v for k, v in line.items() if k != "_id" and k not in DENORMALIZED_ORDER_FIELDS}
+
+
+async def attach_lines(db, parent_collection: str, parents: list) -> list:
+    """
+    Give every parent its `lines`: embedded ones are kept, the others are
+    loaded from the line collection in one query.
+    """
+    line_collection, key = LINE_COLLECTIONS[parent_collection]
+    missing = [p['id'] for p in parents if 'lines' not in p]
+    grouped = {}
+    if missing:
+        async for line in db[line_collection].find({key: {"$in": missing}}, {"_id": 0}):
+            grouped.setdefault(line[key], []).append(line)
+    for parent in parents:
+        if 'lines' not in parent:
+            parent['lines'] = grouped.get(parent['id'], [])
+    return parents
+
+
+async def parent_lines(db, parent_collection: str, parent: dict) -> list:
+    """Lines of a single order or purchase in either layout"""
+    if 'lines' in parent:
+        return parent['lines']
+    line_collection, key = LINE_COLLECTIONS[parent_collection]
+    return await db[line_collection].find({key: parent['id']}, {"_id": 0}).to_list(None)
+
+
+def order_lines_pipeline(embedded: bool, match: dict, stages: list) -> tuple:
+    """
+    (collection, pipeline) that runs `stages` over order lines carrying
+    order_id, customer_id, date and status, filtered by `match` on those
+    order fields. Collection layout reads order_lines (indexed on the copied
+    fields); embedded layout matches orders and $unwinds their lines.
+    """
+    if not embedded:
+        return "order_lines", [{"$match": match}, *stages]
+    return "orders", [
+        {"$match": match},
+        {"$unwind": "$lines"},
+        {"$addFields": {
+            "lines.order_id": "$id", **{f"lines.{field}": f"${field}" for field in DENORMALIZED_ORDER_FIELDS}
+        }},
+        {"$replaceRoot": {"newRoot": "$lines"}},
+        *stages,
+    ]
+
+
+def lookup_order_lines(embedded: bool) -> list:
+    """Stages that give each order in a pipeline its `lines` (nothing to do when embedded)"""
+    if embedded:
+        return []
+    return [{"$lookup": {"from": "order_lines", "localField": "id", "foreignField": "order_id", "as": "lines"}}]
+
+
+async def migrate_embedded_lines(db, parent_collection: str, batch_size: int = MIGRATION_BATCH_SIZE,
+                                 after: str = None, progress=None) -> dict:
+    """
+    Copy lines into their parents, batch by batch in parent id order: one
+    $in read of the lines and one bulk write per batch. Parents that already
+    have `lines` are skipped, so the migration can be re-run or resumed
+    (pass the last reported id as `after`) at any point.
+    progress(last_id, parents_done) is called after each batch.
+    """
+    line_collection, key = LINE_COLLECTIONS[parent_collection]
+    parents_done = 0
+    lines_copied = 0
+    last_id = after
+    while True:
+        query = {"lines": {"$exists": False}}
+        if last_id:
+            query["id"] = {"$gt": last_id}
+        batch = await db[parent_collection].find(query, {"_id": 0, "id": 1}).sort("id", 1).limit(
+            batch_size
+        ).to_list(batch_size)
+        if not batch:
+            break
+        ids = [parent['id'] for parent in batch]
+        grouped = {}
+        async for line in db[line_collection].find({key: {"$in": ids}}, {"_id": 0}):
+            grouped.setdefault(line[key], []).append(embedded_line(line))
+        await db[parent_collection].bulk_write([
+            # The filter keeps a parent written with embedded lines meanwhile untouched
+            UpdateOne({"id": pid, "lines": {"$exists": False}}, {"$set": {"lines": grouped.get(pid, [])}})
+            for pid in ids
+        ], ordered=False)
+        parents_done += len(ids)
+        lines_copied += sum(len(lines) for lines in grouped.values())
+        last_id = ids[-1]
+        if progress:
+            progress(last_id, parents_done)
+    return {"parents": parents_done, "lines": lines_copied, "last_id": last_id}
+
+
+async def migrate_collection_lines(db, parent_collection: str, batch_size: int = MIGRATION_BATCH_SIZE,
+                                   progress=None) -> dict:
+    """
+    Reverse of `migrate_embedded_lines`: write embedded lines back to the line
+    collection (upserted by line id) and unset `lines` on their parents,
+    batch by batch in parent id order. Done parents drop out of the query,
+    so the migration can be re-run or resumed at any point.
+    progress(last_id, parents_done) is called after each batch.
+    """
+    line_collection, key = LINE_COLLECTIONS[parent_collection]
+    parents_done = 0
+    lines_copied = 0
+    last_id = None
+    while True:
+        batch = await db[parent_collection].find({"lines": {"$exists": True}}, {"_id": 0}).sort("id", 1).limit(
+            batch_size
+        ).to_list(batch_size)
+        if not batch:
+            break
+        writes = []
+        for parent in batch:
+            # Order lines carry copies of the order fields (see utils/order_lines.py)
+            parent_fields = {key: parent['id']}
+            if parent_collection == "orders":
+                parent_fields.update({field: parent.get(field) for field in DENORMALIZED_ORDER_FIELDS})
+            writes.extend(
+                ReplaceOne({"id": line['id']}, {**line, **parent_fields}, upsert=True) for line in parent['lines']
+            )
+        if writes:
+            await db[line_collection].bulk_write(writes, ordered=False)
+        ids = [parent['id'] for parent in batch]
+        await db[parent_collection].update_many({"id": {"$in": ids}}, {"$unset": {"lines": ""}})
+        parents_done += len(ids)
+        lines_copied += len(writes)
+        last_id = ids[-1]
+        if progress:
+            progress(last_id, parents_done)
+    return {"parents": parents_done, "lines": lines_copied, "last_id": last_id}
@@ -0,0 +1,101 @@
+"""
+Streaming exports for accounting (CSV / NDJSON, optionally gzipped)
+"""
+import csv
+import io
+import json
+import zlib
+
+EXPORT_BATCH_SIZE = 2000
+
+# Column order for each export - keeps CSV headers stable between runs
+EXPORT_FIELDS = {
+    'orders': [
+        "id", "date", "customer_id", "customer_name", "channel", "status",
+        "payment_status", "payment_method", "payment_date",
+        "shipping_paid_by_customer", "shipping_cost",
+        "order_total", "cost_total", "profit", "profit_percent",
+        "stock_applied", "completed_at", "notes",
+    ],
+    'order_lines': [
+        "id", "order_id", "order_date", "customer_id", "order_status",
+        "product_id", "product_name", "quantity", "sale_price", "cost_price",
+        "discount", "line_total", "line_profit",
+    ],
+    'stock_movements': [
+        "id", "timestamp", "product_id", "type", "change", "source",
+        "source_id", "note", "date", "quantity", "order_id", "purchase_id",
+    ],
+}
+
+EXPORT_MEDIA_TYPES = {
+    'csv': "text/csv; charset=utf-8",
+    'ndjson': "application/x-ndjson",
+}
+
+
+def build_date_filter(field: str, date_from: str = None, date_to: str = None) -> dict:
+    """Build an ISO-string range filter (dates are stored as ISO strings)"""
+    if not date_from and not date_to:
+        return {}
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = date_from
+    if date_to:
+        date_range["$lt"] = date_to
+    return {field: date_range}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+async def _encode_rows(cursor, fmt: str, fields: list):
+    """Encode documents from a cursor one batch at a time"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        rows = 0
+        async for doc in cursor:
+            writer.writerow([_csv_value(doc.get(f)) for f in fields])
+            rows += 1
+            if rows % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate(0)
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    else:
+        chunk = []
+        async for doc in cursor:
+            doc.pop('_id', None)
+            chunk.append(json.dumps(doc, ensure_ascii=False, default=str))
+            if len(chunk) >= EXPORT_BATCH_SIZE:
+                yield ("\n".join(chunk) + "\n").encode('utf-8')
+                chunk = []
+        if chunk:
+            yield ("\n".join(chunk) + "\n").encode('utf-8')
+
+
+async def stream_export(cursor, fmt: str, fields: list, compress: bool = False):
+    """
+    Async generator of response bytes for a cursor.
+    Memory use is bounded by EXPORT_BATCH_SIZE rows regardless of result size.
+    """
+    if not compress:
+        async for chunk in _encode_rows(cursor, fmt, fields):
+            yield chunk
+        return
+
+    # wbits=31 -> gzip container, so the download opens as a normal .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in _encode_rows(cursor, fmt, fields):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,124 @@
+"""
+Idempotency keys for write endpoints - a retried request carrying the same
+`Idempotency-Key` header gets the stored response of the first attempt
+instead of running the write again.
+
+Keys live in the `idempotency_keys` collection (TTL index on expires_at).
+The first request claims the key with a unique insert, so concurrent
+duplicates on other workers wait for its response; duplicates inside this
+process share one in-flight future. Failed attempts release the key, so the
+client can retry after fixing the request.
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_TTL = timedelta(hours=24)
+# A claim older than this belongs to a worker that died mid-request
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=60)
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+_in_flight = {}
+_CLAIMED = object()
+
+
+class IdempotencyError(Exception):
+    """Raised when a key cannot be honoured; status_code is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_fingerprint(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def _wait_for_response(db, record_id: str, fingerprint: str):
+    """Stored response of a claimed key, waiting while another worker completes it"""
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        record = await db.idempotency_keys.find_one({"_id": record_id})
+        if record is None:
+            return None  # the other attempt failed and released the key
+        if record['fingerprint'] != fingerprint:
+            raise IdempotencyError(422, "Idempotency-Key was already used for a different request")
+        if record['state'] == "done":
+            return record['response']
+        if record['locked_until'].replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+            # Stale claim - take it over
+            taken = await db.idempotency_keys.find_one_and_update(
+                {"_id": record_id, "state": "pending", "locked_until": record['locked_until']},
+                {"$set": {"locked_until": _lock_deadline()}}
+            )
+            if taken:
+                return _CLAIMED
+        if asyncio.get_running_loop().time() > deadline:
+            raise IdempotencyError(409, "A request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+
+def _lock_deadline() -> datetime:
+    return datetime.now(timezone.utc) + IDEMPOTENCY_LOCK_TIMEOUT
+
+
+async def _run_once(db, record_id: str, fingerprint: str, handler) -> tuple:
+    now = datetime.now(timezone.utc)
+    while True:
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "state": "pending",
+                "locked_until": _lock_deadline(),
+                "created_at": now.isoformat(),
+                "expires_at": now + IDEMPOTENCY_TTL,
+            })
+            break
+        except DuplicateKeyError:
+            response = await _wait_for_response(db, record_id, fingerprint)
+            if response is _CLAIMED:
+                break
+            if response is not None:
+                return response, True
+
+    try:
+        response = await handler()
+    except BaseException:
+        await db.idempotency_keys.delete_one({"_id": record_id, "state": "pending"})
+        raise
+    await db.idempotency_keys.update_one(
+        {"_id": record_id},
+        {"$set": {"state": "done", "response": response}}
+    )
+    return response, False
+
+
+async def run_idempotent(db, key: str, scope: str, payload, handler) -> tuple:
+    """
+    Run `handler()` (a coroutine function returning a JSON-compatible response)
+    at most once per (scope, key). Returns (response, replayed).
+    """
+    if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise IdempotencyError(400, f"Idempotency-Key must be 1-{MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+
+    record_id = f"{scope}:{key}"
+    fingerprint = request_fingerprint(payload)
+    running = _in_flight.get(record_id)
+    if running is None:
+        future = asyncio.ensure_future(_run_once(db, record_id, fingerprint, handler))
+        _in_flight[record_id] = (fingerprint, future)
+        future.add_done_callback(lambda _: _in_flight.pop(record_id, None))
+        return await asyncio.shield(future)
+
+    # Same key already running in this process - share its outcome
+    running_fingerprint, future = running
+    if running_fingerprint != fingerprint:
+        raise IdempotencyError(422, "Idempotency-Key was already used for a different request")
+    response, _ = await asyncio.shield(future)
+    return response, True
@@ -0,0 +1,128 @@
+"""
+Responsive WebP variants of uploaded product images.
+Variants are rendered in a process pool (Pillow work is CPU bound) and
+cached on disk next to the originals, so each one is generated once.
+"""
+import asyncio
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+# Longest side in pixels for each variant
+IMAGE_VARIANTS = {
+    "thumbnail": 160,
+    "card": 400,
+    "detail": 1024,
+}
+
+VARIANT_QUALITY = 80
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_SAFE_FILENAME = re.compile(r"^[A-Za-z0-9_-]+\.[A-Za-z0-9]+$")
+
+_pool = None
+_in_flight = {}
+
+
+def is_safe_image_filename(filename: str) -> bool:
+    """Only plain '<name>.<ext>' filenames - no paths or traversal"""
+    return bool(_SAFE_FILENAME.match(filename or ""))
+
+
+def variant_path(variant_dir: Path, filename: str, variant: str) -> Path:
+    return variant_dir / f"{Path(filename).stem}-{variant}.webp"
+
+
+def render_variant(source: str, destination: str, max_size: int):
+    """Resize to fit max_size and save as WebP (runs in a worker process)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        img.thumbnail((max_size, max_size))
+        tmp = f"{destination}.{uuid.uuid4().hex}.tmp"
+        img.save(tmp, "WEBP", quality=VARIANT_QUALITY, method=4)
+    os.replace(tmp, destination)
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        workers = int(os.environ.get("IMAGE_WORKERS", 2))
+        # spawn: workers must not inherit the event loop / Mongo client threads
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def ensure_variant(source: Path, variant_dir: Path, variant: str) -> Path:
+    """
+    Return the variant file, rendering it first if needed.
+    Concurrent requests for the same variant share one render.
+    """
+    destination = variant_path(variant_dir, source.name, variant)
+    if destination.exists():
+        return destination
+
+    key = str(destination)
+    future = _in_flight.get(key)
+    if future is None:
+        variant_dir.mkdir(parents=True, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            get_image_pool(), render_variant, str(source), str(destination), IMAGE_VARIANTS[variant]
+        )
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    try:
+        await asyncio.shield(future)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge image) - start a fresh pool next time
+        shutdown_image_pool()
+        raise
+    return destination
+
+
+async def pregenerate_variants(source: Path, variant_dir: Path):
+    """Render every variant for a fresh upload; failures are left for lazy retry"""
+    await asyncio.gather(
+        *(ensure_variant(source, variant_dir, variant) for variant in IMAGE_VARIANTS),
+        return_exceptions=True
+    )
+
+
+def parse_range_header(range_header: str, file_size: int):
+    """
+    Parse a single 'bytes=start-end' range.
+    Returns (start, end) inclusive, None for no/unsupported range, or raises ValueError if unsatisfiable.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_str, _, end_str = range_header[len("bytes="):].strip().partition("-")
+    if not (start_str.isdigit() or start_str == "") or not (end_str.isdigit() or end_str == ""):
+        return None  # Malformed ranges are ignored, per RFC 9110
+    if start_str == "" and end_str == "":
+        return None
+    if start_str == "":
+        # Suffix range: last N bytes
+        length = int(end_str)
+        if length <= 0:
+            raise ValueError("Unsatisfiable range")
+        return max(file_size - length, 0), file_size - 1
+    start = int(start_str)
+    end = int(end_str) if end_str else file_size - 1
+    if start >= file_size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, file_size - 1)
@@ -0,0 +1,337 @@
+"""
+Live dashboard KPIs pushed from MongoDB change streams.
+
+One DashboardHub per process loads the KPI inputs once and then applies
+change events from orders, products, purchases and stock incrementally:
+every document's contribution to the counters is remembered, so an event
+only subtracts the old contribution and adds the new one. Clients get a
+full snapshot on connect and afterwards only the values that changed, so
+dashboard cost no longer grows with the number of open tabs.
+
+Change streams need a replica set (a single-node one is enough). On a
+standalone server the hub falls back to reloading every few seconds -
+still once per process rather than once per browser.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .order_status import SALES_ORDER_STATUSES
+
+INCOMING_PURCHASE_STATUSES = ["Ordered", "In_Transit"]
+LOW_STOCK_STATUSES = ["Low", "Out"]
+WATCHED_COLLECTIONS = ["orders", "products", "purchases", "stock"]
+
+FLUSH_INTERVAL = 0.5          # seconds - bursts of changes go out as one delta
+POLL_INTERVAL = 10            # seconds - reload interval without change streams
+RETRY_DELAY = 5               # seconds - before reopening a failed change stream
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Server error codes meaning "change streams are not available here"
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+
+logger = logging.getLogger(__name__)
+
+
+def current_period(now: datetime = None):
+    """(month_start, today_start) ISO strings the time-based KPIs are counted from"""
+    now = now or datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return today.replace(day=1).isoformat(), today.isoformat()
+
+
+def order_contribution(order: dict, period) -> dict:
+    month_start, today_start = period
+    status = order.get('status')
+    date = order.get('date') or ""
+    total = order.get('order_total', 0) or 0
+    contribution = {}
+    if status == "Pending":
+        contribution["pending_orders"] = 1
+    if status in SALES_ORDER_STATUSES and date >= month_start:
+        contribution["month_sales_count"] = 1
+        contribution["month_revenue"] = total
+        if order.get('customer_id'):
+            contribution[("customer", order['customer_id'])] = 1
+        if date >= today_start:
+            contribution["today_orders"] = 1
+            contribution["today_sales"] = total
+    return contribution
+
+
+def purchase_contribution(purchase: dict, period) -> dict:
+    contribution = {}
+    if purchase.get('status') in INCOMING_PURCHASE_STATUSES:
+        contribution["incoming_purchases"] = 1
+    if (purchase.get('date') or "") >= period[1]:
+        contribution["new_purchases_today"] = 1
+    return contribution
+
+
+def product_contribution(product: dict, period) -> dict:
+    return {"total_products": 1} if product.get('active') else {}
+
+
+def stock_contribution(stock: dict, period) -> dict:
+    return {"low_stock": 1} if stock.get('status') in LOW_STOCK_STATUSES else {}
+
+
+CONTRIBUTIONS = {
+    "orders": order_contribution,
+    "purchases": purchase_contribution,
+    "products": product_contribution,
+    "stock": stock_contribution,
+}
+
+
+def diff_sections(old: dict, new: dict) -> dict:
+    """Changed keys per section, e.g. {"kpis": {"low_stock": 3}}"""
+    delta = {}
+    for section, values in new.items():
+        changed = {k: v for k, v in values.items() if old.get(section, {}).get(k) != v}
+        if changed:
+            delta[section] = changed
+    return delta
+
+
+class DashboardHub:
+    """Keeps dashboard KPIs in memory and fans changes out to subscribers"""
+
+    def __init__(self, db):
+        self.db = db
+        self.subscribers = set()
+        self.state = {}
+        self.version = 0
+        self.mode = None
+        self._task = None
+        self._ready = asyncio.Event()
+        self._reset()
+
+    def _reset(self):
+        self.period = current_period()
+        self._contributions = {collection: {} for collection in WATCHED_COLLECTIONS}
+        self._totals = {}
+        # Inventory value needs stock quantity x product cost from two collections
+        self._product_ids = {}      # products _id -> product id (delete events only carry _id)
+        self._stock_ids = {}        # stock _id -> product id
+        self._costs = {}
+        self._quantities = {}
+        self._inventory = {}
+        self._inventory_total = 0
+
+    # ------------------------------------------------------------------
+    # Incremental state
+    # ------------------------------------------------------------------
+
+    def _add(self, contribution: dict, sign: int):
+        for key, value in contribution.items():
+            total = self._totals.get(key, 0) + sign * value
+            if total:
+                self._totals[key] = total
+            else:
+                self._totals.pop(key, None)
+
+    def _update_inventory(self, product_id: str):
+        value = self._quantities.get(product_id, 0) * self._costs.get(product_id, 0)
+        self._inventory_total += value - self._inventory.get(product_id, 0)
+        if value:
+            self._inventory[product_id] = value
+        else:
+            self._inventory.pop(product_id, None)
+
+    def apply(self, collection: str, doc_id, doc: dict = None):
+        """Replace one document's contribution (doc=None for deletes)"""
+        self._add(self._contributions[collection].pop(doc_id, {}), -1)
+        if doc is not None:
+            contribution = CONTRIBUTIONS[collection](doc, self.period)
+            if contribution:
+                self._contributions[collection][doc_id] = contribution
+                self._add(contribution, 1)
+
+        if collection == "products":
+            product_id = doc['id'] if doc else self._product_ids.pop(doc_id, None)
+            if product_id:
+                if doc:
+                    self._product_ids[doc_id] = product_id
+                if doc and doc.get('active'):
+                    self._costs[product_id] = doc.get('cost', 0) or 0
+                else:
+                    self._costs.pop(product_id, None)
+                self._update_inventory(product_id)
+        elif collection == "stock":
+            product_id = doc['product_id'] if doc else self._stock_ids.pop(doc_id, None)
+            if product_id:
+                if doc:
+                    self._stock_ids[doc_id] = product_id
+                    self._quantities[product_id] = doc.get('quantity', 0) or 0
+                else:
+                    self._quantities.pop(product_id, None)
+                self._update_inventory(product_id)
+
+    def apply_change(self, change: dict):
+        collection = change['ns']['coll']
+        if collection not in self._contributions:
+            return
+        doc_id = change['documentKey']['_id']
+        if change['operationType'] == "delete":
+            self.apply(collection, doc_id, None)
+        elif change.get('fullDocument') is not None:
+            self.apply(collection, doc_id, change['fullDocument'])
+        else:
+            # Updated and deleted again before the lookup ran
+            self.apply(collection, doc_id, None)
+
+    async def reload(self):
+        """Rebuild all counters from the database"""
+        self._reset()
+        month_start, today_start = self.period
+        queries = {
+            "orders": {"$or": [{"status": "Pending"}, {"date": {"$gte": month_start}}]},
+            "purchases": {"$or": [{"status": {"$in": INCOMING_PURCHASE_STATUSES}}, {"date": {"$gte": today_start}}]},
+            "products": {},
+            "stock": {},
+        }
+        for collection, query in queries.items():
+            async for doc in self.db[collection].find(query):
+                self.apply(collection, doc['_id'], doc)
+
+    def snapshot(self) -> dict:
+        t = self._totals
+        low_stock = t.get("low_stock", 0)
+        incoming = t.get("incoming_purchases", 0)
+        return {
+            "kpis": {
+                "total_products": t.get("total_products", 0),
+                "low_stock": low_stock,
+                "sales_this_month": {
+                    "count": t.get("month_sales_count", 0),
+                    "revenue": round(t.get("month_revenue", 0), 2)
+                },
+                "incoming_purchases": incoming,
+                "inventory_value": round(self._inventory_total, 2),
+                "active_customers": sum(1 for key in t if isinstance(key, tuple) and key[0] == "customer"),
+            },
+            "alerts": {
+                "lowStock": low_stock,
+                "pendingOrders": t.get("pending_orders", 0),
+                "incomingPurchases": incoming,
+            },
+            "todayStats": {
+                "sales": round(t.get("today_sales", 0), 2),
+                "orders": t.get("today_orders", 0),
+                "newPurchases": t.get("new_purchases_today", 0),
+            },
+        }
+
+    # ------------------------------------------------------------------
+    # Fan-out
+    # ------------------------------------------------------------------
+
+    def publish(self):
+        """Send changed values to all subscribers (no-op if nothing changed)"""
+        new_state = self.snapshot()
+        delta = diff_sections(self.state, new_state)
+        self.state = new_state
+        self._ready.set()
+        if not delta:
+            return
+        self.version += 1
+        message = {"type": "delta", "version": self.version, **delta}
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and let it resync from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "snapshot", "version": self.version, **self.state})
+
+    async def subscribe(self, keepalive: float = 15):
+        """
+        Async generator: a full snapshot first, then deltas as they happen.
+        Yields None every `keepalive` seconds without changes.
+        """
+        self.start()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        try:
+            await self._ready.wait()
+            seen = self.version
+            yield {"type": "snapshot", "version": seen, **self.state}
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # Queued before the snapshot was taken and already part of it
+                if message["version"] > seen:
+                    yield message
+        finally:
+            self.subscribers.discard(queue)
+
+    # ------------------------------------------------------------------
+    # Change stream loop
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._watch()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams unavailable (standalone MongoDB?) - dashboard falls back to polling")
+                    await self._poll()
+                    return
+                logger.error(f"Dashboard change stream failed: {e}")
+            except PyMongoError as e:
+                logger.error(f"Dashboard change stream failed: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+
+    async def _watch(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]
+        # Open the stream before loading so no change between the two is missed;
+        # replaying a change already reflected in the load is harmless.
+        async with self.db.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000) as stream:
+            self.mode = "change_stream"
+            await self.reload()
+            self.publish()
+            last_publish = time.monotonic()
+            while stream.alive:
+                change = await stream.try_next()
+                if change is not None:
+                    self.apply_change(change)
+                if self.period != current_period():
+                    await self.reload()
+                # Coalesce bursts; publish right away once the stream is idle
+                if change is None or time.monotonic() - last_publish >= FLUSH_INTERVAL:
+                    self.publish()
+                    last_publish = time.monotonic()
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            try:
+                await self.reload()
+                self.publish()
+            except PyMongoError as e:
+                logger.error(f"Dashboard reload failed: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,49 @@
+"""
+Order fields copied onto order_lines.
+
+Lines carry their order's customer_id, date and status so per-customer and
+per-product-over-time analytics are one indexed pipeline on order_lines
+instead of an orders -> lines join per order. The copies are written when
+the order is created and kept in step on status changes; data written before
+that is filled in by `backfill_order_lines` (backend/backfill_order_lines.py).
+"""
+from pymongo import UpdateMany
+
+# Order field -> field on each line
+DENORMALIZED_ORDER_FIELDS = ("customer_id", "date", "status")
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def order_line_fields(order: dict) -> dict:
+    """The order fields every line of `order` carries"""
+    return {field: order.get(field) for field in DENORMALIZED_ORDER_FIELDS}
+
+
+async def backfill_order_lines(db, batch_size: int = BACKFILL_BATCH_SIZE, after: str = None,
+                               progress=None) -> dict:
+    """
+    Copy customer_id/date/status from every order onto its lines, in order id
+    order, one bulk write per batch of orders. Idempotent; pass the last
+    reported order id as `after` to resume an interrupted run.
+    progress(last_order_id, orders_done) is called after each batch.
+    """
+    projection = {"_id": 0, "id": 1, **{field: 1 for field in DENORMALIZED_ORDER_FIELDS}}
+    orders_done = 0
+    lines_updated = 0
+    last_id = after
+    while True:
+        query = {"id": {"$gt": last_id}} if last_id else {}
+        batch = await db.orders.find(query, projection).sort("id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        result = await db.order_lines.bulk_write(
+            [UpdateMany({"order_id": order['id']}, {"$set": order_line_fields(order)}) for order in batch],
+            ordered=False
+        )
+        orders_done += len(batch)
+        lines_updated += result.modified_count
+        last_id = batch[-1]['id']
+        if progress:
+            progress(last_id, orders_done)
+    return {"orders": orders_done, "lines_updated": lines_updated, "last_order_id": last_id}
@@ -0,0 +1,11 @@
+"""
+Order statuses shared by the API, reports and background jobs
+"""
+
+# Orders that count as sales in revenue, reports, KPIs and customer lifecycle
+SALES_ORDER_STATUSES = ["Processing", "Packed", "Shipped", "Delivered"]
+
+# The goods have left the warehouse: the order's reserved stock is committed
+# the first time it reaches one of these (the UI ships and delivers; the API
+# also accepts COMPLETED)
+STOCK_COMMIT_STATUSES = ["Shipped", "Delivered", "COMPLETED"]
@@ -0,0 +1,295 @@
+"""
+Columnar export for offline analysis - orders, order lines, expenses and
+stock movements written as Parquet, one partition per month:
+
+    <output>/<table>/month=YYYY-MM/part-0.parquet
+
+The hive-style layout reads directly as one dataset, e.g. in DuckDB
+`read_parquet('<output>/order_lines/*/*.parquet', hive_partitioning=true)`
+or `pandas.read_parquet('<output>/order_lines')`.
+
+Exports are incremental. Every exported partition is recorded in
+`_export_state.json` with a signature of its source month (row count, latest
+date/updated_at, a checksum of the document ids, column layout); a run only
+rewrites months whose signature changed, and drops partitions whose month no
+longer has any data. Each file is written under a temporary name and renamed
+into place, so readers never see a half-written partition.
+
+pyarrow is only imported when an export runs.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+from .embedded_lines import attach_lines
+from .export import build_date_filter
+from .stock_ledger import MOVEMENT_TIME, movement_time_filter
+
+PARQUET_BATCH_SIZE = 5000
+STATE_FILE = "_export_state.json"
+PARTITION_FILE = "part-0.parquet"
+
+# Column order and type of each table. Dates become UTC timestamps, amounts
+# float64, counts int64; strings are dictionary-encoded by the Parquet writer.
+PARQUET_COLUMNS = {
+    'orders': [
+        ("id", "string"), ("date", "timestamp"), ("customer_id", "string"), ("customer_name", "string"),
+        ("channel", "string"), ("status", "string"), ("payment_status", "string"), ("payment_method", "string"),
+        ("shipping_paid_by_customer", "float"), ("shipping_cost", "float"),
+        ("order_total", "float"), ("cost_total", "float"), ("profit", "float"), ("profit_percent", "float"),
+        ("completed_at", "timestamp"),
+    ],
+    'order_lines': [
+        ("id", "string"), ("order_id", "string"), ("date", "timestamp"), ("customer_id", "string"),
+        ("channel", "string"), ("status", "string"), ("product_id", "string"), ("product_name", "string"),
+        ("quantity", "int"), ("sale_price", "float"), ("cost_price", "float"), ("discount", "float"),
+        ("line_total", "float"), ("line_profit", "float"),
+    ],
+    'expenses': [
+        ("id", "string"), ("date", "timestamp"), ("category", "string"), ("amount", "float"),
+        ("payment_status", "string"), ("supplier_id", "string"),
+    ],
+    'stock_movements': [
+        ("id", "string"), ("timestamp", "timestamp"), ("product_id", "string"), ("type", "string"),
+        ("change", "int"), ("source", "string"), ("source_id", "string"), ("note", "string"),
+    ],
+}
+
+# Where each table comes from. Order lines are written in the same pass as
+# their orders (taking date/customer/channel/status from the order), so they
+# work with both line layouts and need no denormalized fields.
+_SOURCES = {
+    'orders': {
+        "collection": "orders", "time": "$date", "sort": "date", "tables": ("orders", "order_lines"),
+        "filter": lambda start, end: build_date_filter("date", start, end),
+    },
+    'expenses': {
+        "collection": "expenses", "time": "$date", "sort": "date", "tables": ("expenses",),
+        "filter": lambda start, end: build_date_filter("date", start, end),
+    },
+    'stock_movements': {
+        "collection": "stock_movements", "time": MOVEMENT_TIME, "sort": "timestamp", "tables": ("stock_movements",),
+        "filter": movement_time_filter,
+    },
+}
+PARQUET_TABLES = tuple(PARQUET_COLUMNS)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa, table: str):
+    types = {
+        "string": pa.string(),
+        "float": pa.float64(),
+        "int": pa.int64(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in PARQUET_COLUMNS[table]])
+
+
+def _columns_version(table: str) -> str:
+    return hashlib.sha256(json.dumps(PARQUET_COLUMNS[table]).encode()).hexdigest()[:16]
+
+
+def _timestamp(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+_CONVERTERS = {
+    "string": lambda v: None if v is None else str(v),
+    "float": lambda v: None if v is None else float(v),
+    "int": lambda v: None if v is None else int(v),
+    "timestamp": _timestamp,
+}
+
+
+def _month_bounds(month: str) -> tuple:
+    """ISO range [first of month, first of next month) for "YYYY-MM" """
+    year, number = int(month[:4]), int(month[5:7])
+    next_month = f"{year + 1}-01" if number == 12 else f"{year}-{number + 1:02d}"
+    return f"{month}-01", f"{next_month}-01"
+
+
+def _id_hash(value) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+async def month_signatures(db, source: str) -> dict:
+    """
+    {"YYYY-MM": {"rows", "changed", "ids"}} for a source collection in one pass.
+    `ids` is the sum of a hash of every document id (mod 2**64), so it does not
+    depend on order and catches a delete plus a back-dated insert that leave
+    the row count and latest date as they were.
+    """
+    spec = _SOURCES[source]
+    pipeline = [{"$project": {
+        "_id": 0,
+        "id": {"$ifNull": ["$id", "$_id"]},
+        "month": {"$substr": [spec["time"], 0, 7]},
+        "changed": {"$ifNull": ["$updated_at", spec["time"]]},
+    }}]
+    months = {}
+    async for row in db[spec["collection"]].aggregate(pipeline, allowDiskUse=True):
+        month = row["month"]
+        # Documents without a usable date cannot be placed in a partition
+        if not (isinstance(month, str) and len(month) == 7 and month[4] == "-"):
+            continue
+        changed = str(row["changed"])
+        signature = months.get(month)
+        if signature is None:
+            months[month] = signature = {"rows": 0, "changed": changed, "ids": 0}
+        signature["rows"] += 1
+        signature["changed"] = max(signature["changed"], changed)
+        signature["ids"] = (signature["ids"] + _id_hash(row["id"])) % 2 ** 64
+    return {month: {**signature, "ids": f"{signature['ids']:016x}"} for month, signature in months.items()}
+
+
+def _rows(source: str, batch: list) -> dict:
+    """{table: rows} for one batch of source documents"""
+    if source != 'orders':
+        return {source: batch}
+    lines = []
+    for order in batch:
+        for line in order.get('lines', []):
+            lines.append({
+                **line,
+                "order_id": order['id'],
+                "date": order.get('date'),
+                "customer_id": order.get('customer_id'),
+                "channel": order.get('channel'),
+                "status": order.get('status'),
+            })
+    return {"orders": batch, "order_lines": lines}
+
+
+def _arrow_table(pa, table: str, rows: list):
+    return pa.Table.from_pydict(
+        {name: [_CONVERTERS[kind](row.get(name)) for row in rows] for name, kind in PARQUET_COLUMNS[table]},
+        schema=_schema(pa, table)
+    )
+
+
+async def _write_month(db, source: str, tables: list, month: str, output_dir: str, batch_size: int) -> dict:
+    """Stream one month of a source into a partition per table. Returns rows written per table."""
+    pa, pq = _pyarrow()
+    spec = _SOURCES[source]
+    start, end = _month_bounds(month)
+    partitions = {table: os.path.join(output_dir, table, f"month={month}") for table in tables}
+    writers = {}
+    written = {table: 0 for table in tables}
+    try:
+        for table, path in partitions.items():
+            os.makedirs(path, exist_ok=True)
+            writers[table] = pq.ParquetWriter(
+                os.path.join(path, PARTITION_FILE + ".tmp"), _schema(pa, table), compression="zstd"
+            )
+
+        async def flush(batch):
+            if source == 'orders' and "order_lines" in tables:
+                await attach_lines(db, "orders", batch)
+            for table, rows in _rows(source, batch).items():
+                if table in writers and rows:
+                    writers[table].write_table(_arrow_table(pa, table, rows))
+                    written[table] += len(rows)
+
+        cursor = db[spec["collection"]].find(spec["filter"](start, end), {"_id": 0}).sort(spec["sort"], 1)
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    for path in partitions.values():
+        os.replace(os.path.join(path, PARTITION_FILE + ".tmp"), os.path.join(path, PARTITION_FILE))
+    return written
+
+
+def _load_state(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"tables": {}}
+
+
+def _save_state(output_dir: str, state: dict):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+async def export_parquet(db, output_dir: str, tables: list = None, full: bool = False,
+                         batch_size: int = PARQUET_BATCH_SIZE, progress=None) -> dict:
+    """
+    Bring the Parquet export in `output_dir` up to date for `tables`
+    (default: all of PARQUET_TABLES). Only months that changed since the last
+    run are rewritten; `full` rewrites everything.
+    progress(tables, month, rows_by_table) is called after each month written.
+    Returns {table: {"written": [months], "unchanged": n, "removed": [months], "rows": n}}.
+    """
+    tables = list(tables or PARQUET_TABLES)
+    unknown = set(tables) - set(PARQUET_TABLES)
+    if unknown:
+        raise ValueError(f"Unknown table(s): {', '.join(sorted(unknown))}")
+    _pyarrow()
+    os.makedirs(output_dir, exist_ok=True)
+    state = _load_state(output_dir)
+    report = {table: {"written": [], "unchanged": 0, "removed": [], "rows": 0} for table in tables}
+
+    for source, spec in _SOURCES.items():
+        source_tables = [table for table in spec["tables"] if table in tables]
+        if not source_tables:
+            continue
+        signatures = await month_signatures(db, source)
+        for month, signature in sorted(signatures.items()):
+            stale = [
+                table for table in source_tables
+                if full
+                or state["tables"].get(table, {}).get(month) != {**signature, "columns": _columns_version(table)}
+                or not os.path.exists(os.path.join(output_dir, table, f"month={month}", PARTITION_FILE))
+            ]
+            for table in set(source_tables) - set(stale):
+                report[table]["unchanged"] += 1
+            if not stale:
+                continue
+            written = await _write_month(db, source, stale, month, output_dir, batch_size)
+            for table in stale:
+                state["tables"].setdefault(table, {})[month] = {**signature, "columns": _columns_version(table)}
+                report[table]["written"].append(month)
+                report[table]["rows"] += written[table]
+            _save_state(output_dir, state)
+            if progress:
+                progress(stale, month, written)
+
+        # Months that no longer have any source data
+        for table in source_tables:
+            exported = state["tables"].get(table, {})
+            for month in sorted(set(exported) - set(signatures)):
+                shutil.rmtree(os.path.join(output_dir, table, f"month={month}"), ignore_errors=True)
+                del exported[month]
+                report[table]["removed"].append(month)
+        _save_state(output_dir, state)
+
+    return report
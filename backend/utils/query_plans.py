@@ -0,0 +1,198 @@
+"""
+Query plan advisor - capture the queries a block of code issues, explain them
+and suggest indexes.
+
+`QueryCapture` is a pymongo command listener that keeps the full find /
+aggregate / count / distinct commands (register it before the client is
+created, like CommandCounter). `explain_query` re-runs a captured command as
+explain("executionStats") and `summarize_plan` reduces the output to what
+matters: collection scans, in-memory sorts and docs examined per doc returned.
+`suggest_index` proposes a compound index for the query shape following the
+equality -> sort -> range rule, or a partial index when the filter only asks
+for documents that have a field.
+"""
+import copy
+import json
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+
+# Session / transport fields the driver adds; explain rejects or ignores them
+DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "$db", "$clusterTime",
+                 "$readPreference", "readConcern"}
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$regex"}
+
+# A scan this small is not worth an index (app_state, users, ...)
+MIN_DOCS_EXAMINED = 100
+# Docs examined per doc returned above which the index is not selective enough
+EXAMINED_RATIO_LIMIT = 10
+
+
+class QueryCapture(monitoring.CommandListener):
+    def __init__(self):
+        self._recording = None
+
+    def started(self, event):
+        if self._recording is None or event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        command = {k: copy.deepcopy(v) for k, v in event.command.items() if k not in DRIVER_FIELDS}
+        self._recording.append(command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    @contextmanager
+    def capture(self):
+        """Collect the explainable commands issued inside the block"""
+        commands = []
+        previous, self._recording = self._recording, commands
+        try:
+            yield commands
+        finally:
+            self._recording = previous
+
+
+def command_filter_and_sort(command: dict) -> tuple:
+    """(collection, filter, sort) the command's index lookup depends on"""
+    name = next(iter(command))
+    collection = command[name]
+    if name == "find":
+        return collection, command.get("filter") or {}, command.get("sort") or {}
+    if name in ("count", "distinct"):
+        return collection, command.get("query") or {}, {}
+
+    # aggregate: only a leading $match (and a $sort right after it) can use an index
+    query, sort = {}, {}
+    for stage in command.get("pipeline", []):
+        if "$match" in stage and not query and not sort:
+            query = stage["$match"]
+        elif "$sort" in stage and not sort:
+            sort = stage["$sort"]
+        else:
+            break
+    return collection, query, sort
+
+
+def _shape(value):
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        return [_shape(v) for v in value]
+    return 1
+
+
+def query_shape(command: dict) -> str:
+    """Stable key for a query with its literal values removed"""
+    name = next(iter(command))
+    collection, query, sort = command_filter_and_sort(command)
+    shape = {"command": name, "collection": collection, "filter": _shape(query), "sort": dict(sort)}
+    if name == "aggregate":
+        shape["pipeline"] = [next(iter(stage)) for stage in command.get("pipeline", [])]
+    return json.dumps(shape, sort_keys=True, default=str)
+
+
+async def explain_query(db, command: dict) -> dict:
+    return await db.command({"explain": command, "verbosity": "executionStats"})
+
+
+def _plan_stages(node, stages: list):
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node)
+        for key in ("queryPlan", "inputStage", "thenStage", "elseStage"):
+            _plan_stages(node.get(key), stages)
+        for child in node.get("inputStages", []):
+            _plan_stages(child, stages)
+    return stages
+
+
+def summarize_plan(explain: dict) -> dict:
+    """Stages, scan kind and examined/returned counts from explain output"""
+    pipeline_sort = False
+    if "stages" in explain:
+        # Aggregation that was not fully pushed down: the $cursor stage holds the query plan
+        cursor = explain["stages"][0].get("$cursor", {})
+        pipeline_sort = any("$sort" in stage for stage in explain["stages"][1:])
+        planner, stats = cursor.get("queryPlanner", {}), cursor.get("executionStats", {})
+    else:
+        planner, stats = explain.get("queryPlanner", {}), explain.get("executionStats", {})
+
+    stages = _plan_stages(planner.get("winningPlan", {}), [])
+    names = [stage["stage"] for stage in stages]
+    docs_examined = stats.get("totalDocsExamined", 0)
+    returned = stats.get("nReturned", 0)
+    return {
+        "stages": names,
+        "indexes": sorted({stage["indexName"] for stage in stages if stage.get("indexName")}),
+        "collscan": "COLLSCAN" in names,
+        "in_memory_sort": pipeline_sort or "SORT" in names,
+        "docs_examined": docs_examined,
+        "keys_examined": stats.get("totalKeysExamined", 0),
+        "returned": returned,
+        "ratio": round(docs_examined / max(returned, 1), 1),
+        "millis": stats.get("executionTimeMillis", 0),
+    }
+
+
+def plan_problems(summary: dict) -> list:
+    problems = []
+    if summary["docs_examined"] < MIN_DOCS_EXAMINED and not summary["in_memory_sort"]:
+        return problems
+    if summary["collscan"]:
+        problems.append(f"COLLSCAN over {summary['docs_examined']:,} docs")
+    if summary["in_memory_sort"]:
+        problems.append("in-memory sort")
+    if not summary["collscan"] and summary["ratio"] > EXAMINED_RATIO_LIMIT:
+        problems.append(f"{summary['ratio']:,.0f} docs examined per doc returned")
+    return problems
+
+
+def suggest_index(command: dict):
+    """
+    Index for the query as {"collection", "keys": [(field, direction)], "partial"},
+    or None when the query has nothing an index could use.
+    """
+    collection, query, sort = command_filter_and_sort(command)
+    equality, ranges, partial = [], [], {}
+    for field, condition in query.items():
+        if field.startswith("$"):
+            continue  # $or / $and / $expr - no single compound index fits
+        if not isinstance(condition, dict) or "$eq" in condition:
+            equality.append(field)
+        elif condition.get("$exists") is True or ("$ne" in condition and condition["$ne"] is None):
+            # "has this field" - a partial index keeps the other documents out entirely
+            partial[field] = {"$exists": True}
+        elif "$in" in condition and not sort:
+            equality.append(field)
+        elif set(condition) & (RANGE_OPERATORS | {"$in"}):
+            ranges.append(field)
+
+    keys = [(field, 1) for field in equality]
+    keys += [(field, direction) for field, direction in dict(sort).items() if field not in equality]
+    keys += [(field, 1) for field in ranges if field not in dict(keys)]
+    if not keys:
+        if not partial:
+            return None
+        keys = [(field, 1) for field in partial]
+    return {"collection": collection, "keys": keys, "partial": partial or None}
+
+
+def index_covers(existing_keys: list, keys: list) -> bool:
+    """True when an existing index starts with the suggested keys"""
+    return [tuple(k) for k in existing_keys[:len(keys)]] == [tuple(k) for k in keys]
+
+
+def format_index_model(suggestion: dict) -> str:
+    """The suggestion as a line for INDEXES in db_indexes.py"""
+    keys = ", ".join(f'("{field}", {"DESCENDING" if direction == -1 else "ASCENDING"})'
+                     for field, direction in suggestion["keys"])
+    options = ""
+    if suggestion["partial"]:
+        options = f", partialFilterExpression={json.dumps(suggestion['partial']).replace('true', 'True')}"
+    return f'"{suggestion["collection"]}": IndexModel([{keys}]{options})'
@@ -0,0 +1,195 @@
+"""
+Local product recommender - no network, no API key.
+
+Products are indexed once per catalog version into an inverted index of
+terms -> {product: BM25 weight}. Terms come from health_areas tags,
+category, name and description tokens; Norwegian health keywords in the
+customer description are expanded to the matching health area. A query
+is then a sparse sum over the postings of its terms.
+"""
+import math
+import re
+from collections import Counter
+
+# Keywords (before stemming) that point to each health area tag
+HEALTH_KEYWORDS = {
+    "Immun": [
+        "immun", "immunforsvar", "forkjølelse", "forkjølet", "syk", "sykdom", "infeksjon",
+        "influensa", "hoste", "vinter", "mørketid", "sol",
+    ],
+    "Søvn": [
+        "søvn", "sove", "sovne", "innsovning", "våkner", "søvnløs", "søvnproblemer",
+        "rastløs", "uro", "natt", "kveld", "avslapning",
+    ],
+    "Energi": [
+        "energi", "trøtt", "trøtthet", "sliten", "utmattet", "slapp", "orker", "tretthet",
+        "kraftløs", "vinter", "mørketid",
+    ],
+    "Hjerte": [
+        "hjerte", "blodtrykk", "kolesterol", "sirkulasjon", "blodomløp", "kondisjon",
+    ],
+    "Hjerne": [
+        "hjerne", "konsentrasjon", "fokus", "hukommelse", "glemsk", "kognitiv", "læring",
+        "stress", "humør",
+    ],
+    "Ledd": [
+        "ledd", "stiv", "stivhet", "leddsmerter", "knær", "kne", "rygg", "bevegelighet",
+        "brusk", "gikt",
+    ],
+    "Hud": [
+        "hud", "hår", "negler", "tørr", "akne", "eksem", "rynker", "kollagen",
+    ],
+    "Øyne": [
+        "øyne", "øye", "syn", "skjerm", "netthinne",
+    ],
+    "Mage": [
+        "mage", "fordøyelse", "oppblåst", "forstoppelse", "diaré", "tarm", "magesmerter",
+        "tarmflora",
+    ],
+}
+
+STOPWORDS = {
+    "og", "i", "er", "en", "et", "ei", "om", "på", "med", "til", "for", "av", "har", "som",
+    "det", "den", "de", "jeg", "hun", "han", "kunden", "kunde", "seg", "sin", "sitt", "ikke",
+    "men", "eller", "at", "så", "fra", "mye", "litt", "veldig", "ofte", "når", "etter", "vil",
+    "kan", "skal", "også", "the", "and",
+}
+
+# Field weights: a tag match counts more than a word somewhere in the description
+AREA_WEIGHT = 3
+CATEGORY_WEIGHT = 2
+NAME_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+DEFAULT_DOSE = "Følg anbefalt dosering på pakningen"
+
+_TOKEN = re.compile(r"[a-zæøå0-9]+")
+_SUFFIXES = ("ene", "het", "en", "er", "et", "e")
+
+
+def stem(token: str) -> str:
+    """
+    Very light Norwegian stemming (leddene -> ledd, vinteren -> vint).
+    Repeated until stable so inflected forms and base words meet.
+    """
+    while True:
+        for suffix in _SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+                token = token[:-len(suffix)]
+                break
+        else:
+            return token
+
+
+def tokenize(text: str) -> list:
+    return [stem(t) for t in _TOKEN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def area_term(area: str) -> str:
+    return f"area:{area.lower()}"
+
+
+# stemmed keyword -> health areas
+KEYWORD_AREAS = {}
+for _area, _keywords in HEALTH_KEYWORDS.items():
+    for _keyword in _keywords:
+        KEYWORD_AREAS.setdefault(stem(_keyword), set()).add(_area)
+
+
+def product_terms(product: dict) -> Counter:
+    terms = Counter()
+    for area in product.get('health_areas') or []:
+        terms[area_term(area)] += AREA_WEIGHT
+    if product.get('category'):
+        terms[f"cat:{product['category'].lower()}"] += CATEGORY_WEIGHT
+        for token in tokenize(product['category']):
+            terms[token] += CATEGORY_WEIGHT
+    for token in tokenize(product.get('name')):
+        terms[token] += NAME_WEIGHT
+    description = " ".join(filter(None, [
+        product.get('subcategory'), product.get('short_description'), product.get('description')
+    ]))
+    for token in tokenize(description):
+        terms[token] += DESCRIPTION_WEIGHT
+    return terms
+
+
+def query_terms(text: str) -> Counter:
+    """Context tokens plus the health areas their keywords point to"""
+    terms = Counter()
+    for token in tokenize(text):
+        terms[token] += 1
+        for area in KEYWORD_AREAS.get(token, ()):
+            terms[area_term(area)] += 1
+    return terms
+
+
+class RecommendationIndex:
+    """Inverted index with BM25 weights precomputed at build time"""
+
+    def __init__(self, products: list, version=None):
+        self.version = version
+        self.products = products
+        self.postings = {}
+
+        doc_terms = [product_terms(p) for p in products]
+        lengths = [sum(terms.values()) for terms in doc_terms]
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 0
+        doc_freq = Counter(term for terms in doc_terms for term in terms)
+        n = len(products)
+
+        for i, terms in enumerate(doc_terms):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[i] / avg_length) if avg_length else BM25_K1
+            for term, tf in terms.items():
+                idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                weight = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                self.postings.setdefault(term, {})[i] = weight
+
+    def search(self, text: str, limit: int = 3) -> list:
+        """[(product, score, matched_terms)] best first"""
+        scores = Counter()
+        matched = {}
+        for term, qtf in query_terms(text).items():
+            for i, weight in self.postings.get(term, {}).items():
+                scores[i] += qtf * weight
+                matched.setdefault(i, []).append(term)
+        return [(self.products[i], score, matched[i]) for i, score in scores.most_common(limit)]
+
+
+def _reason(product: dict, terms: list) -> str:
+    areas = [t.split(":", 1)[1].capitalize() for t in terms if t.startswith("area:")]
+    if areas:
+        return f"Passer for behov innen {', '.join(sorted(set(areas)))}."
+    return f"Produktbeskrivelsen matcher kundens behov ({', '.join(terms[:3])})."
+
+
+def recommend_products(index: RecommendationIndex, customer_context: str, limit: int = 3) -> dict:
+    """Recommendations in the same shape as the AI response"""
+    results = index.search(customer_context, limit)
+    needs = sorted({
+        area for token in tokenize(customer_context) for area in KEYWORD_AREAS.get(token, ())
+    })
+
+    products = [
+        {
+            "name": product.get('name'),
+            "reason": _reason(product, terms),
+            "dose": product.get('dose') or DEFAULT_DOSE,
+        }
+        for product, _, terms in results
+    ]
+
+    lines = ["**Identifiserte behov**"]
+    lines.append(", ".join(needs) if needs else "Ingen tydelige helseområder funnet i beskrivelsen.")
+    if products:
+        lines.append("**Anbefalte produkter**")
+        lines.extend(f"- {p['name']}: {p['reason']}" for p in products)
+    else:
+        lines.append("Fant ingen produkter som matcher beskrivelsen. Prøv å beskrive behovet mer konkret.")
+    lines.append("**Viktig**")
+    lines.append("Dette er generelle anbefalinger basert på produktdata, ikke medisinske råd.")
+
+    return {"products": products, "explanation": "\n".join(lines)}
@@ -0,0 +1,76 @@
+"""
+Bounded in-process cache for expensive async calls (e.g. LLM round trips).
+LRU eviction, per-entry TTL, and single-flight: concurrent calls for the
+same key share one upstream call.
+"""
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_context(text: str) -> str:
+    """Case, punctuation and whitespace differences map to the same key"""
+    return " ".join(_NON_WORD.sub(" ", (text or "").lower()).split())
+
+
+def context_key(text: str, version) -> str:
+    return hashlib.sha256(f"{version}:{normalize_context(text)}".encode("utf-8")).hexdigest()
+
+
+class AsyncTTLCache:
+    def __init__(self, maxsize: int = 256, ttl: float = 86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_compute(self, key, factory):
+        """
+        Cached value for key, or await factory() once and cache its result.
+        Failures are not cached; concurrent waiters get the same exception.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        future = self._in_flight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(factory())
+            self._in_flight[key] = future
+            try:
+                value = await asyncio.shield(future)
+            finally:
+                self._in_flight.pop(key, None)
+            self.set(key, value)
+            return value
+
+        self.hits += 1
+        return await asyncio.shield(future)
@@ -0,0 +1,245 @@
+"""
+Stock ledger - stock_movements treated as an append-only event log.
+
+Periodic snapshots fold the log into per-product quantities at a cutoff
+(`stock_snapshots`, one document per product and cutoff). A run is only
+visible once its marker is written to `stock_snapshot_runs`, so a crashed
+compaction never produces a half-written snapshot.
+
+All ranges are half-open: a snapshot at `as_of` covers movements with
+timestamp < as_of, and a point-in-time query at T replays as_of <= ts < T.
+"""
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+# Movement timestamp (newer docs use `timestamp`, legacy ones only `date`)
+MOVEMENT_TIME = {"$ifNull": ["$timestamp", "$date"]}
+
+# Signed quantity change of a movement - the one rule every ledger query uses.
+# ADJUST carries its own sign; IN/OUT are normalized because older code
+# wrote OUT movements with a positive `change`.
+# Stock leaves on order completion (a negative OUT per line). Older code also
+# logged a positive OUT when the order was created; that only held the stock,
+# so it counts as 0 - otherwise completed orders are subtracted twice and
+# open or cancelled orders once.
+_RAW_CHANGE = {"$ifNull": ["$change", "$quantity"]}
+ORDER_CREATED_OUT = {"$and": [
+    {"$eq": ["$type", "OUT"]},
+    {"$eq": ["$source", "ORDER"]},
+    {"$gt": [_RAW_CHANGE, 0]},
+]}
+SIGNED_CHANGE = {"$switch": {
+    "branches": [
+        {"case": ORDER_CREATED_OUT, "then": 0},
+        {"case": {"$eq": ["$type", "ADJUST"]}, "then": _RAW_CHANGE},
+        {"case": {"$eq": ["$type", "OUT"]}, "then": {"$multiply": [-1, {"$abs": _RAW_CHANGE}]}},
+    ],
+    "default": {"$abs": _RAW_CHANGE}
+}}
+
+
+
+def signed_change(movement: dict) -> int:
+    """SIGNED_CHANGE for one movement document, for code applying it to stock"""
+    raw = movement.get('change')
+    if raw is None:
+        raw = movement.get('quantity') or 0
+    if movement.get('type') == "OUT" and movement.get('source') == "ORDER" and raw > 0:
+        return 0
+    if movement.get('type') == "ADJUST":
+        return raw
+    if movement.get('type') == "OUT":
+        return -abs(raw)
+    return abs(raw)
+
+# Stock edits logged by older code as an IN of the new absolute quantity
+LEGACY_ABSOLUTE_ENTRY = {"$and": [{"$eq": ["$type", "IN"]}, {"$eq": ["$note", "Manual adjustment"]}]}
+
+SNAPSHOT_WRITE_BATCH = 1000
+
+
+def movement_time_filter(start: str = None, end: str = None) -> dict:
+    """Match movements with start <= time < end on either timestamp field"""
+    time_range = {}
+    if start:
+        time_range["$gte"] = start
+    if end:
+        time_range["$lt"] = end
+    if not time_range:
+        return {}
+    return {"$or": [
+        {"timestamp": time_range},
+        {"timestamp": None, "date": time_range},
+    ]}
+
+
+async def sum_movements(db, start: str = None, end: str = None, product_id: str = None) -> dict:
+    """{product_id: signed change} for movements in [start, end)"""
+    match = movement_time_filter(start, end)
+    if product_id:
+        match = {**match, "product_id": product_id}
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$product_id", "change": {"$sum": SIGNED_CHANGE}, "count": {"$sum": 1}}},
+    ]
+    totals = {}
+    async for row in db.stock_movements.aggregate(pipeline, allowDiskUse=True):
+        totals[row["_id"]] = {"change": row["change"], "count": row["count"]}
+    return totals
+
+
+
+async def ledger_summary(db) -> dict:
+    """
+    {product_id: {"quantity", "movements", "absolute_entries"}} from the full
+    movement history in one aggregation. absolute_entries counts legacy
+    "Manual adjustment" IN movements, which logged the new total instead of
+    the change - a product with any of them cannot be rebuilt from the ledger.
+    """
+    pipeline = [
+        {"$group": {
+            "_id": "$product_id",
+            "quantity": {"$sum": SIGNED_CHANGE},
+            "movements": {"$sum": 1},
+            "absolute_entries": {"$sum": {"$cond": [LEGACY_ABSOLUTE_ENTRY, 1, 0]}},
+        }},
+    ]
+    summary = {}
+    async for row in db.stock_movements.aggregate(pipeline, allowDiskUse=True):
+        summary[row.pop("_id")] = row
+    return summary
+
+
+async def expected_stock_levels(db) -> dict:
+    """{product_id: quantity} from the full movement history"""
+    return {pid: row["quantity"] for pid, row in (await ledger_summary(db)).items()}
+
+
+async def latest_snapshot_run(db, before: str = None):
+    """Most recent completed snapshot run with as_of <= before"""
+    query = {"as_of": {"$lte": before}} if before else {}
+    return await db.stock_snapshot_runs.find_one(query, {"_id": 0}, sort=[("as_of", -1)])
+
+
+async def load_snapshot(db, as_of: str, product_id: str = None) -> dict:
+    query = {"as_of": as_of}
+    if product_id:
+        query["product_id"] = product_id
+    quantities = {}
+    async for snap in db.stock_snapshots.find(query, {"_id": 0, "product_id": 1, "quantity": 1}):
+        quantities[snap["product_id"]] = snap["quantity"]
+    return quantities
+
+
+async def stock_as_of(db, as_of: str, product_id: str = None) -> dict:
+    """
+    Stock per product at instant `as_of` (ISO string, exclusive).
+    Loads the nearest snapshot and replays only the movements after it.
+    """
+    run = await latest_snapshot_run(db, as_of)
+    base_as_of = run["as_of"] if run else None
+    quantities = await load_snapshot(db, base_as_of, product_id) if run else {}
+
+    tail = await sum_movements(db, base_as_of, as_of, product_id)
+    for pid, row in tail.items():
+        quantities[pid] = quantities.get(pid, 0) + row["change"]
+
+    return {
+        "as_of": as_of,
+        "snapshot_as_of": base_as_of,
+        "replayed_movements": sum(row["count"] for row in tail.values()),
+        "quantities": quantities,
+    }
+
+
+async def create_snapshot(db, as_of: str) -> dict:
+    """
+    Fold movements up to `as_of` into a new snapshot run.
+    Only the movements since the previous run are read. Re-running is idempotent.
+    """
+    previous = await db.stock_snapshot_runs.find_one({"as_of": {"$lt": as_of}}, {"_id": 0}, sort=[("as_of", -1)])
+    previous_as_of = previous["as_of"] if previous else None
+    quantities = await load_snapshot(db, previous_as_of) if previous else {}
+
+    window = await sum_movements(db, previous_as_of, as_of)
+    for pid, row in window.items():
+        quantities[pid] = quantities.get(pid, 0) + row["change"]
+
+    created_at = datetime.now(timezone.utc).isoformat()
+    ops = [
+        UpdateOne(
+            {"product_id": pid, "as_of": as_of},
+            {"$set": {"quantity": qty, "created_at": created_at}},
+            upsert=True
+        )
+        for pid, qty in quantities.items()
+    ]
+    for i in range(0, len(ops), SNAPSHOT_WRITE_BATCH):
+        await db.stock_snapshots.bulk_write(ops[i:i + SNAPSHOT_WRITE_BATCH], ordered=False)
+
+    run = {
+        "as_of": as_of,
+        "previous_as_of": previous_as_of,
+        "products": len(quantities),
+        "movements_folded": sum(row["count"] for row in window.values()),
+        "created_at": created_at,
+    }
+    # Marker last: the run becomes visible only after all snapshot docs exist
+    await db.stock_snapshot_runs.update_one({"as_of": as_of}, {"$set": run}, upsert=True)
+    return run
+
+
+def period_boundaries(start: datetime, end: datetime, period: str):
+    """UTC day/month boundaries in (start, end]"""
+    if period == "month":
+        current = datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+    else:
+        current = start.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    while True:
+        if period == "month":
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current = current + timedelta(days=1)
+        if current > end:
+            return
+        yield current
+
+
+async def compact_stock_ledger(db, until: datetime = None, period: str = "day") -> list:
+    """
+    Create snapshot runs at every day/month boundary since the last run (or the
+    first movement) up to `until` (default: start of today, UTC).
+    """
+    until = until or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    last = await latest_snapshot_run(db)
+    if last:
+        start = datetime.fromisoformat(last["as_of"])
+    else:
+        first = await db.stock_movements.aggregate([
+            {"$group": {"_id": None, "first": {"$min": MOVEMENT_TIME}}}
+        ]).to_list(1)
+        if not first or not first[0]["first"]:
+            return []
+        start = datetime.fromisoformat(first[0]["first"])
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+
+    runs = []
+    for boundary in period_boundaries(start, until, period):
+        runs.append(await create_snapshot(db, boundary.isoformat()))
+    return runs
+
+
+async def prune_snapshots(db, keep_daily_days: int = 90) -> int:
+    """
+    Drop daily snapshot runs older than keep_daily_days, keeping month starts,
+    so old history stays queryable with at most a month of replay.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=keep_daily_days)).isoformat()
+    query = {"as_of": {"$lt": cutoff, "$not": {"$regex": r"^\d{4}-\d{2}-01T00:00:00"}}}
+    # Runs first so queries stop using them before their snapshot docs disappear
+    result = await db.stock_snapshot_runs.delete_many(query)
+    await db.stock_snapshots.delete_many(query)
+    return result.deleted_count
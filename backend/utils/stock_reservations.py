@@ -0,0 +1,226 @@
+"""
+Stock reservations - stock is held for an order from creation until it is
+shipped or completed (commit), cancelled (release) or the hold expires
+(sweeper).
+
+The held total is kept on the product as `reserved_quantity`, next to
+`stock_quantity`, so available-to-promise is one indexed read:
+available = stock_quantity - reserved_quantity. Reserving is a single
+conditional update that only matches while enough stock is available, so
+two orders can never hold the same units. Each hold is also recorded in
+`stock_reservations` (one document per order line) to know what to commit
+or release.
+
+Placing an order changes neither stock_quantity nor the db.stock quantity
+that mirrors it; both drop together when the order is committed.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_RESERVATION_TTL = timedelta(days=7)
+SWEEP_INTERVAL_SECONDS = 60
+SWEEP_BATCH_SIZE = 500
+
+AVAILABLE = {"$subtract": [{"$ifNull": ["$stock_quantity", 0]}, {"$ifNull": ["$reserved_quantity", 0]}]}
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStockError(Exception):
+    """Raised when a product has fewer units available than requested"""
+
+    def __init__(self, product_id: str, product_name: str, available: int, required: int):
+        super().__init__(
+            f"Insufficient stock for {product_name}. Available: {available}, Required: {required}"
+        )
+        self.product_id = product_id
+        self.available = available
+        self.required = required
+
+
+def _available(product: dict) -> int:
+    return product.get('stock_quantity', 0) - product.get('reserved_quantity', 0)
+
+
+async def available_to_promise(db, product_ids: list = None) -> dict:
+    """{product_id: {"on_hand", "reserved", "available"}} from the products themselves"""
+    query = {"id": {"$in": list(product_ids)}} if product_ids is not None else {}
+    projection = {"_id": 0, "id": 1, "stock_quantity": 1, "reserved_quantity": 1}
+    return {
+        p['id']: {
+            "on_hand": p.get('stock_quantity', 0),
+            "reserved": p.get('reserved_quantity', 0),
+            "available": _available(p),
+        }
+        async for p in db.products.find(query, projection)
+    }
+
+
+async def _hold(db, product_id: str, quantity: int) -> bool:
+    result = await db.products.update_one(
+        {"id": product_id, "$expr": {"$gte": [AVAILABLE, quantity]}},
+        {"$inc": {"reserved_quantity": quantity}}
+    )
+    return result.modified_count == 1
+
+
+async def _unhold(db, product_id: str, quantity: int):
+    await db.products.update_one({"id": product_id}, {"$inc": {"reserved_quantity": -quantity}})
+
+
+async def reserve_stock(db, order_id: str, lines: list, ttl: timedelta = DEFAULT_RESERVATION_TTL) -> list:
+    """
+    Hold stock for every line ({"product_id", "product_name", "quantity"}) of an order.
+    All or nothing: on a shortage the lines already held are released and
+    InsufficientStockError is raised.
+    """
+    now = datetime.now(timezone.utc)
+    held = []
+    for line in lines:
+        if line['quantity'] <= 0:
+            continue
+        if not await _hold(db, line['product_id'], line['quantity']):
+            for reservation in held:
+                await _unhold(db, reservation['product_id'], reservation['quantity'])
+            product = await db.products.find_one(
+                {"id": line['product_id']}, {"_id": 0, "stock_quantity": 1, "reserved_quantity": 1}
+            ) or {}
+            raise InsufficientStockError(
+                line['product_id'], line.get('product_name', line['product_id']), _available(product), line['quantity']
+            )
+        held.append({
+            "id": str(uuid.uuid4()),
+            "order_id": order_id,
+            "product_id": line['product_id'],
+            "quantity": line['quantity'],
+            "status": "active",
+            "created_at": now.isoformat(),
+            "expires_at": now + ttl,
+        })
+    if held:
+        await db.stock_reservations.insert_many([dict(reservation) for reservation in held])
+    return held
+
+
+async def _close(db, reservation: dict, status: str) -> bool:
+    """Move one reservation out of "active"; only the caller that wins the transition may act on it"""
+    result = await db.stock_reservations.update_one(
+        {"id": reservation['id'], "status": "active"},
+        {"$set": {"status": status, "closed_at": datetime.now(timezone.utc)}}
+    )
+    return result.modified_count == 1
+
+
+async def release_reservations(db, order_id: str, status: str = "released") -> int:
+    """Give back the stock held for an order (cancelled, refunded...). Returns units released."""
+    released = 0
+    async for reservation in db.stock_reservations.find({"order_id": order_id, "status": "active"}, {"_id": 0}):
+        if await _close(db, reservation, status):
+            await _unhold(db, reservation['product_id'], reservation['quantity'])
+            released += reservation['quantity']
+    return released
+
+
+async def commit_reservations(db, order_id: str, lines: list) -> None:
+    """
+    Take the order's stock out of stock_quantity (and the db.stock mirror).
+    Lines still held move from reserved to sold in one update; lines without
+    an active hold (expired, or orders created before reservations) are taken
+    from available stock with the same conditional update as a reservation.
+    A hold the sweeper expires between the read and the commit is taken again
+    the same way. Raises InsufficientStockError if that stock is gone; what
+    was committed stays committed, and a retry only takes what is missing.
+    """
+    reservations = await db.stock_reservations.find(
+        {"order_id": order_id, "status": {"$in": ["active", "committed"]}}, {"_id": 0}
+    ).to_list(None)
+    active = [r for r in reservations if r['status'] == "active"]
+    # Committed units count as covered, so a repeated commit takes nothing twice
+    held = {}
+    for reservation in reservations:
+        held[reservation['product_id']] = held.get(reservation['product_id'], 0) + reservation['quantity']
+    needed = {}
+    names = {}
+    for line in lines:
+        needed[line['product_id']] = needed.get(line['product_id'], 0) + line['quantity']
+        names[line['product_id']] = line.get('product_name', line['product_id'])
+
+    # Hold whatever the active reservations do not cover, so the commit below cannot fail halfway
+    extra = [
+        {"product_id": pid, "product_name": names[pid], "quantity": quantity - held.get(pid, 0)}
+        for pid, quantity in needed.items() if quantity > held.get(pid, 0)
+    ]
+    pending = active + await reserve_stock(db, order_id, extra)
+
+    while pending:
+        lost = []
+        for reservation in pending:
+            if await _close(db, reservation, "committed"):
+                await db.products.update_one(
+                    {"id": reservation['product_id']},
+                    {
+                        "$inc": {"stock_quantity": -reservation['quantity'], "reserved_quantity": -reservation['quantity']},
+                        "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+                    }
+                )
+                await db.stock.update_one(
+                    {"product_id": reservation['product_id']}, {"$inc": {"quantity": -reservation['quantity']}}
+                )
+                continue
+            current = await db.stock_reservations.find_one({"id": reservation['id']}, {"_id": 0, "status": 1})
+            if current and current['status'] != "committed":
+                lost.append({
+                    "product_id": reservation['product_id'],
+                    "product_name": names.get(reservation['product_id'], reservation['product_id']),
+                    "quantity": reservation['quantity'],
+                })
+        pending = await reserve_stock(db, order_id, lost)
+
+
+async def release_expired_reservations(db, now: datetime = None, limit: int = SWEEP_BATCH_SIZE) -> int:
+    """Release holds whose expires_at has passed. Safe to run in several workers at once."""
+    now = now or datetime.now(timezone.utc)
+    expired = await db.stock_reservations.find(
+        {"status": "active", "expires_at": {"$lte": now}}, {"_id": 0}
+    ).limit(limit).to_list(limit)
+    released = 0
+    for reservation in expired:
+        if await _close(db, reservation, "expired"):
+            await _unhold(db, reservation['product_id'], reservation['quantity'])
+            released += 1
+    return released
+
+
+class ReservationSweeper:
+    """Background loop that releases expired reservations every `interval` seconds"""
+
+    def __init__(self, db, interval: float = SWEEP_INTERVAL_SECONDS):
+        self.db = db
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                while await release_expired_reservations(self.db) == SWEEP_BATCH_SIZE:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Reservation sweep failed: {e}")
+            await asyncio.sleep(self.interval)
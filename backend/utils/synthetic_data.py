@@ -0,0 +1,595 @@
+"""
+Synthetic data at load-test scale (1k - 10M orders).
+
+Everything is derived from one seeded RNG and deterministic ids, so the same
+seed, scale and end date always produce the same database. Documents are
+generated in time order and streamed to MongoDB in insert_many batches with
+several batches in flight at once; only products, suppliers and their
+running stock levels are kept in memory.
+
+The data is internally consistent: order lines reference real products and
+customers, every shipped order and received purchase has matching stock
+movements, orders not shipped yet hold stock reservations (as the server
+does), and stock/products.stock_quantity equal the ledger.
+Customer stats and status are filled in afterwards by the lifecycle job.
+Order and purchase lines go to order_lines / purchase_lines, or into their
+parents with `embedded_lines=True` (LINES_LAYOUT=embedded).
+"""
+import asyncio
+import itertools
+import random
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from .customer_lifecycle import recompute_customer_lifecycle
+from .db_indexes import create_indexes
+from .embedded_lines import embedded_line
+from .order_status import STOCK_COMMIT_STATUSES
+from .stock_reservations import DEFAULT_RESERVATION_TTL
+
+SYNTHETIC_COLLECTIONS = [
+    "products", "stock", "stock_movements", "suppliers", "purchases", "purchase_lines",
+    "customers", "customer_timeline", "orders", "order_lines", "tasks", "expenses", "stock_reservations",
+]
+
+PRODUCT_BASES = [
+    ("Vitamin D3", "vitamin", ["Immun", "Energi"]),
+    ("Omega-3", "supplement", ["Hjerte", "Hjerne"]),
+    ("Magnesium", "mineral", ["Søvn", "Energi"]),
+    ("Vitamin C", "vitamin", ["Immun"]),
+    ("Sink", "mineral", ["Immun", "Hud"]),
+    ("B12", "vitamin", ["Energi", "Hjerne"]),
+    ("Jern", "mineral", ["Energi"]),
+    ("Kollagen", "supplement", ["Hud", "Ledd"]),
+    ("Glukosamin", "supplement", ["Ledd"]),
+    ("Probiotika", "supplement", ["Mage", "Immun"]),
+    ("Lutein", "supplement", ["Øyne"]),
+    ("Ashwagandha", "supplement", ["Søvn", "Hjerne"]),
+    ("Q10", "supplement", ["Hjerte", "Energi"]),
+    ("Kalsium", "mineral", ["Ledd"]),
+    ("Biotin", "vitamin", ["Hud"]),
+    ("Multivitamin", "vitamin", ["Energi", "Immun"]),
+]
+PRODUCT_VARIANTS = ["", "Forte", "Premium", "Kids", "Sport", "Vegan", "Kapsler", "Tyggetabletter", "Flytende", "Depot"]
+PACK_SIZES = [60, 30, 90, 120]
+MAX_PRODUCTS = len(PRODUCT_BASES) * len(PRODUCT_VARIANTS) * len(PACK_SIZES)
+
+SUPPLIER_NAMES = [
+    "Nordic Supplements", "VitaImport Norge", "Fjord Helse", "Polar Nutrition", "Nordlys Vitaminer",
+    "Skandinavisk Helsekost", "Aurora Pharma", "Vestland Naturprodukter",
+]
+FIRST_NAMES = [
+    "Kari", "Ola", "Ingrid", "Lars", "Nora", "Jonas", "Emma", "Henrik", "Sofie", "Magnus",
+    "Ida", "Anders", "Maja", "Erik", "Thea", "Kristian", "Sara", "Martin", "Hanne", "Per",
+]
+LAST_NAMES = [
+    "Hansen", "Johansen", "Olsen", "Larsen", "Andersen", "Pedersen", "Nilsen", "Kristiansen",
+    "Jensen", "Karlsen", "Johnsen", "Pettersen", "Eriksen", "Berg", "Haugen", "Hagen",
+]
+CITIES = [
+    ("Oslo", "0150"), ("Bergen", "5003"), ("Trondheim", "7010"), ("Stavanger", "4006"),
+    ("Tromsø", "9008"), ("Kristiansand", "4610"), ("Drammen", "3015"), ("Bodø", "8006"),
+]
+CHANNELS = ["Shopify", "TikTok", "Instagram", "Direct", "Campaign"]
+CHANNEL_CUM_WEIGHTS = list(itertools.accumulate([45, 20, 15, 15, 5]))
+PAYMENT_METHODS = ["Card", "Vipps", "Klarna", "TikTokPay"]
+EXPENSE_AMOUNTS = {
+    "Marketing": (1500, 15000),
+    "Shipping": (500, 8000),
+    "Software": (300, 4000),
+    "Operations": (200, 6000),
+}
+
+LINE_COUNTS = [1, 2, 3, 4]
+LINES_PER_ORDER_CUM_WEIGHTS = list(itertools.accumulate([50, 30, 15, 5]))
+AVG_UNITS_PER_ORDER = 1.75 * 2              # lines * average quantity (1-3)
+STOCK_COVER_DAYS = 14                       # restock target
+REORDER_DAYS = 3                            # reorder point (lead time)
+EXISTING_CUSTOMER_SHARE = 0.1               # customers already there when the period starts
+
+SYNTHETIC_BATCH_SIZE = 5000
+SYNTHETIC_CONCURRENCY = 4
+
+
+def scale_counts(orders: int) -> dict:
+    """Collection sizes that grow with the number of orders"""
+    products = min(MAX_PRODUCTS, max(20, orders // 1000))
+    return {
+        "orders": orders,
+        "products": products,
+        "suppliers": min(len(SUPPLIER_NAMES), max(2, products // 25)),
+        "customers": max(100, orders // 5),
+        "tasks": max(20, orders // 200),
+        "expenses": max(20, orders // 100),
+    }
+
+
+class BatchWriter:
+    """Buffers documents per collection and keeps up to `concurrency` insert_many calls in flight"""
+
+    def __init__(self, db, batch_size: int = SYNTHETIC_BATCH_SIZE, concurrency: int = SYNTHETIC_CONCURRENCY):
+        self.db = db
+        self.batch_size = batch_size
+        self.counts = Counter()
+        self._buffers = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending = set()
+        self._errors = []
+
+    async def add(self, collection: str, doc: dict):
+        buffer = self._buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            await self._flush(collection)
+
+    async def _flush(self, collection: str):
+        docs = self._buffers.pop(collection, None)
+        if not docs:
+            return
+        if self._errors:
+            raise self._errors[0]
+        # Back-pressure: generation waits while `concurrency` batches are in flight
+        await self._semaphore.acquire()
+        task = asyncio.ensure_future(self._insert(collection, docs))
+        self._pending.add(task)
+        task.add_done_callback(self._done)
+
+    async def _insert(self, collection: str, docs: list):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+            self.counts[collection] += len(docs)
+        finally:
+            self._semaphore.release()
+
+    def _done(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception():
+            self._errors.append(task.exception())
+
+    async def close(self):
+        for collection in list(self._buffers):
+            await self._flush(collection)
+        if self._pending:
+            await asyncio.wait(list(self._pending))
+        if self._errors:
+            raise self._errors[0]
+
+
+class SyntheticDataGenerator:
+    def __init__(self, orders: int, seed: int = 42, days: int = 365, end: datetime = None,
+                 embedded_lines: bool = False):
+        self.counts = scale_counts(orders)
+        self.embedded_lines = embedded_lines
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.namespace = uuid.uuid5(uuid.NAMESPACE_URL, f"zenvit-synthetic:{seed}")
+        self._id_prefixes = {}
+        self.end = end or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.span = self.end - self.start
+        self.days = days
+
+        self.suppliers = []
+        self.products = []
+        self.product_weights = []
+        self.product_cum_weights = []
+        self.daily_demand = []
+        self.levels = []
+        self.reserved = []
+        self.purchase_seq = 0
+        self.movement_seq = 0
+
+    def make_id(self, kind: str, n: int) -> str:
+        """UUID-shaped id: a per-kind uuid5 prefix plus n (hashing every id costs more than generating the doc)"""
+        prefix = self._id_prefixes.get(kind)
+        if prefix is None:
+            prefix = self._id_prefixes[kind] = str(uuid.uuid5(self.namespace, kind))[:24]
+        return f"{prefix}{n:012x}"
+
+    # ------------------------------------------------------------------
+    # Reference data
+    # ------------------------------------------------------------------
+
+    def build_suppliers(self):
+        for i in range(self.counts['suppliers']):
+            name = SUPPLIER_NAMES[i]
+            slug = name.lower().replace(" ", "")
+            city, zip_code = CITIES[i % len(CITIES)]
+            self.suppliers.append({
+                "id": self.make_id("supplier", i),
+                "name": f"{name} AS",
+                "contact_person": f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[i % len(LAST_NAMES)]}",
+                "email": f"ordre@{slug}.no",
+                "phone": f"22{i:06d}",
+                "address": f"Industriveien {i + 1}, {zip_code} {city}",
+                "website": f"www.{slug}.no",
+                "created_at": (self.start - timedelta(days=365)).isoformat(),
+            })
+
+    def build_products(self):
+        n = self.counts['products']
+        orders_per_day = self.counts['orders'] / max(self.days, 1)
+        # Zipf-like popularity: a few best sellers, a long tail
+        self.product_weights = [1 / (rank + 1) for rank in range(n)]
+        total_weight = sum(self.product_weights)
+        self.product_cum_weights = list(itertools.accumulate(self.product_weights))
+
+        for i in range(n):
+            base, category, areas = PRODUCT_BASES[i % len(PRODUCT_BASES)]
+            variant = PRODUCT_VARIANTS[(i // len(PRODUCT_BASES)) % len(PRODUCT_VARIANTS)]
+            pack = PACK_SIZES[i // (len(PRODUCT_BASES) * len(PRODUCT_VARIANTS))]
+            name = " ".join(filter(None, [base, variant])) + f" {pack} stk"
+            cost = round(self.rng.uniform(30, 150) * pack / 60, 2)
+            price = round(cost * self.rng.uniform(2.2, 3.5)) - 0.1
+
+            demand = orders_per_day * AVG_UNITS_PER_ORDER * self.product_weights[i] / total_weight
+            min_stock = max(20, int(demand * 7))
+            self.daily_demand.append(demand)
+            self.products.append({
+                "id": self.make_id("product", i),
+                "sku": f"SYN-{i:05d}",
+                "name": name,
+                "category": category,
+                "health_areas": areas,
+                "short_description": f"{base} for {', '.join(areas).lower()}",
+                "cost": cost,
+                "price": price,
+                "cost_price": cost,
+                "sale_price": price,
+                "supplier_id": self.suppliers[i % len(self.suppliers)]['id'],
+                "minimum_stock": min_stock,
+                "min_stock": min_stock,
+                "stock_quantity": 0,
+                "active": True,
+                "batch_tracking": True,
+                "units_per_package": pack,
+                "created_at": (self.start - timedelta(days=30)).isoformat(),
+                "updated_at": self.end.isoformat(),
+            })
+            self.levels.append(0)
+            self.reserved.append(0)
+
+    @staticmethod
+    def customer_name(i: int) -> str:
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        return f"{last} Helse AS" if i % 10 == 9 else f"{first} {last}"
+
+    def customer(self, i: int) -> dict:
+        """Customer i, derived from the index alone so orders never need a lookup"""
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        city, zip_code = CITIES[(i * 7) % len(CITIES)]
+        business = i % 10 == 9
+        return {
+            "id": self.make_id("customer", i),
+            "name": self.customer_name(i),
+            "email": f"{first.lower()}.{last.lower()}{i}@example.no",
+            "phone": f"9{i:07d}"[-8:],
+            "address": f"Storgata {i % 200 + 1}",
+            "city": city,
+            "zip_code": zip_code,
+            "type": "Business" if business else "Private",
+            "status": "New",
+            "total_value": 0,
+            "order_count": 0,
+            "created_at": self.customer_created_at(i).isoformat(),
+        }
+
+    def customer_created_at(self, i: int) -> datetime:
+        share = i / self.counts['customers']
+        if share < EXISTING_CUSTOMER_SHARE:
+            return self.start - timedelta(days=180) * (1 - share / EXISTING_CUSTOMER_SHARE)
+        # The rest sign up steadily during the first 80% of the period
+        return self.start + self.span * 0.8 * (share - EXISTING_CUSTOMER_SHARE) / (1 - EXISTING_CUSTOMER_SHARE)
+
+    def customers_at(self, when: datetime) -> int:
+        progress = min(1.0, (when - self.start) / (self.span * 0.8))
+        share = EXISTING_CUSTOMER_SHARE + (1 - EXISTING_CUSTOMER_SHARE) * progress
+        return max(1, int(self.counts['customers'] * share))
+
+    async def write_lines(self, writer: BatchWriter, collection: str, parent: dict, lines: list):
+        """Lines into the parent (embedded layout) or into their own collection"""
+        if self.embedded_lines:
+            parent['lines'] = [embedded_line(line) for line in lines]
+            return
+        for line in lines:
+            await writer.add(collection, line)
+
+    # ------------------------------------------------------------------
+    # Ledger
+    # ------------------------------------------------------------------
+
+    def movement(self, product_index: int, when: datetime, type: str, change: int,
+                 source: str, source_id: str = None, note: str = None) -> dict:
+        self.movement_seq += 1
+        self.levels[product_index] += -abs(change) if type == "OUT" else change
+        return {
+            "id": self.make_id("movement", self.movement_seq),
+            "product_id": self.products[product_index]['id'],
+            "timestamp": when.isoformat(),
+            "type": type,
+            "change": change,
+            "source": source,
+            "source_id": source_id,
+            "note": note,
+        }
+
+    async def write_opening_stock(self, writer: BatchWriter):
+        for i, product in enumerate(self.products):
+            quantity = product['min_stock'] + int(self.daily_demand[i] * STOCK_COVER_DAYS)
+            await writer.add("stock_movements", self.movement(
+                i, self.start, "ADJUST", quantity, "MANUAL", note="Opening balance"
+            ))
+
+    async def write_restock(self, writer: BatchWriter, when: datetime, received: bool = True):
+        """One purchase per supplier for every product below its reorder point"""
+        lines_by_supplier = {}
+        for i, product in enumerate(self.products):
+            reorder_point = product['min_stock'] + self.daily_demand[i] * REORDER_DAYS
+            if self.levels[i] < reorder_point:
+                target = product['min_stock'] + int(self.daily_demand[i] * STOCK_COVER_DAYS)
+                quantity = max(target - self.levels[i], product['min_stock'])
+                lines_by_supplier.setdefault(product['supplier_id'], []).append((i, quantity))
+
+        for supplier in self.suppliers:
+            lines = lines_by_supplier.get(supplier['id'])
+            if not lines:
+                continue
+            self.purchase_seq += 1
+            purchase_id = self.make_id("purchase", self.purchase_seq)
+            received_at = when + timedelta(hours=self.rng.randint(2, 6))
+            total_amount = 0
+            purchase_lines = []
+            for n, (i, quantity) in enumerate(lines):
+                product = self.products[i]
+                total_amount += quantity * product['cost']
+                purchase_lines.append({
+                    "id": self.make_id("purchase_line", self.purchase_seq * MAX_PRODUCTS + n),
+                    "purchase_id": purchase_id,
+                    "product_id": product['id'],
+                    "product_name": product['name'],
+                    "quantity": quantity,
+                    "cost_price": product['cost'],
+                })
+                if received:
+                    await writer.add("stock_movements", self.movement(
+                        i, received_at, "IN", quantity, "PURCHASE", purchase_id,
+                        f"Innkjøp mottatt: {product['name']}"
+                    ))
+            purchase = {
+                "id": purchase_id,
+                "supplier_id": supplier['id'],
+                "supplier_name": supplier['name'],
+                "date": when.isoformat(),
+                "status": "RECEIVED" if received else "ORDERED",
+                "total_amount": round(total_amount, 2),
+                "payment_status": "Paid" if received else "Unpaid",
+                "notes": None,
+                "stock_applied": received,
+                "received_at": received_at.isoformat() if received else None,
+            }
+            await self.write_lines(writer, "purchase_lines", purchase, purchase_lines)
+            await writer.add("purchases", purchase)
+
+    # ------------------------------------------------------------------
+    # Orders
+    # ------------------------------------------------------------------
+
+    def order_status(self, when: datetime) -> str:
+        age_days = (self.end - when).days
+        roll = self.rng.random()
+        if roll < 0.03:
+            return "Cancelled"
+        if age_days > 14:
+            return "Delivered"
+        if age_days > 3:
+            return "Delivered" if roll < 0.6 else "Shipped"
+        return self.rng.choice(["Processing", "Packed", "Shipped"])
+
+    async def write_order(self, writer: BatchWriter, n: int, when: datetime):
+        rng = self.rng
+        # Early customers are the loyal ones, so order counts per customer are skewed
+        customer_index = int(self.customers_at(when) * rng.random() ** 1.5)
+        customer_id = self.make_id("customer", customer_index)
+        customer_name = self.customer_name(customer_index)
+        order_id = self.make_id("order", n)
+        status = self.order_status(when)
+
+        line_count = rng.choices(LINE_COUNTS, cum_weights=LINES_PER_ORDER_CUM_WEIGHTS)[0]
+        picked = set(rng.choices(range(len(self.products)), cum_weights=self.product_cum_weights, k=line_count))
+
+        shipped = status in STOCK_COMMIT_STATUSES
+        order_total = 0
+        cost_total = 0
+        lines = []
+        for j, i in enumerate(sorted(picked)):
+            product = self.products[i]
+            quantity = rng.randint(1, 3)
+            discount = round(product['price'] * quantity * 0.1, 2) if rng.random() < 0.1 else 0
+            line_total = product['price'] * quantity - discount
+            line_profit = line_total - product['cost'] * quantity
+            order_total += line_total
+            cost_total += product['cost'] * quantity
+            lines.append({
+                "id": self.make_id("order_line", n * len(LINE_COUNTS) + j),
+                "order_id": order_id,
+                "product_id": product['id'],
+                "product_name": product['name'],
+                "quantity": quantity,
+                "sale_price": product['price'],
+                "cost_price": product['cost'],
+                "discount": discount,
+                "line_total": line_total,
+                "line_profit": line_profit,
+                "customer_id": customer_id,
+                "date": when.isoformat(),
+                "status": status,
+            })
+            if shipped:
+                # Same movement shipping an order writes
+                await writer.add("stock_movements", self.movement(
+                    i, when, "OUT", -quantity, "ORDER", order_id, f"Salg til kunde: {customer_name}"
+                ))
+            elif status != "Cancelled":
+                # Not shipped yet: the stock is only held
+                self.reserved[i] += quantity
+                await writer.add("stock_reservations", {
+                    "id": self.make_id("reservation", n * len(LINE_COUNTS) + j),
+                    "order_id": order_id,
+                    "product_id": product['id'],
+                    "quantity": quantity,
+                    "status": "active",
+                    "created_at": when.isoformat(),
+                    "expires_at": when + DEFAULT_RESERVATION_TTL,
+                })
+
+        shipping_paid = rng.choice([0, 0, 49, 79])
+        shipping_cost = rng.choice([39, 59, 89])
+        order_total += shipping_paid
+        cost_total += shipping_cost
+        profit = order_total - cost_total
+        paid = status in ("Shipped", "Delivered") or rng.random() < 0.5
+
+        order = {
+            "id": order_id,
+            "customer_id": customer_id,
+            "customer_name": customer_name,
+            "date": when.isoformat(),
+            "channel": rng.choices(CHANNELS, cum_weights=CHANNEL_CUM_WEIGHTS)[0],
+            "status": status,
+            "shipping_paid_by_customer": shipping_paid,
+            "shipping_cost": shipping_cost,
+            "payment_status": "Paid" if paid else "Unpaid",
+            "payment_method": rng.choice(PAYMENT_METHODS),
+            "payment_date": when.isoformat() if paid else None,
+            "notes": None,
+            "order_total": order_total,
+            "cost_total": cost_total,
+            "profit": profit,
+            "profit_percent": (profit / order_total * 100) if order_total > 0 else 0,
+            "stock_applied": shipped,
+            "completed_at": None,
+        }
+        await self.write_lines(writer, "order_lines", order, lines)
+        await writer.add("orders", order)
+
+    # ------------------------------------------------------------------
+    # Tasks and expenses
+    # ------------------------------------------------------------------
+
+    def spread(self, n: int, total: int) -> datetime:
+        """n-th of `total` points evenly spread over the period, with jitter"""
+        return self.start + self.span * ((n + self.rng.random()) / total)
+
+    async def write_tasks(self, writer: BatchWriter):
+        total = self.counts['tasks']
+        for n in range(total):
+            created = self.spread(n, total)
+            due = created + timedelta(days=self.rng.randint(1, 14))
+            kind = self.rng.choices(["Customer", "Stock", "Admin"], [60, 25, 15])[0]
+            task = {
+                "id": self.make_id("task", n),
+                "title": "Oppgave",
+                "description": None,
+                "due_date": due.isoformat(),
+                "priority": self.rng.choice(["High", "Medium", "Medium", "Low"]),
+                "status": "Done" if due < self.end and self.rng.random() < 0.9 else "Planned",
+                "type": kind,
+                "customer_id": None,
+                "order_id": None,
+                "product_id": None,
+                "supplier_id": None,
+                "assigned_to": "Jabar",
+                "created_at": created.isoformat(),
+            }
+            if kind == "Customer":
+                customer_index = self.rng.randrange(self.customers_at(created))
+                task['customer_id'] = self.make_id("customer", customer_index)
+                task['title'] = f"Følg opp kunde: {self.customer_name(customer_index)}"
+            elif kind == "Stock":
+                product = self.products[self.rng.randrange(len(self.products))]
+                task['product_id'] = product['id']
+                task['title'] = f"Bestill mer {product['name']}"
+            else:
+                task['title'] = self.rng.choice(["Månedlig regnskap", "Oppdater nettbutikk", "Planlegg kampanje"])
+            await writer.add("tasks", task)
+
+    async def write_expenses(self, writer: BatchWriter):
+        total = self.counts['expenses']
+        categories = list(EXPENSE_AMOUNTS)
+        for n in range(total):
+            category = categories[n % len(categories)]
+            low, high = EXPENSE_AMOUNTS[category]
+            await writer.add("expenses", {
+                "id": self.make_id("expense", n),
+                "date": self.spread(n, total).isoformat(),
+                "category": category,
+                "amount": round(self.rng.uniform(low, high), 2),
+                "payment_status": "Paid" if self.rng.random() < 0.85 else "Unpaid",
+                "supplier_id": None,
+                "notes": f"{category} (synthetic)",
+            })
+
+    # ------------------------------------------------------------------
+
+    async def write(self, writer: BatchWriter):
+        self.build_suppliers()
+        self.build_products()
+        await self.write_opening_stock(writer)
+
+        for i in range(self.counts['customers']):
+            await writer.add("customers", self.customer(i))
+
+        # Orders in time order, with a restock check at every day boundary
+        total = self.counts['orders']
+        next_restock = self.start + timedelta(days=1)
+        for n in range(total):
+            when = self.spread(n, total)
+            while when >= next_restock:
+                await self.write_restock(writer, next_restock)
+                next_restock += timedelta(days=1)
+            await self.write_order(writer, n, when)
+        # Last purchase is still on its way
+        await self.write_restock(writer, self.end, received=False)
+
+        await self.write_tasks(writer)
+        await self.write_expenses(writer)
+
+        for i, product in enumerate(self.products):
+            product['stock_quantity'] = self.levels[i]
+            product['reserved_quantity'] = self.reserved[i]
+            await writer.add("stock", {
+                "id": self.make_id("stock", i),
+                "product_id": product['id'],
+                "quantity": self.levels[i],
+                "min_stock": product['min_stock'],
+                "status": "Out" if self.levels[i] <= 0 else "Low" if self.levels[i] < product['min_stock'] else "OK",
+                "last_updated": self.end.isoformat(),
+            })
+            await writer.add("products", product)
+        for supplier in self.suppliers:
+            await writer.add("suppliers", supplier)
+
+
+async def generate_synthetic_data(db, orders: int, seed: int = 42, days: int = 365, end: datetime = None,
+                                  batch_size: int = SYNTHETIC_BATCH_SIZE,
+                                  concurrency: int = SYNTHETIC_CONCURRENCY, drop: bool = False,
+                                  embedded_lines: bool = False) -> dict:
+    """Generate and insert a consistent data set; returns document counts per collection"""
+    if drop:
+        for name in SYNTHETIC_COLLECTIONS:
+            await db[name].drop()
+
+    generator = SyntheticDataGenerator(orders, seed=seed, days=days, end=end, embedded_lines=embedded_lines)
+    writer = BatchWriter(db, batch_size, concurrency)
+    await generator.write(writer)
+    await writer.close()
+
+    # Building indexes once after the bulk load is cheaper than maintaining them per insert
+    await create_indexes(db, force=True)
+
+    await db.app_state.update_one({"id": "catalog_version"}, {"$inc": {"version": 1}}, upsert=True)
+    lifecycle = await recompute_customer_lifecycle(db, now=generator.end)
+    return {"counts": dict(writer.counts), "customer_status": lifecycle['transitions']}
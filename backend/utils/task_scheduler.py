@@ -0,0 +1,188 @@
+"""
+Task deadline scheduler.
+
+Upcoming deadlines are kept in a min-heap and the scheduler sleeps until
+the earliest one (or until a task is created/updated/deleted) - no
+polling. Every worker runs its own heap; firing is made exactly-once
+across workers by claiming the task with a lease in MongoDB before
+notifying and recording the deadline as notified afterwards. A worker
+that dies mid-notification leaves an expiring lease, so another one can
+retry.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+LEASE_SECONDS = 120
+RETRY_DELAY_SECONDS = 300
+# Safety net: reload from the database at least this often, so tasks
+# written by another worker are picked up even if that worker goes away
+RESYNC_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def parse_due_date(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class TaskDeadlineScheduler:
+    def __init__(self, db, notify, lead_time: timedelta = timedelta(0)):
+        """
+        notify(task) is awaited once per task deadline, `lead_time` before it.
+        """
+        self.db = db
+        self.notify = notify
+        self.lead_time = lead_time
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._heap = []          # (fire_at, task_id, due_date)
+        self._scheduled = {}     # task_id -> due_date currently scheduled
+        self._changed = asyncio.Event()
+        self._task = None
+
+    # ------------------------------------------------------------------
+    # Heap maintenance
+    # ------------------------------------------------------------------
+
+    def schedule(self, task: dict):
+        """(Re)schedule a task after create/update; Done or undated tasks are removed"""
+        due = task.get('due_date')
+        if not due or task.get('status') == "Done" or task.get('deadline_notified_for') == due:
+            self.remove(task['id'])
+            return
+        due_at = parse_due_date(due)
+        if due_at <= datetime.now(timezone.utc):
+            self.remove(task['id'])
+            return
+        self._push(task['id'], due, due_at - self.lead_time)
+
+    def remove(self, task_id: str):
+        # Heap entries are dropped lazily when they no longer match _scheduled
+        if self._scheduled.pop(task_id, None) is not None:
+            self._changed.set()
+
+    def _push(self, task_id: str, due, fire_at: datetime):
+        self._scheduled[task_id] = due
+        heapq.heappush(self._heap, (fire_at, task_id, due))
+        self._changed.set()
+
+    async def load(self):
+        """Rebuild the heap from all open tasks with a future deadline"""
+        self._heap = []
+        self._scheduled = {}
+        now = datetime.now(timezone.utc).isoformat()
+        cursor = self.db.tasks.find(
+            {"status": {"$ne": "Done"}, "due_date": {"$gt": now}},
+            {"_id": 0, "id": 1, "due_date": 1, "status": 1, "deadline_notified_for": 1}
+        )
+        async for task in cursor:
+            self.schedule(task)
+
+    # ------------------------------------------------------------------
+    # Firing
+    # ------------------------------------------------------------------
+
+    async def _claim(self, task_id: str, due):
+        """Take the per-task lease; None if another worker has it or it already fired"""
+        now = datetime.now(timezone.utc)
+        return await self.db.tasks.find_one_and_update(
+            {
+                "id": task_id,
+                "due_date": due,
+                "status": {"$ne": "Done"},
+                "deadline_notified_for": {"$ne": due},
+                "$or": [
+                    {"deadline_lease_until": None},
+                    {"deadline_lease_until": {"$lt": now.isoformat()}},
+                ],
+            },
+            {"$set": {
+                "deadline_lease_until": (now + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+                "deadline_lease_owner": self.owner,
+            }},
+            projection={"_id": 0},
+        )
+
+    async def fire(self, task_id: str, due):
+        task = await self._claim(task_id, due)
+        if task is None:
+            return False
+        try:
+            await self.notify(task)
+        except Exception as e:
+            logger.error(f"Deadline notification for task {task_id} failed: {e}")
+            await self.db.tasks.update_one(
+                {"id": task_id, "deadline_lease_owner": self.owner},
+                {"$unset": {"deadline_lease_until": "", "deadline_lease_owner": ""}}
+            )
+            retry_at = datetime.now(timezone.utc) + timedelta(seconds=RETRY_DELAY_SECONDS)
+            self._push(task_id, due, retry_at)
+            return False
+        await self.db.tasks.update_one(
+            {"id": task_id, "deadline_lease_owner": self.owner},
+            {
+                "$set": {
+                    "deadline_notified_for": due,
+                    "deadline_notified_at": datetime.now(timezone.utc).isoformat(),
+                },
+                "$unset": {"deadline_lease_until": "", "deadline_lease_owner": ""},
+            }
+        )
+        return True
+
+    async def _run(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Task deadline scheduler could not load tasks: {e}")
+        last_sync = asyncio.get_running_loop().time()
+        while True:
+            # Drop entries superseded by a later update/removal
+            while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][2]:
+                heapq.heappop(self._heap)
+
+            now = datetime.now(timezone.utc)
+            if self._heap and self._heap[0][0] <= now:
+                _, task_id, due = heapq.heappop(self._heap)
+                self._scheduled.pop(task_id, None)
+                try:
+                    await self.fire(task_id, due)
+                except Exception as e:
+                    logger.error(f"Task deadline scheduler error: {e}")
+                continue
+
+            timeout = RESYNC_SECONDS - (asyncio.get_running_loop().time() - last_sync)
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+            if asyncio.get_running_loop().time() - last_sync >= RESYNC_SECONDS:
+                try:
+                    await self.load()
+                except Exception as e:
+                    logger.error(f"Task deadline scheduler reload failed: {e}")
+                last_sync = asyncio.get_running_loop().time()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,164 @@
+"""
+Content-addressed image storage - uploads are streamed to disk in chunks
+while hashing, so memory stays flat and identical images are stored once
+"""
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+import aiofiles
+
+IMAGE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File is too large. Maximum size is {max_bytes // (1024 * 1024)}MB.")
+        self.max_bytes = max_bytes
+
+
+class InvalidUploadError(Exception):
+    """Raised when a multipart upload has no usable file part"""
+
+
+class _HashedUpload:
+    """Temp file in upload_dir that hashes what is written; finish() stores it as <sha256>.<extension>"""
+
+    def __init__(self, upload_dir: Path, max_bytes: int):
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.tmp_path = upload_dir / f".upload-{uuid.uuid4()}.tmp"
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self._file = None
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        if self._file is None:
+            self._file = await aiofiles.open(self.tmp_path, "wb")
+        self.digest.update(chunk)
+        await self._file.write(chunk)
+
+    async def discard(self):
+        if self._file is not None:
+            await self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+    async def finish(self, extension: str) -> dict:
+        if self._file is None:
+            self._file = await aiofiles.open(self.tmp_path, "wb")
+        await self._file.close()
+        sha256 = self.digest.hexdigest()
+        filename = f"{sha256}.{extension}"
+        final_path = self.upload_dir / filename
+
+        if final_path.exists():
+            # Same bytes already stored - keep the existing file
+            self.tmp_path.unlink(missing_ok=True)
+            created = False
+        else:
+            os.replace(self.tmp_path, final_path)
+            created = True
+
+        return {"sha256": sha256, "filename": filename, "size": self.size, "created": created}
+
+
+async def receive_multipart_upload(body, content_type: str, field_name: str, upload_dir: Path,
+                                   extensions: dict, max_bytes: int, max_body_bytes: int) -> dict:
+    """
+    Store the `field_name` file part of a multipart/form-data body as
+    `<sha256>.<ext>` while the body is still being received.
+
+    `body` is the raw request stream (e.g. Starlette's request.stream()), so
+    nothing is spooled before the limits apply: UploadTooLargeError is raised
+    as soon as the file exceeds max_bytes or the whole body max_body_bytes,
+    whether or not the client sent a Content-Length. `extensions` maps the
+    accepted part content types to file extensions; anything else raises
+    InvalidUploadError. Returns {"sha256", "filename", "size", "created",
+    "content_type"}; "created" is False when the same bytes were already stored.
+    """
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    mime_type, params = parse_options_header(content_type or "")
+    if mime_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise InvalidUploadError("Expected a multipart/form-data upload")
+
+    part = {}
+    found = {}
+    pending = []
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, field=b"", value=b"", is_file=False)
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"], part["value"] = b"", b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        if found or disposition.get(b"name") != field_name.encode() or b"filename" not in disposition:
+            return
+        part["is_file"] = True
+        found["content_type"] = part["headers"].get(b"content-type", b"").decode("latin-1")
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            pending.append(bytes(data[start:end]))
+
+    def on_part_end():
+        if part["is_file"]:
+            found["complete"] = True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    upload = _HashedUpload(upload_dir, max_bytes)
+    received = 0
+    try:
+        async for chunk in body:
+            received += len(chunk)
+            if received > max_body_bytes:
+                raise UploadTooLargeError(max_bytes)
+            parser.write(chunk)
+            if found and found["content_type"] not in extensions:
+                raise InvalidUploadError(
+                    f"Invalid file type {found['content_type'] or 'none'}. Allowed: {', '.join(extensions)}"
+                )
+            for data in pending:
+                await upload.write(data)
+            pending.clear()
+        parser.finalize()
+        if not found:
+            raise InvalidUploadError("No file uploaded")
+        if not found.get("complete"):
+            raise InvalidUploadError("Upload ended before the file was complete")
+        stored = await upload.finish(extensions[found["content_type"]])
+    except BaseException:
+        await upload.discard()
+        raise
+    return {**stored, "content_type": found["content_type"]}
@@ -4,3 +4,14 @@ import { twMerge } from "tailwind-merge"
 export function cn(...inputs) {
   return twMerge(clsx(inputs));
 }
+
+// Resized WebP variant ("thumbnail" | "card" | "detail") of an uploaded product image.
+// Other backend paths are returned as full URLs, external URLs unchanged.
+export function imageVariantUrl(imageUrl, variant) {
+  if (!imageUrl) return imageUrl;
+  const prefix = '/uploads/products/';
+  if (imageUrl.startsWith(prefix)) {
+    return `${process.env.REACT_APP_BACKEND_URL}/images/${variant}/${imageUrl.slice(prefix.length)}`;
+  }
+  return imageUrl.startsWith('/') ? `${process.env.REACT_APP_BACKEND_URL}${imageUrl}` : imageUrl;
+}
@@ -44,6 +44,30 @@ const NewDashboard = () => {
     }
   }, [token, fetchDashboardData]);
 
+  // Live KPI updates pushed by the server (replaces polling)
+  useEffect(() => {
+    if (!token) return undefined;
+
+    const source = new EventSource(`${API_URL}/dashboard/stream?token=${encodeURIComponent(token)}`);
+    const applyUpdate = (event) => {
+      const update = JSON.parse(event.data);
+      if (update.kpis) {
+        setDashboardData(prev => prev && { ...prev, kpis: { ...prev.kpis, ...update.kpis } });
+      }
+      if (update.alerts || update.todayStats) {
+        setControlPanelData(prev => prev && {
+          ...prev,
+          alerts: { ...prev.alerts, ...update.alerts },
+          todayStats: { ...prev.todayStats, ...update.todayStats }
+        });
+      }
+    };
+    source.addEventListener('snapshot', applyUpdate);
+    source.addEventListener('delta', applyUpdate);
+
+    return () => source.close();
+  }, [token]);
+
   const handleKPIClick = (destination, filter = null) => {
     if (filter) {
       navigate(destination, { state: { filter } });
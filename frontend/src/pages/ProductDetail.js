@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
 import { useParams, useNavigate } from 'react-router-dom';
+import { imageVariantUrl } from '../lib/utils';
 import './ProductDetail.css';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
@@ -79,7 +80,7 @@ const ProductDetail = () => {
           <div className="product-detail-header">
             {product.image_url ? (
               <img 
-                src={`${process.env.REACT_APP_BACKEND_URL}${product.image_url}`} 
+                src={imageVariantUrl(product.image_url, 'detail')} 
                 alt={product.name} 
                 className="product-detail-image" 
               />
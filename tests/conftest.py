@@ -0,0 +1,156 @@
+"""
+Shared fixtures for in-process API tests.
+
+The app runs over httpx's ASGI transport against either a real MongoDB
+(TEST_MONGO_URL, scratch database dropped afterwards) or an in-memory
+mongomock stand-in. `query_budget` counts the MongoDB round trips a block
+issues - via a command listener on a real server, via the collection calls
+on the stand-in - and fails when a budget is exceeded:
+
+    def test_orders(api, query_budget):
+        with query_budget(3):
+            api.get("/api/orders")
+"""
+import asyncio
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server.py reads these at import time; tests swap in their own database
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "crm_test")
+
+from utils import CommandCounter  # noqa: E402
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+TEST_DB_NAME = "crm_test_api"
+
+# Collection methods that cost one round trip on a real server
+ROUND_TRIP_METHODS = {
+    "find", "find_one", "aggregate", "count_documents", "estimated_document_count", "distinct",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete", "bulk_write", "create_index",
+}
+
+
+class CountingCollection:
+    def __init__(self, collection, counter: CommandCounter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in ROUND_TRIP_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            self._counter.record(name, self._collection.name)
+            return attr(*args, **kwargs)
+        return call
+
+
+class CountingDatabase:
+    """mongomock database that reports every collection operation as a round trip"""
+
+    def __init__(self, db, counter: CommandCounter):
+        self._db = db
+        self._counter = counter
+
+    @property
+    def name(self):
+        return self._db.name
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self._counter)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture
+def mongo(loop):
+    """(db, counter) on a real server or the in-memory stand-in"""
+    counter = CommandCounter()
+    if TEST_MONGO_URL:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(TEST_MONGO_URL, event_listeners=[counter])
+        loop.run_until_complete(client.drop_database(TEST_DB_NAME))
+        yield client[TEST_DB_NAME], counter
+        loop.run_until_complete(client.drop_database(TEST_DB_NAME))
+        client.close()
+    else:
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        yield CountingDatabase(mongomock_motor.AsyncMongoMockClient()[TEST_DB_NAME], counter), counter
+
+
+@pytest.fixture
+def db(mongo):
+    return mongo[0]
+
+
+@pytest.fixture
+def run(loop):
+    """Run a coroutine (e.g. test data inserts) on the test loop"""
+    return loop.run_until_complete
+
+
+@pytest.fixture
+def api(loop, db, monkeypatch):
+    import httpx
+    import server
+
+    monkeypatch.setattr(server, "db", db)
+    user = server.User(email="test@zenvit.no", full_name="Test")
+    server.app.dependency_overrides[server.get_current_user] = lambda: user
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+    class Api:
+        # The httpx.AsyncClient itself, for requests that must run concurrently
+        client = http_client
+
+        def request(self, method, path, **kwargs):
+            return loop.run_until_complete(http_client.request(method, path, **kwargs))
+
+        def get(self, path, **kwargs):
+            return self.request("GET", path, **kwargs)
+
+        def post(self, path, **kwargs):
+            return self.request("POST", path, **kwargs)
+
+        def put(self, path, **kwargs):
+            return self.request("PUT", path, **kwargs)
+
+    yield Api()
+    loop.run_until_complete(http_client.aclose())
+    server.app.dependency_overrides.pop(server.get_current_user, None)
+
+
+@pytest.fixture
+def query_budget(mongo):
+    counter = mongo[1]
+
+    @contextmanager
+    def budget(limit: int):
+        with counter.measure() as commands:
+            yield commands
+        assert len(commands) <= limit, (
+            f"{len(commands)} MongoDB round trips, budget {limit}: "
+            + ", ".join(f"{name} {collection}" for name, collection in commands)
+        )
+    return budget
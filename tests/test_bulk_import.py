@@ -0,0 +1,94 @@
+"""
+Bulk CSV/NDJSON import: dedupe, SKU allocation and per-row error reporting.
+"""
+import json
+
+import pytest
+
+from utils import split_list_field
+
+
+def upload(api, path: str, name: str, body: str, **params):
+    return api.post(path, files={"file": (name, body.encode("utf-8"))}, params=params).json()
+
+
+def ndjson(*records) -> str:
+    return "\n".join(json.dumps(record) for record in records) + "\n"
+
+
+def test_split_list_field_rejects_non_strings():
+    assert split_list_field("Immun; Søvn|Energi") == ["Immun", "Søvn", "Energi"]
+    assert split_list_field(None) == []
+    with pytest.raises(ValueError):
+        split_list_field(3)
+
+
+def test_customers_are_deduplicated_on_normalized_email_and_phone(api, db, run):
+    run(db.customers.insert_one({"id": "c0", "name": "Existing", "email": "kari@example.no", "phone": "41234567"}))
+    csv_body = (
+        "name,email,phone\n"
+        "Kari,KARI@example.no ,\n"          # same email as the existing customer
+        "Ola,ola@example.no,+47 412 34 567\n"  # same phone as the existing customer
+        "Per,per@example.no,99887766\n"
+        "Per again,,0047 99 88 77 66\n"      # same phone as the row above
+        "Nameless,nobody@example.no,\n"
+        ",missing@example.no,\n"
+    )
+
+    report = upload(api, "/api/import/customers", "customers.csv", csv_body)
+
+    assert report['total_rows'] == 6
+    assert report['created'] == 2
+    assert report['duplicates'] == 3
+    assert [error['row'] for error in report['errors']] == [7]
+    names = {c['name'] for c in run(db.customers.find({}, {"_id": 0}).to_list(None))}
+    assert names == {"Existing", "Per", "Nameless"}
+    assert run(db.customer_timeline.count_documents({})) == 2
+
+
+def test_products_get_sequential_skus_and_row_errors(api, db, run):
+    run(db.products.insert_one({"id": "p0", "name": "Old", "sku": "ZV-VIT-007", "ean": "7070000000001"}))
+    body = ndjson(
+        {"name": "Vitamin C", "category": "Vitamin", "cost": 10, "price": 30, "health_areas": "Immun;Energi"},
+        {"name": "Vitamin K", "category": "vitamin", "cost": 10, "price": 30, "ean": "7070 0000 00001"},
+        {"name": "Magnesium", "category": "Mineral", "cost": 12, "price": 40, "health_areas": 5},
+        {"name": "Zink", "category": "Mineral", "cost": 8, "price": 25},
+        {"name": "Vitamin E", "category": "Vitamin", "cost": 10, "price": 30, "health_areas": ["Hud"]},
+    ) + "not json\n"
+
+    report = upload(api, "/api/import/products", "products.ndjson", body)
+
+    assert report['created'] == 3
+    assert report['duplicates'] == 1
+    assert [error['row'] for error in report['errors']] == [3, 6]
+    assert report['errors'][0]['error'].startswith("health_areas")
+    products = {p['name']: p for p in run(db.products.find({}, {"_id": 0}).to_list(None))}
+    assert products["Vitamin C"]['sku'] == "ZV-VIT-008"
+    assert products["Vitamin E"]['sku'] == "ZV-VIT-009"
+    assert products["Zink"]['sku'] == "ZV-MIN-001"
+    assert products["Vitamin C"]['health_areas'] == ["Immun", "Energi"]
+    assert run(db.stock.count_documents({})) == 3
+
+
+def test_dry_run_writes_nothing(api, db, run):
+    report = upload(api, "/api/import/customers", "customers.csv", "name\nKari\n", dry_run="true")
+
+    assert report['created'] == 1
+    assert run(db.customers.count_documents({})) == 0
+
+
+def test_write_errors_are_reported_per_row(api, db, run):
+    run(db.products.create_index("name", unique=True))
+    run(db.products.insert_one({"id": "p0", "name": "Zink", "sku": "ZV-MIN-001"}))
+    body = ndjson(
+        {"name": "Jern", "category": "Mineral", "cost": 8, "price": 25},
+        {"name": "Zink", "category": "Mineral", "cost": 8, "price": 25},
+        {"name": "Kalsium", "category": "Mineral", "cost": 8, "price": 25},
+    )
+
+    report = upload(api, "/api/import/products", "products.ndjson", body)
+
+    assert report['created'] == 2
+    assert [error['row'] for error in report['errors']] == [2]
+    # Only the written products get a stock record
+    assert run(db.stock.count_documents({})) == 2
@@ -0,0 +1,94 @@
+"""
+Customer lifecycle job: status from sales orders, only changed customers
+written, transitions on the timeline, manual statuses left alone - also by
+the per-customer update after each order.
+"""
+from datetime import datetime, timezone
+
+import server
+import utils.customer_lifecycle as customer_lifecycle
+from utils import generate_synthetic_data, recompute_customer_lifecycle
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def order(n, customer_id, date, status="Delivered", total=100.0):
+    return {"id": f"o{customer_id}-{n}", "customer_id": customer_id, "date": date, "status": status,
+            "order_total": total}
+
+
+async def seed(db):
+    await db.customers.insert_many([
+        {"id": "c1", "name": "New customer", "status": "New"},
+        {"id": "c2", "name": "Recent buyer", "status": "New"},
+        {"id": "c3", "name": "Lapsed buyer", "status": "Active", "order_count": 1, "total_value": 100.0,
+         "last_order_date": "2025-01-10T00:00:00+00:00"},
+        {"id": "c4", "name": "Regular", "status": "Active"},
+        {"id": "c5", "name": "Hand picked", "status": "Lead"},
+        # Already up to date
+        {"id": "c6", "name": "Settled", "status": "Active", "order_count": 1, "total_value": 50.0,
+         "last_order_date": "2025-05-20T00:00:00+00:00"},
+    ])
+    await db.orders.insert_many([
+        order(1, "c1", "2025-05-01T00:00:00+00:00", status="Cancelled"),
+        order(1, "c2", "2025-05-15T00:00:00+00:00"),
+        order(2, "c2", "2025-05-20T00:00:00+00:00", status="Processing", total=50.0),
+        order(1, "c3", "2025-01-10T00:00:00+00:00"),
+        *[order(n, "c4", f"2025-05-{n + 1:02d}T00:00:00+00:00") for n in range(10)],
+        order(1, "c5", "2025-05-01T00:00:00+00:00"),
+        order(1, "c6", "2025-05-20T00:00:00+00:00", total=50.0),
+    ])
+
+
+def test_statuses_and_stats_are_brought_up_to_date(db, run, monkeypatch):
+    run(seed(db))
+    # Several batches of customers
+    monkeypatch.setattr(customer_lifecycle, "LIFECYCLE_BATCH_SIZE", 2)
+
+    report = run(recompute_customer_lifecycle(db, now=NOW))
+
+    customers = {c['id']: c for c in run(db.customers.find({}, {"_id": 0}).to_list(None))}
+    assert {cid: c['status'] for cid, c in customers.items()} == {
+        "c1": "New", "c2": "Active", "c3": "Inactive", "c4": "VIP", "c5": "Lead", "c6": "Active",
+    }
+    assert (customers['c2']['order_count'], customers['c2']['total_value']) == (2, 150.0)
+    assert customers['c2']['last_order_date'] == "2025-05-20T00:00:00+00:00"
+    # No sales and no stored stats: nothing to write
+    assert "order_count" not in customers['c1']
+    assert report['customers_updated'] == 3
+    assert report['transitions'] == {"New -> Active": 1, "Active -> Inactive": 1, "Active -> VIP": 1}
+    assert run(db.customer_timeline.count_documents({"type": "Status"})) == 3
+
+    assert run(recompute_customer_lifecycle(db, now=NOW))['customers_updated'] == 0
+
+
+def test_dry_run_writes_nothing(db, run):
+    run(seed(db))
+
+    report = run(recompute_customer_lifecycle(db, now=NOW, dry_run=True))
+
+    assert report['customers_updated'] == 3
+    assert run(db.customers.find_one({"id": "c2"}))['status'] == "New"
+    assert run(db.customer_timeline.count_documents({})) == 0
+
+
+def test_synthetic_data_runs_the_lifecycle_job(db, run):
+    report = run(generate_synthetic_data(db, 200, days=30, end=NOW))
+
+    assert report['counts']['orders'] == 200
+    assert sum(report['customer_status'].values()) > 0
+    assert run(db.customers.count_documents({"status": {"$in": ["Active", "Inactive", "VIP"]}})) > 0
+
+
+def test_order_updates_keep_manual_statuses(api, db, run):
+    run(seed(db))
+    today = datetime.now(timezone.utc).isoformat()
+    run(db.orders.insert_many([order(3, "c2", today), order(2, "c5", today, status="Shipped")]))
+
+    for customer_id in ("c2", "c5"):
+        run(server.update_customer_stats(customer_id))
+
+    customers = {c['id']: c for c in run(db.customers.find({"id": {"$in": ["c2", "c5"]}}).to_list(None))}
+    assert (customers['c2']['status'], customers['c2']['order_count']) == ("Active", 3)
+    assert (customers['c5']['status'], customers['c5']['order_count']) == ("Lead", 2)
+    assert customers['c5']['last_order_date'] == today
@@ -0,0 +1,119 @@
+"""
+Embedded order/purchase lines: the batched migration and its reverse, reads
+while only some parents are migrated, and the embedded write/analytics path.
+"""
+import pytest
+
+import server
+from utils import migrate_collection_lines, migrate_embedded_lines
+from utils.synthetic_data import BatchWriter, SyntheticDataGenerator
+
+
+async def seed(db, orders=5):
+    await db.customers.insert_one({"id": "c1", "name": "Kari Nordmann", "status": "New"})
+    await db.products.insert_one(
+        {"id": "p1", "name": "Vitamin D", "sku": "VD-1", "cost": 10.0, "price": 30.0, "stock_quantity": 50}
+    )
+    if not orders:
+        return
+    await db.orders.insert_many([
+        {"id": f"o{n}", "customer_id": "c1", "date": f"2025-01-0{n + 1}T10:00:00+00:00", "status": "Delivered"}
+        for n in range(orders)
+    ])
+    await db.order_lines.insert_many([
+        {"id": f"l{n}-{i}", "order_id": f"o{n}", "product_id": "p1", "product_name": "Vitamin D", "quantity": 1,
+         "line_total": 30.0, "customer_id": "c1", "date": f"2025-01-0{n + 1}T10:00:00+00:00", "status": "Delivered"}
+        for n in range(orders) for i in range(2)
+    ])
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    monkeypatch.setattr(server, "EMBEDDED_LINES", True)
+
+
+def test_migration_is_batched_and_resumable(db, run):
+    run(seed(db))
+
+    first = run(migrate_embedded_lines(db, "orders", batch_size=2, after="o2"))
+    assert first == {"parents": 2, "lines": 4, "last_id": "o4"}
+    rest = run(migrate_embedded_lines(db, "orders", batch_size=2))
+    assert rest == {"parents": 3, "lines": 6, "last_id": "o2"}
+    assert run(migrate_embedded_lines(db, "orders"))['parents'] == 0
+
+    order = run(db.orders.find_one({"id": "o0"}))
+    assert [line['id'] for line in order['lines']] == ["l0-0", "l0-1"]
+    assert "customer_id" not in order['lines'][0]
+
+
+def test_orders_read_from_both_layouts_mid_migration(api, db, run, query_budget):
+    run(seed(db))
+    run(migrate_embedded_lines(db, "orders", after="o2"))
+
+    with query_budget(2):
+        orders = api.get("/api/orders").json()
+
+    assert {o['id']: len(o['lines']) for o in orders} == {f"o{n}": 2 for n in range(5)}
+
+
+def test_fully_embedded_orders_need_one_query(api, db, run, query_budget):
+    run(seed(db))
+    run(migrate_embedded_lines(db, "orders"))
+
+    with query_budget(1):
+        assert len(api.get("/api/orders").json()) == 5
+
+
+def test_embedded_layout_writes_lines_into_the_order(api, db, run, embedded):
+    run(seed(db, orders=0))
+
+    order = api.post("/api/orders", json={"customer_id": "c1", "items": [{"product_id": "p1", "quantity": 3}]}).json()
+    assert api.put(f"/api/orders/{order['id']}/status", params={"status": "COMPLETED"}).status_code == 200
+
+    stored = run(db.orders.find_one({"id": order['id']}))
+    assert [(line['product_id'], line['quantity']) for line in stored['lines']] == [("p1", 3)]
+    assert run(db.order_lines.count_documents({})) == 0
+    assert run(db.products.find_one({"id": "p1"}))['stock_quantity'] == 47
+
+
+def test_line_analytics_unwind_embedded_lines(api, db, run, embedded):
+    run(seed(db))
+    run(migrate_embedded_lines(db, "orders"))
+    run(db.order_lines.delete_many({}))
+
+    products = api.get("/api/customers/c1/products").json()
+
+    assert [(p['product_id'], p['quantity'], p['orders']) for p in products] == [("p1", 10, 5)]
+
+
+def test_reverse_migration_restores_the_collection_layout(api, db, run, monkeypatch):
+    run(seed(db, orders=2))
+    run(migrate_embedded_lines(db, "orders"))
+    monkeypatch.setattr(server, "EMBEDDED_LINES", True)
+    created = api.post("/api/orders", json={"customer_id": "c1", "items": [{"product_id": "p1", "quantity": 3}]}).json()
+    api.put(f"/api/orders/{created['id']}/status", params={"status": "Shipped"})
+    monkeypatch.setattr(server, "EMBEDDED_LINES", False)
+
+    report = run(migrate_collection_lines(db, "orders", batch_size=2))
+
+    assert (report['parents'], report['lines']) == (3, 5)
+    assert run(db.orders.count_documents({"lines": {"$exists": True}})) == 0
+    line = run(db.order_lines.find_one({"order_id": created['id']}, {"_id": 0}))
+    assert (line['quantity'], line['customer_id'], line['status']) == (3, "c1", "Shipped")
+    assert run(db.order_lines.count_documents({})) == 5
+    assert run(migrate_collection_lines(db, "orders"))['parents'] == 0
+    assert {o['id']: len(o['lines']) for o in api.get("/api/orders").json()} == {"o0": 2, "o1": 2, created['id']: 1}
+
+
+@pytest.mark.parametrize("embedded_lines", [False, True])
+def test_synthetic_data_follows_the_layout(db, run, embedded_lines):
+    generator = SyntheticDataGenerator(50, days=10, embedded_lines=embedded_lines)
+    writer = BatchWriter(db)
+    run(generator.write(writer))
+    run(writer.close())
+
+    order = run(db.orders.find_one({}))
+    purchase = run(db.purchases.find_one({}))
+    assert ("lines" in order, "lines" in purchase) == (embedded_lines, embedded_lines)
+    assert (run(db.order_lines.count_documents({})) > 0) is not embedded_lines
+    assert (run(db.purchase_lines.count_documents({})) > 0) is not embedded_lines
@@ -0,0 +1,83 @@
+"""
+Streaming CSV/NDJSON exports: stable columns, gzip output and half-open date ranges.
+"""
+import csv
+import gzip
+import io
+import json
+
+from utils import EXPORT_FIELDS, build_date_filter
+
+
+async def seed(db):
+    await db.orders.insert_many([
+        {"id": "o1", "customer_id": "c1", "customer_name": "Kari", "date": "2025-01-31T23:00:00+00:00",
+         "channel": "Shopify", "status": "Delivered", "order_total": 60.0, "notes": "Gave, takk"},
+        {"id": "o2", "customer_id": "c2", "customer_name": "Ola", "date": "2025-02-01T00:00:00+00:00",
+         "channel": "Direct", "status": "Processing", "order_total": 30.0},
+    ])
+    await db.order_lines.insert_many([
+        {"id": "l1", "order_id": "o1", "product_id": "p1", "product_name": "Vitamin D", "quantity": 2,
+         "line_total": 60.0},
+        {"id": "l2", "order_id": "o2", "product_id": "p1", "product_name": "Vitamin D", "quantity": 1,
+         "line_total": 30.0},
+    ])
+
+
+def test_date_to_is_exclusive():
+    assert build_date_filter("date", None, None) == {}
+    assert build_date_filter("date", "2025-01-01", "2025-02-01") == {
+        "date": {"$gte": "2025-01-01", "$lt": "2025-02-01"}
+    }
+    assert build_date_filter("timestamp", date_to="2025-02-01") == {"timestamp": {"$lt": "2025-02-01"}}
+
+
+def test_orders_csv_has_stable_header_and_honours_range(api, db, run):
+    run(seed(db))
+    response = api.get("/api/export/orders.csv", params={"date_to": "2025-02-01"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="orders.csv"' in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == EXPORT_FIELDS['orders']
+    assert len(rows) == 2
+    record = dict(zip(rows[0], rows[1]))
+    assert (record['id'], record['notes'], record['payment_method']) == ("o1", "Gave, takk", "")
+
+
+def test_order_lines_ndjson_gzip(api, db, run):
+    run(seed(db))
+    response = api.get("/api/export/order-lines.ndjson", params={"gzip": "true", "date_from": "2025-02-01"})
+
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="order-lines.ndjson.gz"' in response.headers["content-disposition"]
+    lines = gzip.decompress(response.content).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [{
+        "id": "l2", "order_id": "o2", "order_date": "2025-02-01T00:00:00+00:00", "customer_id": "c2",
+        "order_status": "Processing", "product_id": "p1", "product_name": "Vitamin D", "quantity": 1,
+        "line_total": 30.0,
+    }]
+
+
+def test_unknown_format_is_rejected(api):
+    assert api.get("/api/export/orders.xlsx").status_code == 400
+
+
+def test_stream_is_chunked_by_batch(run, monkeypatch):
+    import utils.export
+
+    monkeypatch.setattr(utils.export, "EXPORT_BATCH_SIZE", 2)
+
+    async def cursor():
+        for n in range(5):
+            yield {"_id": n, "id": f"m{n}", "change": -n}
+
+    async def collect():
+        return [chunk async for chunk in utils.export.stream_export(cursor(), "ndjson", [])]
+
+    chunks = run(collect())
+    assert len(chunks) == 3
+    assert [json.loads(line)['id'] for line in b"".join(chunks).decode().splitlines()] == [
+        "m0", "m1", "m2", "m3", "m4"
+    ]
@@ -0,0 +1,78 @@
+"""
+Idempotency-Key handling on the create endpoints: a retry returns the stored
+response and the write (stock, order, customer stats) happens once.
+"""
+import asyncio
+
+import pytest
+
+KEY = {"Idempotency-Key": "3f2c9a7e-retry-test"}
+
+
+async def seed(db):
+    await db.customers.insert_one({"id": "c1", "name": "Kari Nordmann", "status": "New"})
+    await db.suppliers.insert_one({"id": "s1", "name": "Nordic Supplements AS"})
+    await db.products.insert_one(
+        {"id": "p1", "name": "Vitamin D", "sku": "VD-1", "cost": 10.0, "price": 30.0, "stock_quantity": 10}
+    )
+    await db.stock.insert_one({"product_id": "p1", "quantity": 10, "min_stock": 0, "status": "OK"})
+
+
+def order(quantity=1):
+    return {"customer_id": "c1", "items": [{"product_id": "p1", "quantity": quantity}]}
+
+
+def test_order_retry_replays_stored_response(api, db, run):
+    run(seed(db))
+
+    first = api.post("/api/orders", json=order(), headers=KEY)
+    retry = api.post("/api/orders", json=order(), headers=KEY)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert run(db.orders.count_documents({})) == 1
+    assert run(db.products.find_one({"id": "p1"}))['reserved_quantity'] == 1
+
+
+def test_concurrent_duplicates_are_coalesced(api, db, run):
+    run(seed(db))
+
+    responses = run(asyncio.gather(*(
+        api.client.post("/api/stock/adjust", json={"product_id": "p1", "change": -2, "reason": "Svinn"}, headers=KEY)
+        for _ in range(5)
+    )))
+
+    assert {r.status_code for r in responses} == {201}
+    assert len({r.json()['adjustment_id'] for r in responses}) == 1
+    assert run(db.stock_adjustments.count_documents({})) == 1
+    assert run(db.products.find_one({"id": "p1"}))['stock_quantity'] == 8
+
+
+def test_key_reused_for_different_request_is_rejected(api, db, run):
+    run(seed(db))
+
+    api.post("/api/orders", json=order(1), headers=KEY)
+    response = api.post("/api/orders", json=order(3), headers=KEY)
+
+    assert response.status_code == 422
+    assert run(db.orders.count_documents({})) == 1
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/orders", order()),
+    ("/api/purchases", {"supplier_id": "s1", "items": [{"product_id": "p1", "quantity": 5}]}),
+])
+def test_failed_attempt_releases_key_and_plain_requests_still_write(api, db, run, path, body):
+    run(seed(db))
+
+    missing = api.post(path, json={**body, "items": [{"product_id": "nope", "quantity": 1}]}, headers=KEY)
+    assert missing.status_code == 404
+    assert api.post(path, json=body, headers=KEY).status_code == 201
+
+    # Without the header every request writes
+    api.post(path, json=body)
+    api.post(path, json=body)
+    collection = db.orders if path == "/api/orders" else db.purchases
+    assert run(collection.count_documents({})) == 3
@@ -0,0 +1,76 @@
+"""
+Image variants: byte ranges and ETag revalidation on the immutable responses.
+"""
+import pytest
+
+import server
+from utils import parse_range_header
+from utils.images import variant_path
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),           # open-ended
+    ("bytes=-200", (800, 999)),           # suffix: last 200 bytes
+    ("bytes=-5000", (0, 999)),            # suffix longer than the file
+    ("bytes=900-5000", (900, 999)),       # end clamped to the file
+    ("bytes=0-1,5-6", None),              # multiple ranges are not supported
+    ("items=0-1", None),
+    ("bytes=abc-", None),                 # malformed ranges are ignored
+    ("bytes=-", None),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-2000", "bytes=50-10", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range_header(header, 1000)
+
+
+@pytest.fixture
+def variant(tmp_path, monkeypatch):
+    uploads, variants = tmp_path / "products", tmp_path / "variants"
+    uploads.mkdir()
+    variants.mkdir()
+    monkeypatch.setattr(server, "PRODUCT_UPLOAD_DIR", uploads)
+    monkeypatch.setattr(server, "IMAGE_VARIANT_DIR", variants)
+    (uploads / "abc.png").write_bytes(b"png")
+    # Already rendered, so the request is served straight from disk
+    variant_path(variants, "abc.png", "card").write_bytes(bytes(range(100)))
+    return "/images/card/abc.png"
+
+
+def test_variant_is_served_immutable_with_etag_revalidation(api, variant):
+    response = api.get(variant)
+
+    assert response.status_code == 200
+    assert response.content == bytes(range(100))
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    etag = response.headers["etag"]
+
+    revalidated = api.get(variant, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+
+    assert api.get(variant, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_variant_ranges(api, variant):
+    partial = api.get(variant, headers={"Range": "bytes=-10"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == "bytes 90-99/100"
+    assert partial.content == bytes(range(90, 100))
+
+    unsatisfiable = api.get(variant, headers={"Range": "bytes=500-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */100"
+
+
+def test_unknown_variants_and_unsafe_names_are_404(api, variant):
+    assert api.get("/images/huge/abc.png").status_code == 404
+    assert api.get("/images/card/..%2Fsecret.png").status_code == 404
+    assert api.get("/images/card/missing.png").status_code == 404
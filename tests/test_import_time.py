@@ -0,0 +1,67 @@
+"""
+Cold-start budget for the API module.
+
+Imports server.py in a fresh interpreter with `-X importtime` and checks that
+the optional subsystems (email, password hashing, JWT, AI, image processing)
+are not loaded until first use and that the whole import stays within
+IMPORT_TIME_BUDGET_MS (default 1500 ms; raise it on slow CI machines).
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# Top-level packages that must only load on first use
+LAZY_MODULES = ["aiosmtplib", "email.mime", "passlib", "bcrypt", "jwt", "emergentintegrations", "openai", "PIL", "pyarrow"]
+
+
+def parse_importtime(stderr: str) -> dict:
+    """{module: (self_us, cumulative_us)} from `python -X importtime` output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def import_server() -> dict:
+    env = {**os.environ, "MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "crm_import_time",
+           "EMAIL_ENABLED": "false"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    return parse_importtime(result.stderr)
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   _io\n"
+        "import time:      2453 |     371752 | fastapi\n"
+    )
+
+    assert parse_importtime(stderr) == {"_io": (120, 120), "fastapi": (2453, 371752)}
+
+
+def test_server_import_is_lazy_and_within_budget():
+    modules = import_server()
+
+    eager = sorted(
+        name for name in modules
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+    assert not eager, f"imported at startup, should load on first use: {', '.join(eager)}"
+
+    total_ms = modules["server"][1] / 1000
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:10]
+    assert total_ms <= IMPORT_TIME_BUDGET_MS, (
+        f"importing server took {total_ms:.0f} ms, budget {IMPORT_TIME_BUDGET_MS:.0f} ms; slowest (self): "
+        + ", ".join(f"{name} {self_us / 1000:.1f} ms" for name, (self_us, _) in slowest)
+    )
@@ -0,0 +1,180 @@
+"""
+Live dashboard push: fan-out and stream reconnects against a scripted change
+stream over the in-memory database, and the full flow against a real MongoDB
+replica set.
+
+The replica set test needs a (single-node) replica set, e.g.:
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27018
+    mongosh --port 27018 --eval 'rs.initiate()'
+    REPLICA_SET_MONGO_URL="mongodb://localhost:27018/?replicaSet=rs0" pytest tests/test_live_dashboard.py
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from pymongo.errors import PyMongoError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+MONGO_URL = os.environ.get("REPLICA_SET_MONGO_URL")
+
+requires_replica_set = pytest.mark.skipif(not MONGO_URL, reason="REPLICA_SET_MONGO_URL not set")
+
+
+async def next_message(stream, timeout=10):
+    """Next non-keepalive message from a hub subscription"""
+    while True:
+        message = await asyncio.wait_for(stream.__anext__(), timeout)
+        if message is not None:
+            return message
+
+
+class ScriptedChangeStream:
+    """Change stream whose events (or errors) the test pushes in"""
+
+    def __init__(self):
+        self.events = asyncio.Queue()
+        self.alive = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.alive = False
+
+    async def try_next(self):
+        try:
+            event = await asyncio.wait_for(self.events.get(), 0.01)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(event, Exception):
+            raise event
+        return event
+
+
+class ScriptedDatabase:
+    """The in-memory database, with every watch() opening a new ScriptedChangeStream"""
+
+    def __init__(self, db):
+        self._db = db
+        self.streams = []
+
+    def __getitem__(self, name):
+        return self._db[name]
+
+    def watch(self, pipeline, **kwargs):
+        self.streams.append(ScriptedChangeStream())
+        return self.streams[-1]
+
+
+async def change(db, collection: str, query: dict, operation: str = "update"):
+    doc = await db[collection].find_one(query)
+    return {"operationType": operation, "ns": {"coll": collection}, "documentKey": {"_id": doc['_id']},
+            "fullDocument": doc}
+
+
+async def run_fan_out_and_reconnect(db):
+    from utils import DashboardHub
+
+    await db.products.insert_one({"id": "p1", "name": "Vitamin D", "active": True, "cost": 10})
+    await db.stock.insert_one({"product_id": "p1", "quantity": 5, "min_stock": 10, "status": "Low"})
+    scripted = ScriptedDatabase(db)
+    hub = DashboardHub(scripted)
+    streams = [hub.subscribe(keepalive=1), hub.subscribe(keepalive=1)]
+    try:
+        for stream in streams:
+            assert (await next_message(stream))["kpis"]["low_stock"] == 1
+        assert (hub.mode, len(scripted.streams)) == ("change_stream", 1)
+
+        # One change event reaches every subscriber
+        await db.orders.insert_one({"id": "o1", "customer_id": "c1", "date": datetime.now(timezone.utc).isoformat(),
+                                    "status": "Processing", "order_total": 199.0})
+        scripted.streams[0].events.put_nowait(await change(db, "orders", {"id": "o1"}, "insert"))
+        for stream in streams:
+            delta = await next_message(stream)
+            assert delta["kpis"]["sales_this_month"] == {"count": 1, "revenue": 199.0}
+
+        # The stream dies; a restock happens while nobody is watching
+        await db.stock.update_one({"product_id": "p1"}, {"$set": {"quantity": 20, "status": "OK"}})
+        scripted.streams[0].events.put_nowait(PyMongoError("connection reset"))
+        # The hub reopens the stream and reloads, so the missed change still arrives
+        for stream in streams:
+            assert (await next_message(stream))["kpis"] == {"low_stock": 0, "inventory_value": 200}
+        assert len(scripted.streams) == 2
+
+        # Events flow from the new stream
+        await db.products.update_one({"id": "p1"}, {"$set": {"cost": 12}})
+        scripted.streams[1].events.put_nowait(await change(db, "products", {"id": "p1"}))
+        for stream in streams:
+            assert (await next_message(stream))["kpis"] == {"inventory_value": 240}
+    finally:
+        for stream in streams:
+            await stream.aclose()
+        await hub.stop()
+
+
+def test_hub_fans_out_and_resubscribes_after_a_stream_error(db, run, monkeypatch):
+    import utils.live_dashboard as live_dashboard
+    monkeypatch.setattr(live_dashboard, "RETRY_DELAY", 0)
+
+    run(run_fan_out_and_reconnect(db))
+
+
+async def run_live_dashboard_flow():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from utils import DashboardHub
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client["crm_test_live_dashboard"]
+    await client.drop_database(db.name)
+    now = datetime.now(timezone.utc).isoformat()
+
+    await db.products.insert_one({"id": "p1", "name": "Vitamin D", "active": True, "cost": 10})
+    await db.stock.insert_one({"product_id": "p1", "quantity": 5, "min_stock": 10, "status": "Low"})
+
+    hub = DashboardHub(db)
+    stream = hub.subscribe(keepalive=1)
+    try:
+        snapshot = await next_message(stream)
+        assert snapshot["type"] == "snapshot"
+        assert hub.mode == "change_stream"
+        assert snapshot["kpis"]["total_products"] == 1
+        assert snapshot["kpis"]["low_stock"] == 1
+        assert snapshot["kpis"]["inventory_value"] == 50
+
+        # New sale today -> sales, today's stats and active customers change
+        await db.orders.insert_one({
+            "id": "o1", "customer_id": "c1", "date": now,
+            "status": "Processing", "order_total": 199.0
+        })
+        delta = await next_message(stream)
+        assert delta["type"] == "delta"
+        assert delta["kpis"]["sales_this_month"] == {"count": 1, "revenue": 199.0}
+        assert delta["kpis"]["active_customers"] == 1
+        assert delta["todayStats"] == {"sales": 199.0, "orders": 1}
+
+        # Restock -> only stock-derived values are sent
+        await db.stock.update_one({"product_id": "p1"}, {"$set": {"quantity": 20, "status": "OK"}})
+        delta = await next_message(stream)
+        assert delta["kpis"] == {"low_stock": 0, "inventory_value": 200}
+        assert delta["alerts"] == {"lowStock": 0}
+        assert "todayStats" not in delta
+
+        # Deleting the order rolls its contribution back
+        await db.orders.delete_one({"id": "o1"})
+        delta = await next_message(stream)
+        assert delta["kpis"]["sales_this_month"] == {"count": 0, "revenue": 0}
+        assert delta["kpis"]["active_customers"] == 0
+    finally:
+        await stream.aclose()
+        await hub.stop()
+        await client.drop_database(db.name)
+        client.close()
+
+
+@requires_replica_set
+def test_live_dashboard_pushes_deltas_from_change_streams():
+    asyncio.run(run_live_dashboard_flow())
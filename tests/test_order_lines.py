@@ -0,0 +1,51 @@
+"""
+Order fields copied onto order_lines: written on create, kept in step on
+status changes, backfilled for older data, and used by line analytics.
+"""
+from utils import backfill_order_lines
+
+
+async def seed(db):
+    await db.customers.insert_one({"id": "c1", "name": "Kari Nordmann", "status": "New"})
+    await db.products.insert_many([
+        {"id": "p1", "name": "Vitamin D", "sku": "VD-1", "cost": 10.0, "price": 30.0, "stock_quantity": 50},
+        {"id": "p2", "name": "Omega-3", "sku": "OM-3", "cost": 20.0, "price": 50.0, "stock_quantity": 50},
+    ])
+
+
+def test_new_lines_carry_order_fields_and_follow_status(api, db, run):
+    run(seed(db))
+    order = api.post("/api/orders", json={"customer_id": "c1", "items": [
+        {"product_id": "p1", "quantity": 2}, {"product_id": "p2", "quantity": 1}
+    ]}).json()
+
+    api.put(f"/api/orders/{order['id']}/status", params={"status": "Shipped"})
+
+    lines = run(db.order_lines.find({"order_id": order['id']}, {"_id": 0}).to_list(None))
+    assert {(line['customer_id'], line['date'], line['status']) for line in lines} == {
+        ("c1", order['date'], "Shipped")
+    }
+    assert run(db.customers.find_one({"id": "c1"}))['favorite_product'] == "Vitamin D"
+
+
+def test_backfill_resumes_and_feeds_customer_products(api, db, run):
+    run(seed(db))
+    run(db.orders.insert_many([
+        {"id": f"o{n}", "customer_id": "c1", "date": f"2025-01-0{n + 1}T10:00:00+00:00", "status": status}
+        for n, status in enumerate(["Delivered", "Processing", "Cancelled"])
+    ]))
+    run(db.order_lines.insert_many([
+        {"id": f"l{n}", "order_id": f"o{n}", "product_id": "p1", "product_name": "Vitamin D",
+         "quantity": 1, "line_total": 30.0}
+        for n in range(3)
+    ]))
+
+    first = run(backfill_order_lines(db, batch_size=1, after=None))
+    assert first == {"orders": 3, "lines_updated": 3, "last_order_id": "o2"}
+    assert run(backfill_order_lines(db, after="o2"))['orders'] == 0
+
+    products = api.get("/api/customers/c1/products").json()
+    assert products == [{
+        "product_id": "p1", "product_name": "Vitamin D", "quantity": 2, "revenue": 60.0, "orders": 2,
+        "last_purchased": "2025-01-02T10:00:00+00:00",
+    }]
@@ -0,0 +1,99 @@
+"""
+Monthly Parquet export: typed columns, lines from both layouts, and re-runs
+that only rewrite the months that changed.
+"""
+import pytest
+
+from utils import export_parquet, month_signatures
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+async def seed(db):
+    await db.products.insert_one(
+        {"id": "p1", "name": "Vitamin D", "sku": "VD-1", "cost": 10.0, "price": 30.0, "stock_quantity": 50}
+    )
+    line = {"product_id": "p1", "product_name": "Vitamin D", "quantity": 2, "sale_price": 30.0,
+            "cost_price": 10.0, "discount": 0, "line_total": 60.0, "line_profit": 40.0}
+    await db.orders.insert_many([
+        {"id": "o1", "customer_id": "c1", "customer_name": "Kari", "date": "2025-01-15T10:00:00+00:00",
+         "channel": "Shopify", "status": "Processing", "order_total": 60.0, "profit": 40.0},
+        # Already migrated to the embedded layout
+        {"id": "o2", "customer_id": "c1", "customer_name": "Kari", "date": "2025-02-03T09:00:00+00:00",
+         "channel": "TikTok", "status": "Delivered", "order_total": 60.0, "profit": 40.0,
+         "lines": [{"id": "l2", **line}]},
+    ])
+    await db.order_lines.insert_one({"id": "l1", "order_id": "o1", **line})
+    await db.expenses.insert_many([
+        {"id": "e1", "date": "2025-01-20T00:00:00+00:00", "category": "Marketing", "amount": 500.0},
+        {"id": "e2", "date": "2025-02-20T00:00:00+00:00", "category": "Shipping", "amount": 80.0},
+    ])
+    await db.stock_movements.insert_one(
+        {"id": "m1", "product_id": "p1", "timestamp": "2025-01-15T10:00:00+00:00", "type": "OUT",
+         "change": -2, "source": "ORDER", "source_id": "o1"}
+    )
+
+
+def test_export_writes_typed_monthly_partitions(db, run, tmp_path):
+    run(seed(db))
+    report = run(export_parquet(db, str(tmp_path)))
+
+    assert report['order_lines']['written'] == ["2025-01", "2025-02"]
+    assert report['stock_movements']['written'] == ["2025-01"]
+
+    lines = pq.read_table(tmp_path / "order_lines" / "month=2025-02" / "part-0.parquet")
+    assert str(lines.schema.field("date").type) == "timestamp[us, tz=UTC]"
+    assert str(lines.schema.field("quantity").type) == "int64"
+    assert lines.to_pylist()[0]['channel'] == "TikTok"
+    assert lines.to_pylist()[0]['order_id'] == "o2"
+    january = pq.read_table(tmp_path / "order_lines" / "month=2025-01" / "part-0.parquet").to_pylist()
+    assert [(row['id'], row['status']) for row in january] == [("l1", "Processing")]
+
+
+def test_rerun_only_rewrites_changed_months(api, db, run, tmp_path):
+    run(seed(db))
+    run(export_parquet(db, str(tmp_path)))
+
+    again = run(export_parquet(db, str(tmp_path)))
+    assert all(result['written'] == [] for result in again.values())
+
+    api.put("/api/orders/o1/status", params={"status": "Shipped"})
+    run(db.expenses.delete_one({"id": "e2"}))
+    report = run(export_parquet(db, str(tmp_path)))
+
+    assert report['orders']['written'] == ["2025-01"]
+    assert report['orders']['unchanged'] == 1
+    assert report['order_lines']['written'] == ["2025-01"]
+    assert report['expenses']['removed'] == ["2025-02"]
+    assert not (tmp_path / "expenses" / "month=2025-02").exists()
+    orders = pq.read_table(tmp_path / "orders" / "month=2025-01" / "part-0.parquet").to_pylist()
+    assert orders[0]['status'] == "Shipped"
+
+
+def test_delete_plus_backdated_insert_is_picked_up(db, run, tmp_path):
+    run(seed(db))
+    run(db.expenses.insert_one({"id": "e4", "date": "2025-01-25T00:00:00+00:00", "category": "Software", "amount": 5.0}))
+    run(export_parquet(db, str(tmp_path)))
+
+    # Same row count, and the latest date of the month is unchanged
+    run(db.expenses.delete_one({"id": "e1"}))
+    run(db.expenses.insert_one(
+        {"id": "e3", "date": "2025-01-02T00:00:00+00:00", "category": "Software", "amount": 99.0}
+    ))
+    report = run(export_parquet(db, str(tmp_path)))
+
+    assert report['expenses']['written'] == ["2025-01"]
+    expenses = pq.read_table(tmp_path / "expenses" / "month=2025-01" / "part-0.parquet").to_pylist()
+    assert sorted(row['id'] for row in expenses) == ["e3", "e4"]
+
+
+def test_month_signatures_do_not_depend_on_insert_order(db, run):
+    docs = [{"id": f"e{n}", "date": "2025-03-0{n}T00:00:00+00:00", "category": "Software", "amount": 1.0}
+            for n in range(1, 4)]
+    run(db.expenses.insert_many(docs))
+    forward = run(month_signatures(db, "expenses"))
+    run(db.expenses.delete_many({}))
+    run(db.expenses.insert_many(list(reversed(docs))))
+
+    assert run(month_signatures(db, "expenses")) == forward
+    assert forward["2025-03"]['rows'] == 3
@@ -0,0 +1,88 @@
+"""
+MongoDB round-trip budgets for list endpoints.
+
+Each endpoint must issue a fixed number of queries regardless of how many
+rows it returns - one query per row (N+1) blows the budget at the larger
+row count. Runs on the in-memory stand-in, or on a real server with
+TEST_MONGO_URL set (see conftest.py).
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+ROW_COUNTS = [5, 60]
+
+
+async def seed(db, rows: int):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    products = [
+        {"id": f"p{i}", "name": f"Produkt {i}", "sku": f"SKU-{i}", "cost": 10.0, "price": 30.0, "active": True}
+        for i in range(3)
+    ]
+    await db.products.insert_many(products)
+    await db.orders.insert_many([
+        {"id": f"o{n}", "customer_id": "c1", "customer_name": "Kari Nordmann",
+         "date": (start + timedelta(hours=n)).isoformat(), "status": "Processing", "order_total": 60.0}
+        for n in range(rows)
+    ])
+    await db.order_lines.insert_many([
+        {"id": f"ol{n}-{i}", "order_id": f"o{n}", "product_id": f"p{i}", "product_name": f"Produkt {i}",
+         "quantity": 1, "sale_price": 30.0, "cost_price": 10.0, "line_total": 30.0, "line_profit": 20.0}
+        for n in range(rows) for i in range(2)
+    ])
+    await db.purchases.insert_many([
+        {"id": f"pu{n}", "supplier_id": "s1", "supplier_name": "Nordic Supplements AS",
+         "date": (start + timedelta(days=n)).isoformat(), "status": "RECEIVED", "total_amount": 100.0}
+        for n in range(rows)
+    ])
+    await db.purchase_lines.insert_many([
+        {"id": f"pl{n}", "purchase_id": f"pu{n}", "product_id": f"p{n % 3}", "product_name": f"Produkt {n % 3}",
+         "quantity": 10, "cost_price": 10.0}
+        for n in range(rows)
+    ])
+    await db.stock_adjustments.insert_many([
+        {"id": f"a{n}", "product_id": f"p{n % 3}", "change": 1, "reason": "Telling",
+         "created_at": (start + timedelta(hours=n)).isoformat()}
+        for n in range(rows)
+    ])
+    await db.stock_movements.insert_many([
+        {"id": f"m{n}", "product_id": f"p{n % 3}", "type": "IN", "change": 1, "source": "MANUAL",
+         "timestamp": (start + timedelta(hours=n)).isoformat()}
+        for n in range(rows)
+    ])
+
+
+@pytest.mark.parametrize("rows", ROW_COUNTS)
+@pytest.mark.parametrize("path, budget", [
+    ("/api/orders", 3),
+    ("/api/purchases", 3),
+    ("/api/stock/adjustments", 2),
+    ("/api/stock-movements", 2),
+])
+def test_list_endpoints_stay_within_query_budget(api, db, run, query_budget, rows, path, budget):
+    run(seed(db, rows))
+
+    with query_budget(budget):
+        response = api.get(path)
+
+    assert response.status_code == 200
+    assert len(response.json()) == rows
+
+
+def test_orders_keep_their_lines(api, db, run):
+    run(seed(db, 5))
+
+    orders = api.get("/api/orders").json()
+
+    assert [o['id'] for o in orders] == [f"o{n}" for n in reversed(range(5))]
+    assert all(sorted(line['product_id'] for line in o['lines']) == ["p0", "p1"] for o in orders)
+
+
+def test_stock_adjustments_include_product_info(api, db, run):
+    run(seed(db, 5))
+
+    adjustments = api.get("/api/stock/adjustments").json()
+
+    assert {(a['product_id'], a['product_name'], a['product_sku']) for a in adjustments} == {
+        (f"p{i}", f"Produkt {i}", f"SKU-{i}") for i in range(3)
+    }
@@ -0,0 +1,92 @@
+"""
+Local recommender: Norwegian stemming, BM25 ranking over the inverted index,
+and rebuilding the index when the catalog version changes.
+"""
+import pytest
+
+import server
+from utils import RecommendationIndex, recommend_products
+from utils.recommender import query_terms, stem
+
+PRODUCTS = [
+    {"id": "p1", "name": "Magnesium Kveld", "category": "mineral", "health_areas": ["Søvn"],
+     "short_description": "Magnesium for avslapning"},
+    {"id": "p2", "name": "Vitamin D3", "category": "vitamin", "health_areas": ["Immun", "Energi"],
+     "short_description": "Vitamin D for vinteren"},
+    {"id": "p3", "name": "Omega-3", "category": "supplement", "health_areas": ["Hjerte", "Hjerne"],
+     "short_description": "Fiskeolje for hjerte og hjerne"},
+    {"id": "p4", "name": "Kollagen", "category": "supplement", "health_areas": ["Hud", "Ledd"],
+     "short_description": "Kollagen for hud, ledd og litt bedre søvn etter trening"},
+]
+
+
+@pytest.mark.parametrize("word, expected", [
+    ("leddene", "ledd"),
+    ("vinteren", "vint"),
+    ("trøtthet", "trøtt"),
+    ("konsentrasjonen", "konsentrasjon"),
+    ("syk", "syk"),          # too short to strip
+    ("sove", "sove"),
+])
+def test_norwegian_stemmer(word, expected):
+    assert stem(word) == expected
+    assert stem(stem(word)) == stem(word)
+
+
+def test_keywords_expand_to_health_areas():
+    terms = query_terms("Kunden er trøtt og sliten i mørketiden")
+
+    assert terms["area:energi"] == 3
+    assert terms["area:immun"] == 1
+    assert "kunden" not in terms and "og" not in terms
+
+
+def test_tagged_product_outranks_description_mention():
+    index = RecommendationIndex(PRODUCTS)
+
+    results = index.search("Dårlig søvn, våkner om natten", limit=4)
+
+    assert [product['id'] for product, _, _ in results][:2] == ["p1", "p4"]
+    assert results[0][1] > results[1][1]
+    assert "area:søvn" in results[0][2]
+
+
+def test_rare_terms_weigh_more_and_short_documents_win():
+    index = RecommendationIndex([
+        {"id": "a", "name": "Sink", "short_description": "sink"},
+        {"id": "b", "name": "Sink Kompleks", "short_description": "sink med mange andre mineraler og urter"},
+        {"id": "c", "name": "Jern", "short_description": "jern og sink"},
+    ])
+
+    # "sink" is in every product, "jern" in one
+    assert max(index.postings["jern"].values()) > max(index.postings["sink"].values())
+    ranked = [product['id'] for product, _, _ in index.search("sink", limit=3)]
+    assert ranked.index("a") < ranked.index("b")
+
+
+def test_no_match_gives_an_empty_recommendation():
+    result = recommend_products(RecommendationIndex(PRODUCTS), "Trenger en ny sykkel")
+
+    assert result['products'] == []
+    assert "Fant ingen produkter" in result['explanation']
+
+
+def test_index_is_rebuilt_when_the_catalog_changes(api, db, run, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(server, "recommendation_index", None)
+    run(db.products.insert_many([{**p, "active": True} for p in PRODUCTS]))
+
+    def recommend():
+        body = {"customer_context": "Sover dårlig og våkner om natten"}
+        return [p['name'] for p in api.post("/api/ai/recommend-products", json=body).json()['recommendations']['products']]
+
+    assert recommend()[0] == "Magnesium Kveld"
+    first_index = server.recommendation_index
+    assert recommend()[0] == "Magnesium Kveld"
+    assert server.recommendation_index is first_index
+
+    assert api.request("DELETE", "/api/products/p1").status_code == 204
+
+    assert "Magnesium Kveld" not in recommend()
+    assert server.recommendation_index is not first_index
+    assert server.recommendation_index.version == 1
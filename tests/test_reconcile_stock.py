@@ -0,0 +1,83 @@
+"""
+Stock reconciler: open and cancelled orders and posted movements are not drift,
+and products the ledger cannot vouch for are flagged instead of overwritten.
+"""
+
+
+async def seed(db):
+    await db.customers.insert_one({"id": "c1", "name": "Kari Nordmann", "status": "New"})
+    await db.products.insert_one(
+        {"id": "p1", "name": "Vitamin D", "sku": "VD-1", "cost": 10.0, "price": 30.0, "stock_quantity": 10}
+    )
+    await db.stock.insert_one({"product_id": "p1", "quantity": 10, "min_stock": 2})
+    await db.stock_movements.insert_one(
+        {"id": "m1", "product_id": "p1", "type": "IN", "change": 10, "source": "PURCHASE",
+         "timestamp": "2025-01-01T00:00:00+00:00"}
+    )
+
+
+def product_drift(api):
+    return {item['product_id']: item for item in api.get("/api/stock/reconcile").json()['drift']}
+
+
+def test_open_cancelled_and_completed_orders(api, db, run):
+    run(seed(db))
+    open_order = api.post("/api/orders", json={"customer_id": "c1", "items": [{"product_id": "p1", "quantity": 3}]})
+    assert product_drift(api).get("p1", {}).get("product_drift", 0) == 0
+
+    api.put(f"/api/orders/{open_order.json()['id']}/status", params={"status": "Cancelled"})
+    assert product_drift(api).get("p1", {}).get("product_drift", 0) == 0
+
+    completed = api.post("/api/orders", json={"customer_id": "c1", "items": [{"product_id": "p1", "quantity": 4}]})
+    api.put(f"/api/orders/{completed.json()['id']}/status", params={"status": "COMPLETED"})
+    assert product_drift(api).get("p1", {}).get("product_drift", 0) == 0
+
+    # Repair must not take the completed order out a second time
+    api.post("/api/stock/reconcile")
+    assert run(db.products.find_one({"id": "p1"}))['stock_quantity'] == 6
+
+
+def test_real_drift_is_repaired(api, db, run):
+    run(seed(db))
+    run(db.products.update_one({"id": "p1"}, {"$set": {"stock_quantity": 12}}))
+
+    report = api.post("/api/stock/reconcile").json()
+
+    assert report['drift'][0]['product_drift'] == 2
+    assert report['drift'][0]['flag'] is None
+    assert report['products_updated'] == 1
+    assert run(db.products.find_one({"id": "p1"}))['stock_quantity'] == 10
+
+
+def test_unverifiable_products_are_flagged_not_overwritten(api, db, run):
+    run(seed(db))
+    run(db.products.insert_many([
+        {"id": "p2", "name": "No history", "sku": "NH-1", "stock_quantity": 40},
+        {"id": "p3", "name": "Legacy edit", "sku": "LE-1", "stock_quantity": 25},
+    ]))
+    run(db.stock_movements.insert_many([
+        {"id": "m2", "product_id": "p3", "type": "IN", "change": 20, "source": "PURCHASE",
+         "timestamp": "2025-01-01T00:00:00+00:00"},
+        # Older PUT /stock logged the new total, not the difference
+        {"id": "m3", "product_id": "p3", "type": "IN", "change": 25, "quantity": 25, "source": "MANUAL",
+         "note": "Manual adjustment", "timestamp": "2025-01-02T00:00:00+00:00"},
+    ]))
+
+    report = api.post("/api/stock/reconcile").json()
+
+    flags = {item['product_id']: item['flag'] for item in report['drift']}
+    assert flags == {"p2": "no_movements", "p3": "absolute_entries"}
+    assert (report['flagged_products'], report['products_updated']) == (2, 0)
+    assert run(db.products.find_one({"id": "p2"}))['stock_quantity'] == 40
+    assert run(db.products.find_one({"id": "p3"}))['stock_quantity'] == 25
+
+
+def test_posted_movements_change_stock_as_the_ledger_reads_them(api, db, run):
+    run(seed(db))
+
+    for movement in [{"type": "ADJUST", "quantity": -2}, {"type": "ADJUST", "quantity": 5}, {"type": "OUT", "quantity": 3}]:
+        assert api.post("/api/stock-movements", json={"product_id": "p1", **movement}).status_code == 201
+
+    assert run(db.products.find_one({"id": "p1"}))['stock_quantity'] == 10
+    assert run(db.stock.find_one({"product_id": "p1"}))['quantity'] == 10
+    assert product_drift(api).get("p1", {}).get("product_drift", 0) == 0
@@ -0,0 +1,62 @@
+"""
+Sales reports: totals, time series and top lists from one aggregation.
+"""
+
+
+async def seed(db):
+    await db.orders.insert_many([
+        {"id": "o1", "customer_id": "c1", "customer_name": "Kari", "date": "2025-01-05T10:00:00+00:00",
+         "status": "Delivered", "order_total": 100.0, "profit": 40.0},
+        {"id": "o2", "customer_id": "c2", "customer_name": "Ola", "date": "2025-01-05T18:00:00+00:00",
+         "status": "Shipped", "order_total": 50.0, "profit": 20.0},
+        {"id": "o3", "customer_id": "c1", "customer_name": "Kari", "date": "2025-02-10T09:00:00+00:00",
+         "status": "Processing", "order_total": 30.0, "profit": 10.0},
+        # Not a sale
+        {"id": "o4", "customer_id": "c2", "customer_name": "Ola", "date": "2025-01-06T09:00:00+00:00",
+         "status": "Cancelled", "order_total": 999.0, "profit": 999.0},
+        # Malformed date inside the range: counted, but not bucketed
+        {"id": "o5", "customer_id": "c2", "customer_name": "Ola", "date": "2025-01-xx",
+         "status": "Delivered", "order_total": 5.0, "profit": 1.0},
+    ])
+    await db.order_lines.insert_many([
+        {"id": "l1", "order_id": "o1", "product_id": "p1", "product_name": "Vitamin D", "quantity": 2,
+         "line_total": 100.0},
+        {"id": "l2", "order_id": "o2", "product_id": "p2", "product_name": "Omega-3", "quantity": 1,
+         "line_total": 50.0},
+        {"id": "l3", "order_id": "o3", "product_id": "p1", "product_name": "Vitamin D", "quantity": 1,
+         "line_total": 30.0},
+    ])
+
+
+def test_range_report_buckets_by_month_and_day(api, db, run):
+    run(seed(db))
+
+    monthly = api.get("/api/reports/range", params={"from": "2025-01-01", "to": "2025-03-01"}).json()
+    assert (monthly['sales'], monthly['profit'], monthly['orders_count']) == (185.0, 71.0, 4)
+    assert monthly['series'] == [
+        {"period": "2025-01", "sales": 150.0, "profit": 60.0, "orders": 2},
+        {"period": "2025-02", "sales": 30.0, "profit": 10.0, "orders": 1},
+    ]
+    assert monthly['top_products'][0] == {"name": "Vitamin D", "quantity": 3, "revenue": 130.0}
+    assert monthly['top_customers'][0] == {"name": "Kari", "orders": 2, "revenue": 130.0}
+
+    daily = api.get("/api/reports/range", params={"from": "2025-01-01", "to": "2025-02-01",
+                                                  "granularity": "day"}).json()
+    assert daily['series'] == [{"period": "2025-01-05", "sales": 150.0, "profit": 60.0, "orders": 2}]
+
+
+def test_range_report_validates_input(api):
+    assert api.get("/api/reports/range", params={"from": "2025-01-01", "to": "2025-02-01",
+                                                 "granularity": "year"}).status_code == 400
+    assert api.get("/api/reports/range", params={"from": "2025-02-01", "to": "2025-01-01"}).status_code == 400
+    assert api.get("/api/reports/range", params={"from": "januar", "to": "2025-01-01"}).status_code == 400
+
+
+def test_monthly_report(api, db, run):
+    run(seed(db))
+
+    report = api.get("/api/reports/monthly", params={"month": 1, "year": 2025}).json()
+
+    assert (report['monthly_sales'], report['orders_count']) == (155.0, 3)
+    assert [p['name'] for p in report['top_products']] == ["Vitamin D", "Omega-3"]
+    assert "series" not in report
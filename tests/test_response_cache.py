@@ -0,0 +1,94 @@
+"""
+AsyncTTLCache (LRU, TTL, single-flight) and the AI recommendation cache,
+which must not keep answers it could not parse.
+"""
+import asyncio
+
+import pytest
+
+import server
+import utils.response_cache as response_cache
+from utils import AsyncTTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AsyncTTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1     # "b" is now the least recently used
+    cache.set("c", 3)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = AsyncTTLCache(ttl=60)
+    cache.set("a", 1)
+
+    clock[0] += 59
+    assert cache.get("a") == 1
+    clock[0] += 2
+    assert cache.get("a") is None
+
+
+def test_concurrent_calls_share_one_computation(run):
+    cache = AsyncTTLCache()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    results = run(asyncio.gather(*(cache.get_or_compute("k", factory) for _ in range(5))))
+
+    assert results == [{"answer": 42}] * 5
+    assert len(calls) == 1
+    assert run(cache.get_or_compute("k", factory)) == {"answer": 42}
+    assert (len(calls), cache.misses, cache.hits) == (1, 1, 5)
+
+
+def test_failures_reach_every_waiter_and_are_not_cached(run):
+    cache = AsyncTTLCache()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = run(asyncio.gather(*(cache.get_or_compute("k", factory) for _ in range(3)), return_exceptions=True))
+
+    assert [str(r) for r in results] == ["upstream down"] * 3
+    assert len(calls) == 1
+    assert cache.get("k") is None
+
+
+def test_unparsed_ai_answer_is_shown_but_not_cached(api, run, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-proj-test")
+    monkeypatch.setattr(server, "ai_recommendation_cache", AsyncTTLCache())
+    answers = ["Beklager, jeg kan ikke svare akkurat nå.", '{"products": [{"name": "Vitamin D"}], "explanation": "OK"}']
+    calls = []
+
+    async def ask(customer_context, api_key):
+        calls.append(customer_context)
+        return server.parse_ai_recommendations(answers[len(calls) - 1])
+
+    monkeypatch.setattr(server, "ask_ai_for_recommendations", ask)
+    body = {"customer_context": "Sliten om vinteren og lite sol"}
+
+    first = api.post("/api/ai/recommend-products", json=body).json()
+    second = api.post("/api/ai/recommend-products", json=body).json()
+    third = api.post("/api/ai/recommend-products", json=body).json()
+
+    assert first['recommendations'] == {"products": [], "explanation": answers[0]}
+    assert second['recommendations']['products'] == [{"name": "Vitamin D"}]
+    assert third == second
+    assert len(calls) == 2
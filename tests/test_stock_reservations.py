@@ -0,0 +1,149 @@
+"""
+Stock reservations: orders hold stock from creation, completion takes it out
+of stock_quantity, cancellation and expiry give it back.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+import utils.stock_reservations as stock_reservations
+from utils import commit_reservations, release_expired_reservations
+
+
+async def seed(db, stock=10):
+    await db.customers.insert_one({"id": "c1", "name": "Kari Nordmann", "status": "New"})
+    await db.products.insert_many([
+        {"id": "p1", "name": "Vitamin D", "sku": "VD-1", "cost": 10.0, "price": 30.0, "stock_quantity": stock},
+        {"id": "p2", "name": "Omega-3", "sku": "OM-3", "cost": 20.0, "price": 50.0, "stock_quantity": 1},
+    ])
+    await db.stock.insert_one({"product_id": "p1", "quantity": stock, "min_stock": 0})
+
+
+def order(quantity, product_id="p1"):
+    return {"customer_id": "c1", "items": [{"product_id": product_id, "quantity": quantity}]}
+
+
+def available(api, product_id="p1"):
+    return api.get("/api/stock/available", params={"product_id": product_id}).json()[product_id]
+
+
+def test_order_reserves_and_completion_commits(api, db, run):
+    run(seed(db))
+
+    order_id = api.post("/api/orders", json=order(3)).json()['id']
+    assert available(api) == {"on_hand": 10, "reserved": 3, "available": 7}
+
+    assert api.put(f"/api/orders/{order_id}/status", params={"status": "COMPLETED"}).status_code == 200
+    assert available(api) == {"on_hand": 7, "reserved": 0, "available": 7}
+    assert run(db.stock_reservations.find_one({"order_id": order_id}))['status'] == "committed"
+
+
+def test_order_beyond_available_stock_is_rejected_without_holding_anything(api, db, run):
+    run(seed(db))
+    api.post("/api/orders", json=order(8))
+
+    response = api.post("/api/orders", json={
+        "customer_id": "c1", "items": [{"product_id": "p2", "quantity": 1}, {"product_id": "p1", "quantity": 3}]
+    })
+
+    assert response.status_code == 400
+    assert "Available: 2, Required: 3" in response.json()['detail']
+    assert run(db.orders.count_documents({})) == 1
+    assert available(api, "p2")['reserved'] == 0
+
+
+def test_concurrent_orders_never_oversell(api, db, run):
+    run(seed(db))
+
+    responses = run(asyncio.gather(*(api.client.post("/api/orders", json=order(3)) for _ in range(5))))
+
+    assert sorted(r.status_code for r in responses) == [201, 201, 201, 400, 400]
+    assert available(api) == {"on_hand": 10, "reserved": 9, "available": 1}
+
+
+def test_cancel_and_expiry_release_the_hold(api, db, run):
+    run(seed(db))
+    cancelled = api.post("/api/orders", json=order(4)).json()['id']
+    api.post("/api/orders", json=order(5))
+
+    api.put(f"/api/orders/{cancelled}/status", params={"status": "Cancelled"})
+    assert available(api)['reserved'] == 5
+
+    assert run(release_expired_reservations(db, now=datetime.now(timezone.utc) + timedelta(days=8))) == 1
+    assert available(api) == {"on_hand": 10, "reserved": 0, "available": 10}
+
+
+def test_completing_order_after_expiry_takes_available_stock(api, db, run):
+    run(seed(db))
+    order_id = api.post("/api/orders", json=order(3)).json()['id']
+    run(release_expired_reservations(db, now=datetime.now(timezone.utc) + timedelta(days=8)))
+
+    api.put(f"/api/orders/{order_id}/status", params={"status": "COMPLETED"})
+    api.put(f"/api/orders/{order_id}/status", params={"status": "COMPLETED"})
+
+    assert available(api) == {"on_hand": 7, "reserved": 0, "available": 7}
+
+
+def test_both_stores_change_on_completion_only(api, db, run):
+    run(seed(db))
+    order_id = api.post("/api/orders", json=order(3)).json()['id']
+
+    assert run(db.stock.find_one({"product_id": "p1"}))['quantity'] == 10
+    assert run(db.stock_movements.count_documents({})) == 0
+
+    api.put(f"/api/orders/{order_id}/status", params={"status": "COMPLETED"})
+    assert run(db.stock.find_one({"product_id": "p1"}))['quantity'] == 7
+    assert run(db.products.find_one({"id": "p1"}))['stock_quantity'] == 7
+    assert [m['change'] for m in run(db.stock_movements.find({}).to_list(None))] == [-3]
+
+
+def test_hold_lost_to_the_sweeper_during_commit_is_taken_again(api, db, run, monkeypatch):
+    run(seed(db))
+    order_id = api.post("/api/orders", json=order(3)).json()['id']
+    close = stock_reservations._close
+
+    async def close_after_sweep(db, reservation, status):
+        # The sweeper expires the hold between the commit's read and its close
+        monkeypatch.setattr(stock_reservations, "_close", close)
+        await release_expired_reservations(db, now=datetime.now(timezone.utc) + timedelta(days=8))
+        return await close(db, reservation, status)
+
+    monkeypatch.setattr(stock_reservations, "_close", close_after_sweep)
+    run(commit_reservations(db, order_id, [{"product_id": "p1", "quantity": 3}]))
+
+    assert available(api) == {"on_hand": 7, "reserved": 0, "available": 7}
+    statuses = sorted(r['status'] for r in run(db.stock_reservations.find({"order_id": order_id}).to_list(None)))
+    assert statuses == ["committed", "expired"]
+
+
+def test_failed_order_save_releases_the_hold(api, db, run, monkeypatch):
+    run(seed(db))
+
+    def broken(order_doc):
+        raise RuntimeError("order_lines unavailable")
+
+    monkeypatch.setattr(server, "order_line_fields", broken)
+    with pytest.raises(RuntimeError):
+        api.post("/api/orders", json=order(3))
+
+    assert available(api) == {"on_hand": 10, "reserved": 0, "available": 10}
+    assert run(db.orders.count_documents({})) == 0
+
+
+def test_shipped_order_keeps_its_stock_after_the_hold_would_expire(api, db, run):
+    run(seed(db))
+    order_id = api.post("/api/orders", json=order(3)).json()['id']
+
+    shipped = api.put(f"/api/orders/{order_id}/status", params={"status": "Shipped"}).json()
+    assert shipped['stock_reduced'] is True
+    assert run(release_expired_reservations(db, now=datetime.now(timezone.utc) + timedelta(days=8))) == 0
+
+    assert available(api) == {"on_hand": 7, "reserved": 0, "available": 7}
+    assert run(db.stock.find_one({"product_id": "p1"}))['quantity'] == 7
+    # Later steps do not take the stock again
+    delivered = api.put(f"/api/orders/{order_id}/status", params={"status": "Delivered"}).json()
+    assert delivered['stock_reduced'] is False
+    assert available(api)['on_hand'] == 7
+    assert run(db.stock_movements.count_documents({"source_id": order_id})) == 1
@@ -0,0 +1,133 @@
+"""
+Task deadline scheduler: heap order, rescheduling on update, and the lease
+that makes each deadline fire once across workers.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from utils import TaskDeadlineScheduler
+
+
+def due_in(seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+def task(task_id: str, due: str, **fields) -> dict:
+    return {"id": task_id, "title": task_id, "due_date": due, "status": "Planned", **fields}
+
+
+class Notifications:
+    def __init__(self, fail_first: int = 0):
+        self.tasks = []
+        self.fail_first = fail_first
+
+    async def __call__(self, task):
+        if self.fail_first:
+            self.fail_first -= 1
+            raise RuntimeError("mail server down")
+        self.tasks.append(task['id'])
+
+
+async def run_for(scheduler, seconds: float):
+    scheduler.start()
+    await asyncio.sleep(seconds)
+    await scheduler.stop()
+
+
+def test_deadlines_fire_in_due_date_order(db, run):
+    tasks = [task("late", due_in(0.15)), task("first", due_in(0.05)), task("middle", due_in(0.1)),
+             task("done", due_in(0.05), status="Done"), task("past", due_in(-60))]
+    run(db.tasks.insert_many([dict(t) for t in tasks]))
+    notify = Notifications()
+    scheduler = TaskDeadlineScheduler(db, notify)
+
+    run(run_for(scheduler, 0.4))
+
+    assert notify.tasks == ["first", "middle", "late"]
+    assert run(db.tasks.find_one({"id": "first"}))['deadline_notified_for'] == tasks[1]['due_date']
+
+
+def test_updates_reschedule_and_removal_cancels(db, run):
+    async def scenario():
+        moved, cancelled = task("moved", due_in(3600)), task("cancelled", due_in(0.05))
+        await db.tasks.insert_many([dict(moved), dict(cancelled)])
+        notify = Notifications()
+        scheduler = TaskDeadlineScheduler(db, notify)
+        scheduler.start()
+        await asyncio.sleep(0.01)
+
+        # Deadline pulled forward: the sleeping scheduler wakes up for it
+        moved['due_date'] = due_in(0.05)
+        await db.tasks.update_one({"id": "moved"}, {"$set": {"due_date": moved['due_date']}})
+        scheduler.schedule(moved)
+        scheduler.remove("cancelled")
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return notify.tasks
+
+    assert run(scenario()) == ["moved"]
+
+
+def test_lease_lets_one_worker_fire_each_deadline(db, run):
+    due = due_in(3600)
+    run(db.tasks.insert_one(task("t1", due)))
+    notify = Notifications()
+    workers = [TaskDeadlineScheduler(db, notify) for _ in range(3)]
+
+    fired = run(asyncio.gather(*(worker.fire("t1", due) for worker in workers)))
+
+    assert sorted(fired) == [False, False, True]
+    assert notify.tasks == ["t1"]
+    stored = run(db.tasks.find_one({"id": "t1"}))
+    assert stored['deadline_notified_for'] == due
+    assert "deadline_lease_until" not in stored
+    # A moved deadline is a new one
+    assert run(workers[0].fire("t1", due_in(7200))) is False
+
+
+def test_failed_notification_releases_the_lease_and_retries(db, run):
+    due = due_in(3600)
+    run(db.tasks.insert_one(task("t1", due)))
+    notify = Notifications(fail_first=1)
+    scheduler = TaskDeadlineScheduler(db, notify)
+
+    assert run(scheduler.fire("t1", due)) is False
+    assert "deadline_lease_until" not in run(db.tasks.find_one({"id": "t1"}))
+    assert scheduler._scheduled == {"t1": due}
+
+    assert run(TaskDeadlineScheduler(db, notify).fire("t1", due)) is True
+    assert notify.tasks == ["t1"]
+
+
+@pytest.mark.parametrize("lease_until, claimed", [(-1, True), (60, False)])
+def test_lease_of_a_dead_worker_expires(db, run, lease_until, claimed):
+    due = due_in(3600)
+    run(db.tasks.insert_one(task("t1", due, deadline_lease_owner="gone", deadline_lease_until=due_in(lease_until))))
+    notify = Notifications()
+
+    assert run(TaskDeadlineScheduler(db, notify).fire("t1", due)) is claimed
+
+
+def test_unsent_deadline_email_is_retried(db, run, monkeypatch):
+    due = due_in(3600)
+    run(db.tasks.insert_one(task("t1", due)))
+    sent = []
+
+    async def send_email(to_email, subject, body, html_body=None):
+        sent.append(subject)
+        return len(sent) > 1     # first attempt fails, e.g. SMTP down or email disabled
+
+    monkeypatch.setattr(server, "send_email", send_email)
+    scheduler = TaskDeadlineScheduler(db, server.notify_task_deadline)
+
+    assert run(scheduler.fire("t1", due)) is False
+    stored = run(db.tasks.find_one({"id": "t1"}))
+    assert "deadline_notified_for" not in stored and "deadline_lease_until" not in stored
+    assert scheduler._scheduled == {"t1": due}
+
+    assert run(scheduler.fire("t1", due)) is True
+    assert len(sent) == 2
+    assert run(db.tasks.find_one({"id": "t1"}))['deadline_notified_for'] == due
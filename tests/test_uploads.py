@@ -0,0 +1,92 @@
+"""
+Image uploads: parsed while the body arrives, stored by content hash, and
+cut off at the size limit even without a Content-Length.
+"""
+import hashlib
+
+import pytest
+
+import server
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "PRODUCT_UPLOAD_DIR", tmp_path)
+    # Variant rendering runs in the image process pool; not under test here
+    monkeypatch.setattr(server, "run_in_background", lambda coro: coro.close())
+    return tmp_path
+
+
+def multipart(content: bytes, content_type: str = "image/png", field: str = "file"):
+    boundary = "testboundary"
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\nhello\r\n'
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="photo.png"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"content-type": f"multipart/form-data; boundary={boundary}"}
+
+
+def test_upload_is_stored_by_hash_and_deduplicated(api, db, run, upload_dir):
+    first = api.post("/api/upload-image", files={"file": ("photo.png", PNG, "image/png")},
+                     params={"product_id": "p1"}).json()
+    second = api.post("/api/upload-image", files={"file": ("again.png", PNG, "image/png")},
+                      params={"product_id": "p2"}).json()
+
+    digest = hashlib.sha256(PNG).hexdigest()
+    assert first['image_url'] == f"/uploads/products/{digest}.png"
+    assert (upload_dir / f"{digest}.png").read_bytes() == PNG
+    assert (first['deduplicated'], second['deduplicated']) == (False, True)
+    assert [p.name for p in upload_dir.iterdir()] == [f"{digest}.png"]
+    asset = run(db.image_assets.find_one({"hash": digest}, {"_id": 0}))
+    assert (asset['content_type'], asset['size'], asset['product_ids']) == ("image/png", len(PNG), ["p1", "p2"])
+
+
+def test_chunked_upload_is_cut_off_at_the_limit(api, upload_dir, monkeypatch):
+    monkeypatch.setattr(server, "MAX_IMAGE_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(server, "MULTIPART_OVERHEAD_BYTES", 1024)
+    head, headers = multipart(b"")
+    sent = []
+
+    async def body():
+        # No Content-Length: the body is sent with chunked transfer encoding
+        yield head[:-len(b"\r\n--testboundary--\r\n")]
+        for _ in range(1000):
+            sent.append(1)
+            yield b"\x00" * 512
+
+    response = api.post("/api/upload-image", content=body(), headers=headers)
+
+    assert response.status_code == 413
+    assert len(sent) < 10
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_declared_oversized_upload_is_rejected_before_reading(api, upload_dir, monkeypatch):
+    monkeypatch.setattr(server, "MAX_IMAGE_UPLOAD_BYTES", 1024)
+    body, headers = multipart(b"\x00" * 4096)
+
+    response = api.post("/api/upload-image", content=body, headers=headers)
+
+    assert response.status_code == 413
+
+
+def test_invalid_uploads(api, upload_dir):
+    wrong_type = api.post("/api/upload-image", content=multipart(b"%PDF", "application/pdf")[0],
+                          headers=multipart(b"")[1])
+    no_file = api.post("/api/upload-image", content=multipart(PNG, field="image")[0], headers=multipart(b"")[1])
+    truncated_body, headers = multipart(PNG)
+    truncated = api.post("/api/upload-image", content=truncated_body[:-30], headers=headers)
+    not_multipart = api.post("/api/upload-image", json={"file": "x"})
+
+    assert [r.status_code for r in (wrong_type, no_file, truncated, not_multipart)] == [400, 400, 400, 400]
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_upload_schema_documents_the_file_field():
+    schema = server.app.openapi()["paths"]["/api/upload-image"]["post"]["requestBody"]
+    assert schema["content"]["multipart/form-data"]["schema"]["required"] == ["file"]